@@ -1,9 +1,13 @@
-from flask import Flask
+import atexit
+from flask import Flask, request
 from flask_socketio import SocketIO
 from .config import get_config
+from .dispatcher import BroadcastDispatcher
 
 # Inicializar SocketIO antes de la aplicación
 socketio = SocketIO(cors_allowed_origins="*")
+# Los controladores emiten a través del dispatcher, que agrupa los eventos por sala
+dispatcher = BroadcastDispatcher(socketio)
 
 def create_app():
     """Función para crear y configurar la aplicación Flask"""
@@ -15,8 +19,65 @@ def create_app():
     app_config = get_config()
     app.config.from_object(app_config)
     
-    # Inicializar SocketIO con la aplicación
-    socketio.init_app(app)
+    # Registro estructurado en JSON escrito desde un hilo aparte (logging.getLogger(__name__))
+    from app.logs import Logs
+    Logs.init_app(app)
+    
+    # Inicializar SocketIO con la aplicación; con varios workers los eventos se difunden a través
+    # de la cola de mensajes
+    message_queue = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    if message_queue and message_queue.startswith('tcp://'):
+        from app.broker import LocalBrokerManager
+        socketio.init_app(app, client_manager=LocalBrokerManager(message_queue))
+    else:
+        socketio.init_app(app, message_queue=message_queue)
+    dispatcher.init_app(app)
+    
+    # Métricas de Prometheus (/admin/metrics); antes que el resto de hooks para que la duración
+    # de cada petición los incluya
+    from app.metrics import Metrics
+    Metrics.init_app(app, socketio)
+    
+    # Caché de códigos QR ya generados y pool de procesos para exportarlos todos
+    from app.qr_export import QRExport
+    from app.qr_renderer import QRRenderer
+    QRRenderer.configure(app.config.get('QR_CACHE_SIZE', 512))
+    QRExport.configure(app.config.get('QR_EXPORT_WORKERS', 1))
+    
+    # Variantes WebP/AVIF de las imágenes (responsive_image() en las plantillas)
+    from app.image_variants import ImageVariants
+    ImageVariants.init_app(app)
+    
+    # Archivos estáticos con huella de contenido en la URL, caché inmutable y versiones comprimidas
+    from app.static_assets import StaticAssets
+    StaticAssets.init_app(app)
+    
+    # Cargar el estado guardado y escribir los cambios pendientes al terminar el proceso
+    from app.models.game_data import GameData
+    from app.models.storage import create_storage
+    GameData.configure_storage(create_storage(app.config))
+    atexit.register(GameData.close_storage)
+    
+    # Sincronizar el estado con el resto de workers en cada petición (sin efecto con un solo proceso)
+    @app.before_request
+    def begin_game_data():
+        if request.endpoint != 'static':
+            GameData.begin(write=request.method == 'POST')
+    
+    @app.after_request
+    def commit_game_data(response):
+        GameData.commit()
+        return response
+    
+    @app.teardown_request
+    def rollback_game_data(error):
+        GameData.rollback()
+    
+    @app.context_processor
+    def socketio_client_options():
+        # Sin sesiones persistentes entre workers, el cliente debe usar solo websocket
+        options = {"transports": ["websocket"]} if app.config.get('SOCKETIO_WEBSOCKET_ONLY') else {}
+        return {"socketio_client_options": options}
     
     # Registrar blueprints
     from app.controllers.auth_controller import auth_bp
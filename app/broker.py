@@ -0,0 +1,173 @@
+"""Broker local de mensajes para Socket.IO con varios workers.
+
+Sustituye a Redis cuando todos los workers corren en la misma máquina: un servidor TCP mínimo
+reenvía cada mensaje publicado a todos los workers conectados (incluido el emisor, como hace
+un canal pub/sub). Al conectar, cada cliente envía un byte con su papel (P: publica, S: se
+suscribe) y a partir de ahí los mensajes son tramas con un prefijo de 4 bytes con su longitud.
+
+Uso: python -m app.broker [--host 127.0.0.1] [--port 6390]
+También lo arranca el proceso maestro de gunicorn (ver gunicorn.conf.py) cuando
+SOCKETIO_MESSAGE_QUEUE es una URL tcp://.
+"""
+import argparse
+import pickle
+import socket
+import socketserver
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+FRAME_HEADER = struct.Struct('>I')
+ROLE_PUBLISHER = b'P'
+ROLE_SUBSCRIBER = b'S'
+
+
+def parse_url(url):
+    """Devuelve (host, puerto) de una URL tcp://host:puerto"""
+    parsed = urlparse(url)
+    return parsed.hostname or '127.0.0.1', parsed.port or 6390
+
+
+def send_frame(sock, data):
+    sock.sendall(FRAME_HEADER.pack(len(data)) + data)
+
+
+def recv_exactly(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError("Conexión cerrada por el broker")
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def recv_frame(sock):
+    (length,) = FRAME_HEADER.unpack(recv_exactly(sock, FRAME_HEADER.size))
+    return recv_exactly(sock, length)
+
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    """Atiende una conexión: los publicadores envían tramas que se reenvían a los suscriptores"""
+
+    def handle(self):
+        broker = self.server
+        try:
+            role = recv_exactly(self.request, 1)
+            if role == ROLE_SUBSCRIBER:
+                with broker.clients_lock:
+                    broker.clients.add(self.request)
+                # Esperar a que el suscriptor cierre la conexión
+                while self.request.recv(1024):
+                    pass
+            else:
+                while True:
+                    broker.publish(recv_frame(self.request))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with broker.clients_lock:
+                broker.clients.discard(self.request)
+
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    """Servidor de difusión de mensajes entre workers"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=6390):
+        super().__init__((host, port), _BrokerHandler)
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+
+    def publish(self, frame):
+        data = FRAME_HEADER.pack(len(frame)) + frame
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.sendall(data)
+            except OSError:
+                pass
+
+    def start_in_thread(self):
+        """Arranca el broker en un hilo en segundo plano y lo devuelve"""
+        thread = threading.Thread(target=self.serve_forever, name="socketio-broker", daemon=True)
+        thread.start()
+        return thread
+
+
+class LocalBrokerManager(socketio.PubSubManager):
+    """Gestor de clientes de Socket.IO que difunde los eventos a través de LocalBroker.
+
+    Se usa igual que RedisManager: cada emit se publica en el broker y cada worker lo entrega
+    a sus propios clientes al recibirlo.
+    """
+
+    name = 'localbroker'
+
+    def __init__(self, url='tcp://127.0.0.1:6390', channel='socketio', write_only=False,
+                 logger=None):
+        self.host, self.port = parse_url(url)
+        self._publish_socket = None
+        self._publish_lock = threading.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _connect(self, role):
+        sock = socket.create_connection((self.host, self.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(role)
+        return sock
+
+    def _publish(self, data):
+        frame = pickle.dumps(data)
+        with self._publish_lock:
+            # Reintentar una vez con una conexión nueva si el broker se ha reiniciado
+            for attempt in range(2):
+                try:
+                    if self._publish_socket is None:
+                        self._publish_socket = self._connect(ROLE_PUBLISHER)
+                    send_frame(self._publish_socket, frame)
+                    return
+                except OSError:
+                    if self._publish_socket is not None:
+                        self._publish_socket.close()
+                        self._publish_socket = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        retry_sleep = 0.5
+        while True:
+            try:
+                sock = self._connect(ROLE_SUBSCRIBER)
+                retry_sleep = 0.5
+                while True:
+                    yield recv_frame(sock)
+            except (ConnectionError, OSError):
+                self._get_logger().error(
+                    f'No se puede conectar con el broker {self.host}:{self.port}, reintentando en {retry_sleep} s')
+                time.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broker local de mensajes para Socket.IO")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+
+    broker = LocalBroker(args.host, args.port)
+    print(f"Broker escuchando en {args.host}:{args.port}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,51 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_hex(24)
     TEMPLATES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'views/templates')
     
+    # Almacenamiento del estado del juego: 'memory' (por defecto), 'sqlite', 'journal' o 'shared'
+    # (SQLite compartido por varios workers)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'memory')
+    SQLITE_PATH = os.environ.get('SQLITE_PATH') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'game_state.db')
+    # Intervalo de agrupación de escrituras diferidas (milisegundos)
+    STORAGE_FLUSH_INTERVAL_MS = int(os.environ.get('STORAGE_FLUSH_INTERVAL_MS', 5))
+    # Diario de mutaciones: directorio, tamaño máximo de cada segmento (bytes), segmentos antiguos
+    # que se conservan e intervalo máximo entre instantáneas (segundos)
+    JOURNAL_DIR = os.environ.get('JOURNAL_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'journal')
+    JOURNAL_SEGMENT_BYTES = int(os.environ.get('JOURNAL_SEGMENT_BYTES', 1024 * 1024))
+    JOURNAL_RETAINED_SEGMENTS = int(os.environ.get('JOURNAL_RETAINED_SEGMENTS', 3))
+    JOURNAL_SNAPSHOT_INTERVAL = int(os.environ.get('JOURNAL_SNAPSHOT_INTERVAL', 300))
+    
+    # Escalado con varios workers: número de workers de gunicorn, cola de mensajes de Socket.IO
+    # (tcp://host:puerto para el broker local de app.broker, o una URL redis:// / amqp://) y
+    # transporte solo websocket, que no necesita sesiones persistentes (sticky sessions)
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_WEBSOCKET_ONLY = os.environ.get('SOCKETIO_WEBSOCKET_ONLY', str(WEB_CONCURRENCY > 1)).lower() in ('1', 'true')
+    # Intervalo de agrupación de los eventos de Socket.IO salientes (milisegundos; 0 los envía
+    # inmediatamente)
+    SOCKETIO_COALESCE_MS = int(os.environ.get('SOCKETIO_COALESCE_MS', 30))
+    
+    # Número máximo de códigos QR ya codificados que se guardan en memoria
+    QR_CACHE_SIZE = int(os.environ.get('QR_CACHE_SIZE', 512))
+    # Procesos para la exportación masiva de QR (0: en el propio proceso del worker)
+    QR_EXPORT_WORKERS = int(os.environ.get('QR_EXPORT_WORKERS', os.cpu_count() or 1))
+    
+    # Anchos (píxeles) de las variantes WebP/AVIF de las imágenes estáticas (python -m app.image_variants)
+    IMAGE_VARIANT_WIDTHS = [int(width) for width in os.environ.get('IMAGE_VARIANT_WIDTHS', '480,800').split(',')]
+    
+    # Token con el que Prometheus consulta /admin/metrics (Authorization: Bearer <token>) sin
+    # sesión de administrador; sin token solo pueden consultarlas los administradores
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Los bytes de los eventos de Socket.IO se miden en uno de cada N mensajes
+    METRICS_BYTES_SAMPLE_RATE = int(os.environ.get('METRICS_BYTES_SAMPLE_RATE', 100))
+    
+    # Registro: nivel mínimo, muestreo de los eventos frecuentes en DEBUG (uno de cada N) y
+    # registros que pueden esperar a escribirse antes de descartarse
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_SAMPLE_RATE = int(os.environ.get('LOG_SAMPLE_RATE', 100))
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    
 class DevelopmentConfig(Config):
     """Configuración para entorno de desarrollo"""
     DEBUG = True
@@ -1,11 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, session, flash, request, jsonify, send_file
+from flask import Blueprint, render_template, redirect, url_for, session, flash, request, jsonify, send_file, Response
 from app.models.auth import Auth
 from app.models.game_data import GameData
-from app import socketio
-import qrcode
+from app import dispatcher, socketio
+from app.metrics import Metrics
+from app.presence import Presence
+from app.profiler import SamplingProfiler
+from app.qr_export import QRExport
+from app.qr_renderer import QRRenderer
+import hashlib
 import io
-import base64
-from PIL import Image, ImageDraw, ImageFont
+import os
 
 # Crear blueprint para rutas de administración
 admin_bp = Blueprint('admin', __name__)
@@ -18,9 +22,13 @@ def panel():
         flash('No tienes permiso para acceder al panel de administración.', 'error')
         return redirect(url_for('auth.index'))
     
+    # Descartar las conexiones cuyo disconnect se haya perdido antes de mostrar las mesas conectadas
+    Presence.reap(lambda sid: socketio.server.manager.is_connected(sid, '/'))
+    
     return render_template('admin_panel.html', 
                           rooms=Auth.get_all_rooms(), 
-                          mesa_access_codes=Auth.get_all_mesa_codes())
+                          mesa_access_codes=Auth.get_all_mesa_codes(),
+                          presence=Presence.snapshot())
 
 @admin_bp.route('/add_room', methods=['POST'])
 def add_room():
@@ -32,9 +40,10 @@ def add_room():
     
     # Añadir nueva sala
     new_room = Auth.add_room()
+    GameData.save_auth_state()
     
     # Emitir evento de actualización de salas a todos los administradores
-    socketio.emit('room_update', {
+    dispatcher.emit('room_update', {
         'rooms': Auth.get_all_rooms()
     }, room='admin_room')
     
@@ -49,11 +58,12 @@ def reset_server():
         flash('No tienes permiso para realizar esta acción.', 'error')
         return redirect(url_for('auth.index'))
     
-    # Resetear todos los datos del juego
-    GameData.reset_all_data()
+    # Resetear todos los datos del juego (sin mutaciones concurrentes a medias)
+    with GameData.global_lock():
+        GameData.reset_all_data()
     
     # Emitir evento de actualización global
-    socketio.emit('server_reset', {
+    dispatcher.emit('server_reset', {
         'message': 'El servidor ha sido reiniciado completamente'
     })
     
@@ -75,32 +85,32 @@ def reset_perdicion_cycle():
     if not ('is_admin' in session and session['is_admin']):
         return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
     
-    # Reiniciar el ciclo y el contador global
-    global_counters = GameData.initialize_global_counters()
-    global_counters["perdicion_cycle"] = 1
-    global_counters["perdicion"] = 0
-    
-    # Reiniciar el contador de perdición en todas las salas
-    for key in GameData._game_data:
-        if key.startswith('room_'):
-            room_id = int(key.split('_')[1])
-            # Obtener los datos de columna de la sala
-            column_totals = GameData.initialize_room_column_totals(room_id)
-            
-            # Reiniciar el contador de perdición en todas las eras
-            for era in ["pasado", "presente", "futuro"]:
-                column_totals[era]["perdicion"] = 0
-                
-                # Emitir evento para actualizar la interfaz en todos los clientes de esta sala y era
-                socketio.emit('column_resource_update', {
-                    'room_id': room_id,
-                    'era': era,
-                    'columnTotals': column_totals[era],
-                    'perdicionCycle': global_counters["perdicion_cycle"]
-                }, room=f"room_{room_id}")
+    # Las actualizaciones de perdición toman el lock global, así que ninguna queda a medias
+    with GameData.global_lock():
+        # Reiniciar el ciclo y el contador global
+        global_counters = GameData.initialize_global_counters()
+        global_counters["perdicion_cycle"] = 1
+        global_counters["perdicion"] = 0
+        GameData.save_global_counters(global_counters)
+        
+        # Reiniciar el contador de perdición en todas las salas
+        GameData.reset_perdicion_all_rooms()
+        room_totals = [(room_data.room_id, {era: room_data.column_totals(era) for era in ["pasado", "presente", "futuro"]})
+                       for room_data in GameData.all_rooms()]
+        global_counters = dict(global_counters)
+    
+    for room_id, era_totals in room_totals:
+        for era, column_totals in era_totals.items():
+            # Emitir evento para actualizar la interfaz en todos los clientes de esta sala y era
+            dispatcher.emit('column_resource_update', {
+                'room_id': room_id,
+                'era': era,
+                'columnTotals': column_totals,
+                'perdicionCycle': global_counters["perdicion_cycle"]
+            }, room=f"room_{room_id}")
     
     # Emitir evento global a todos los clientes conectados
-    socketio.emit('global_counter_update', {
+    dispatcher.emit('global_counter_update', {
         'globalTotals': global_counters,
         'enablePerdicionControls': True
     })
@@ -112,9 +122,89 @@ def reset_perdicion_cycle():
         "enablePerdicionControls": True
     })
 
+@admin_bp.route('/dispatcher_stats', methods=['GET'])
+def dispatcher_stats():
+    """Devuelve cuántos eventos de Socket.IO se han agrupado o descartado antes de enviarse"""
+    # Verificar que sea un admin
+    if not ('is_admin' in session and session['is_admin']):
+        return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
+    
+    return jsonify({
+        "success": True,
+        "stats": dispatcher.stats()
+    })
+
+@admin_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas del proceso en el formato de texto de Prometheus"""
+    # Verificar que sea un admin o Prometheus con el token configurado
+    if not ('is_admin' in session and session['is_admin']) and not Metrics.token_matches(request.headers.get('Authorization')):
+        return Response("No autorizado\n", status=403, mimetype='text/plain')
+    
+    return Response(Metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@admin_bp.route('/profile', methods=['POST'])
+def start_profile():
+    """Empieza a perfilar el worker por muestreo durante unos segundos (?seconds=10&interval_ms=5)
+    y responde sin esperar; el resultado se pide con GET /admin/profile al mismo worker (pid)"""
+    # Verificar que sea un admin
+    if not ('is_admin' in session and session['is_admin']):
+        return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
+    
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval_ms', 5)) / 1000.0
+    except ValueError:
+        return jsonify({"success": False, "error": "Parámetros no válidos"})
+    
+    profiler = SamplingProfiler.start(socketio, seconds, interval)
+    if profiler is None:
+        return jsonify({"success": False, "error": "Ya hay una medición en curso"})
+    
+    return jsonify({"success": True, "pid": os.getpid(), "seconds": profiler.seconds})
+
+@admin_bp.route('/profile', methods=['GET'])
+def profile():
+    """Resultado de la última medición del worker (?top=20): las pilas colapsadas y las funciones
+    con más tiempo propio, o solo las pilas en texto para un flamegraph con ?format=collapsed
+    (&idle=1 incluye las muestras sin petición). Mientras sigue en curso devuelve finished: false"""
+    # Verificar que sea un admin
+    if not ('is_admin' in session and session['is_admin']):
+        return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
+    
+    try:
+        limit = int(request.args.get('top', 20))
+    except ValueError:
+        return jsonify({"success": False, "error": "Parámetros no válidos"})
+    include_idle = request.args.get('idle') == '1'
+    
+    profiler = SamplingProfiler.last()
+    if profiler is None:
+        return jsonify({"success": False, "error": "No hay ninguna medición en este worker"})
+    if not profiler.finished:
+        return jsonify({"success": True, "pid": os.getpid(), "finished": False})
+    
+    collapsed = profiler.collapsed(include_idle)
+    if request.args.get('format') == 'collapsed':
+        response = Response(collapsed, mimetype='text/plain')
+        response.headers['Content-Disposition'] = f'attachment; filename=profile_{os.getpid()}.txt'
+        return response
+    
+    return jsonify({
+        "success": True,
+        "pid": os.getpid(),
+        "finished": True,
+        "samples": profiler.samples,
+        "idle_samples": profiler.idle_samples,
+        "sampling_ms": round(profiler.sampling_time * 1000, 1),
+        "handlers": dict(profiler.handlers.most_common()),
+        "top": profiler.top(limit),
+        "collapsed": collapsed
+    })
+
 @admin_bp.route('/generate_qr/<mesa_code>', methods=['GET'])
 def generate_qr(mesa_code):
-    """Genera un código QR para una mesa específica"""
+    """Genera un código QR para una mesa específica (PNG, o SVG con ?format=svg)"""
     # Verificar que sea un admin
     if not ('is_admin' in session and session['is_admin']):
         flash('No tienes permiso para realizar esta acción.', 'error')
@@ -132,74 +222,53 @@ def generate_qr(mesa_code):
     if site_url.endswith('/'):
         site_url = site_url[:-1]
     
-    # Texto que se convertirá en código QR
-    qr_data = f"{site_url}?code={mesa_code}"
-    
-    # Crear el objeto QR
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    
-    # Agregar los datos al QR
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    
-    # Crear la imagen QR y asegurarse de que esté en el formato correcto
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-    qr_img = qr_img.convert('RGB')  # Asegurarse de que esté en modo RGB
-    
     # Obtener información de la mesa
     mesa_info = mesa_access_codes[mesa_code]
-    group_id = mesa_info["group"]
-    era = mesa_info["era"]
-    
-    # Crear una imagen más grande con espacio para texto
-    img_width, img_height = qr_img.size
-    new_img = Image.new('RGB', (img_width, img_height + 60), color='white')
     
-    # Pegar el código QR en la nueva imagen
-    new_img.paste(qr_img, (0, 0))
-    
-    # Agregar texto debajo del código QR
-    draw = ImageDraw.Draw(new_img)
-    
-    # Intentar usar una fuente predeterminada, o usar el texto simple si no está disponible
-    try:
-        # En sistemas Linux
-        font = ImageFont.truetype("DejaVuSans.ttf", 18)
-    except IOError:
-        try:
-            # En sistemas Windows
-            font = ImageFont.truetype("arial.ttf", 18)
-        except IOError:
-            # Si no hay fuentes disponibles, usar fuente predeterminada
-            font = ImageFont.load_default()
-    
-    # Texto para mostrar (código de mesa, grupo y era)
-    mesa_name = "Mesa " + mesa_code[4:].zfill(2).upper()
-    group_name = f"Grupo {group_id}"
-    era_name = era.capitalize()
-    
-    # Dibujar el texto
-    draw.text((10, img_height + 5), mesa_name, font=font, fill='black')
-    draw.text((10, img_height + 25), f"{group_name} - {era_name}", font=font, fill='black')
-    
-    # Guardar la imagen en un buffer de bytes
-    img_byte_array = io.BytesIO()
-    new_img.save(img_byte_array, format='PNG')
-    img_byte_array.seek(0)
+    # Imagen del QR (cacheada tras la primera vez)
+    if request.args.get('format') == 'svg':
+        image = QRRenderer.svg(site_url, mesa_code, mesa_info["group"], mesa_info["era"])
+        mimetype, extension = 'image/svg+xml', 'svg'
+    else:
+        image = QRRenderer.png(site_url, mesa_code, mesa_info["group"], mesa_info["era"])
+        mimetype, extension = 'image/png', 'png'
     
     # Enviar la imagen como respuesta
     return send_file(
-        img_byte_array,
-        mimetype='image/png',
+        io.BytesIO(image),
+        mimetype=mimetype,
         as_attachment=True,
-        download_name=f'qr_{mesa_code}.png'
+        download_name=f'qr_{mesa_code}.{extension}'
     )
 
+@admin_bp.route('/qr/<mesa_code>.svg', methods=['GET'])
+def qr_svg(mesa_code):
+    """SVG del código QR de una mesa para mostrarlo en la hoja de impresión"""
+    # Verificar que sea un admin
+    if not ('is_admin' in session and session['is_admin']):
+        return Response(status=403)
+    
+    mesa_access_codes = Auth.get_all_mesa_codes()
+    if mesa_code not in mesa_access_codes:
+        return Response(status=404)
+    
+    # URL del sitio
+    site_url = request.url_root
+    # URL completa para el código QR (eliminar la barra al final si existe)
+    if site_url.endswith('/'):
+        site_url = site_url[:-1]
+    
+    mesa_info = mesa_access_codes[mesa_code]
+    svg = QRRenderer.svg(site_url, mesa_code, mesa_info["group"], mesa_info["era"])
+    
+    # El navegador revalida con el ETag (304 si no ha cambiado): si la mesa pasa a otro grupo
+    # o era, cambia la imagen
+    response = send_file(io.BytesIO(svg), mimetype='image/svg+xml',
+                         etag=hashlib.sha1(svg).hexdigest(), max_age=0)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
 @admin_bp.route('/print_all_qr', methods=['GET'])
 def print_all_qr():
     """Genera todos los códigos QR en una sola página para imprimir"""
@@ -218,71 +287,14 @@ def print_all_qr():
     mesa_qr_data = {}
     mesa_access_codes = Auth.get_all_mesa_codes()
     
-    for mesa_code in mesa_access_codes:
-        # Texto que se convertirá en código QR
-        qr_data = f"{site_url}?code={mesa_code}"
-        
-        # Crear el objeto QR
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        
-        # Agregar los datos al QR
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        # Crear la imagen QR y asegurarse de que esté en el formato correcto
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_img = qr_img.convert('RGB')  # Asegurarse de que esté en modo RGB
-        
-        # Obtener información de la mesa
-        mesa_info = mesa_access_codes[mesa_code]
+    for mesa_code, mesa_info in mesa_access_codes.items():
         group_id = mesa_info["group"]
         era = mesa_info["era"]
+        mesa_name, group_name, era_name = QRRenderer.labels(mesa_code, group_id, era)
         
-        # Crear una imagen más grande con espacio para texto
-        img_width, img_height = qr_img.size
-        new_img = Image.new('RGB', (img_width, img_height + 60), color='white')
-        
-        # Pegar el código QR en la nueva imagen
-        new_img.paste(qr_img, (0, 0))
-        
-        # Agregar texto debajo del código QR
-        draw = ImageDraw.Draw(new_img)
-        
-        # Intentar usar una fuente predeterminada
-        try:
-            # En sistemas Linux
-            font = ImageFont.truetype("DejaVuSans.ttf", 18)
-        except IOError:
-            try:
-                # En sistemas Windows
-                font = ImageFont.truetype("arial.ttf", 18)
-            except IOError:
-                # Si no hay fuentes disponibles, usar fuente predeterminada
-                font = ImageFont.load_default()
-        
-        # Texto para mostrar (código de mesa, grupo y era)
-        mesa_name = "Mesa " + mesa_code[4:].zfill(2).upper()
-        group_name = f"Grupo {group_id}"
-        era_name = era.capitalize()
-        
-        # Dibujar el texto
-        draw.text((10, img_height + 5), mesa_name, font=font, fill='black')
-        draw.text((10, img_height + 25), f"{group_name} - {era_name}", font=font, fill='black')
-        
-        # Convertir la imagen a base64 para mostrarla en HTML
-        img_byte_array = io.BytesIO()
-        new_img.save(img_byte_array, format='PNG')
-        img_byte_array.seek(0)
-        img_base64 = base64.b64encode(img_byte_array.getvalue()).decode('utf-8')
-        
-        # Guardar los datos del QR
+        # Guardar los datos del QR (la hoja carga cada imagen SVG por su URL)
         mesa_qr_data[mesa_code] = {
-            'img_base64': img_base64,
+            'img_url': url_for('admin.qr_svg', mesa_code=mesa_code),
             'mesa_name': mesa_name,
             'group_name': group_name,
             'era_name': era_name
@@ -290,3 +302,37 @@ def print_all_qr():
     
     # Renderizar la página con todos los códigos QR
     return render_template('print_qr.html', mesa_qr_data=mesa_qr_data)
+
+@admin_bp.route('/export_qr/<fmt>', methods=['GET'])
+def export_qr(fmt):
+    """Descarga los códigos QR de todas las mesas como ZIP de PNG o como PDF para imprimir"""
+    # Verificar que sea un admin
+    if not ('is_admin' in session and session['is_admin']):
+        flash('No tienes permiso para realizar esta acción.', 'error')
+        return redirect(url_for('auth.index'))
+    
+    if fmt not in ('zip', 'pdf'):
+        flash('Formato de exportación inválido.', 'error')
+        return redirect(url_for('admin.panel'))
+    
+    # URL del sitio
+    site_url = request.url_root
+    # URL completa para el código QR (eliminar la barra al final si existe)
+    if site_url.endswith('/'):
+        site_url = site_url[:-1]
+    
+    # Copia de los códigos: la respuesta se genera después de terminar la petición
+    mesa_access_codes = dict(Auth.get_all_mesa_codes())
+    
+    # Las tarjetas se generan en paralelo y se envían a medida que están listas
+    if fmt == 'zip':
+        content = QRExport.stream_zip(site_url, mesa_access_codes)
+        mimetype = 'application/zip'
+    else:
+        per_page = min(max(request.args.get('per_page', 6, type=int), 1), 12)
+        content = QRExport.stream_pdf(site_url, mesa_access_codes, per_page)
+        mimetype = 'application/pdf'
+    
+    return Response(content, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=qr_mesas.{fmt}'
+    })
@@ -1,61 +1,48 @@
-from flask import Blueprint, render_template, redirect, url_for, session, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, session, flash, request, jsonify, current_app, Response, g
 from app.models.auth import Auth
 from app.models.game_data import GameData
-from app import socketio
+from app.models.room_state import ERA_INDEX, fits_counter
+from app import socketio, dispatcher
+from app.logs import Logs
+from app.presence import Presence
 from flask_socketio import emit, join_room, leave_room
-import traceback
+import functools
+import logging
 
 # Crear blueprint para rutas de sala y eras
 room_bp = Blueprint('game', __name__)
+logger = logging.getLogger(__name__)
 
-# Nueva función para verificar si se cumplen las tres condiciones en todas las mesas
+# Respuestas ya serializadas de los endpoints de consulta: {clave: (etag, cuerpo JSON)}
+_json_responses = {}
+
+# Función para verificar si se cumplen las tres condiciones en todas las mesas
 def check_victory_conditions():
     """Verifica si todas las mesas cumplen las tres condiciones de victoria"""
-    try:
-        # Obtener todas las salas con datos
-        room_ids = []
-        for key in GameData._game_data.keys():
-            if key.startswith("room_"):
-                room_id = int(key.split("_")[1])
-                room_ids.append(room_id)
-        
-        if not room_ids:
-            return False  # No hay salas para verificar
-        
-        # Verificar condiciones para cada sala
-        for room_id in room_ids:
-            room_data = GameData.initialize_room_data(room_id)
-            column_totals = GameData.initialize_room_column_totals(room_id)
-            
-            # 1. Verificar si Biff ha sido derrotado en todas las eras
-            for era in ["pasado", "presente", "futuro"]:
-                if not room_data["biff_disabled"].get(era, False):
-                    return False  # Biff no ha sido derrotado en todas las eras
-            
-            # 2. Verificar si todas las eras tienen fluzo = 81
-            for era in ["pasado", "presente", "futuro"]:
-                if "fluzo" not in column_totals[era] or column_totals[era]["fluzo"] != 81:
-                    return False  # No todas las eras tienen fluzo = 81
-            
-            # 3. Verificar si "Un noble legado" está marcado en todas las eras
-            # Identificar qué índice corresponde al anuncio de "Un noble legado" en cada era
-            noble_legado_indices = {
-                "pasado": 5,  # índice 5 en la era pasado (sin cambios)
-                "presente": 5,  # índice 5 en la era presente (antes era 4, ahora 5)
-                "futuro": 4    # índice 4 en la era futuro (antes era 3, ahora 4)
-            }
-            
-            for era, idx in noble_legado_indices.items():
-                if not room_data["progress"][era][idx]:
-                    return False  # "Un noble legado" no está marcado en todas las eras
-        
-        # Si llegamos aquí, todas las condiciones se cumplen en todas las salas
-        return True
-    
-    except Exception as e:
-        print(f"Error al verificar condiciones de victoria: {str(e)}")
-        traceback.print_exc()
-        return False
+    # GameData mantiene un índice incremental, por lo que la comprobación es una lectura en O(1)
+    return GameData.victory_conditions_met()
+
+# Función para emitir el evento de victoria solo cuando cambia el resultado
+def announce_victory_conditions():
+    """Verifica las condiciones de victoria y emite victory_conditions_met si acaban de cumplirse"""
+    victory_conditions_met = check_victory_conditions()
+    # Dentro de /batch el aviso se da una sola vez, al terminar todas las operaciones
+    if g.get('batch_in_progress'):
+        return victory_conditions_met
+    if GameData.mark_victory_announced(victory_conditions_met):
+        dispatcher.emit('victory_conditions_met', {
+            'message': "->R1"
+        })
+    return victory_conditions_met
+
+# Cantidad de una petición JSON (0 si no se indica)
+def amount_value(data):
+    """Devuelve la cantidad si es un entero y None si no: los decimales no se truncan y true/false
+    no cuentan como 1/0"""
+    amount = data.get('amount', 0)
+    if isinstance(amount, int) and not isinstance(amount, bool):
+        return amount
+    return None
 
 @room_bp.route('/room/<int:room_id>')
 def room(room_id):
@@ -103,22 +90,10 @@ def era(room_id, era):
     
     # Inicializar o cargar datos de la sala
     room_data = GameData.initialize_room_data(room_id)
-    progress = room_data["progress"]
-    resources = room_data["resources"]
-    biff_defeats = room_data["biff_defeats"]
-    biff_disabled = room_data["biff_disabled"]  # Añadir campo de desactivación de Biff
+    progress = room_data.progress_dict()
     
     # Verificar cuáles botones están disponibles según las dependencias
-    available_buttons = []
-    for i in range(len(GameData.button_info[era])):
-        is_available = True
-        for dep in GameData.button_dependencies[era][i]:
-            dep_era, dep_idx = dep.split('-')
-            dep_idx = int(dep_idx)
-            if not progress[dep_era][dep_idx]:
-                is_available = False
-                break
-        available_buttons.append(is_available)
+    available_buttons = get_available_buttons(room_data.progress)[era]
     
     # Obtener el nombre de la mesa si aplica
     mesa_name = ""
@@ -131,9 +106,6 @@ def era(room_id, era):
     global_counters = GameData.initialize_global_counters()
     perdicion_cycle = global_counters["perdicion_cycle"]
     
-    # Inicializar columnas de la sala
-    column_totals = GameData.initialize_room_column_totals(room_id)
-    
     # Verificar condiciones de victoria para R1
     victory_conditions_met = check_victory_conditions()
     
@@ -144,13 +116,14 @@ def era(room_id, era):
                           progress=progress,
                           button_info=GameData.button_info[era],
                           available_buttons=available_buttons,
-                          resources=resources,
-                          biff_defeats=biff_defeats[era],
-                          biff_disabled=biff_disabled[era],
+                          resources=room_data.resources_dict(),
+                          biff_defeats=room_data.biff_defeats[ERA_INDEX[era]],
+                          biff_disabled=room_data.is_biff_disabled(era),
                           mesa_name=mesa_name,
                           perdicion_cycle=perdicion_cycle,
-                          column_totals=column_totals[era],
+                          column_totals=room_data.column_totals(era),
                           victory_conditions_met=victory_conditions_met,
+                          era_state=era_state(room_data, era, global_counters, victory_conditions_met),
                           is_admin='is_admin' in session and session['is_admin'])
 @room_bp.route('/toggle_button/<int:room_id>/<era>/<int:button_idx>', methods=['POST'])
 def toggle_button(room_id, era, button_idx):
@@ -167,98 +140,39 @@ def toggle_button(room_id, era, button_idx):
             return redirect(url_for('auth.index'))
     
     try:
-        # Inicializar o cargar datos de la sala
-        room_data = GameData.initialize_room_data(room_id)
-        
-        # Determinar si estamos activando o desactivando el botón
-        is_activating = not room_data["progress"][era][button_idx]
-        
-        # Si es admin, permitir activar cualquier botón sin restricciones
-        if 'is_admin' in session and session['is_admin']:
-            # Si estamos desactivando, desactivar también los dependientes
-            if not is_activating:
-                # Primero, cambiamos el estado del botón principal
-                room_data["progress"][era][button_idx] = False
-                
-                # Luego desactivamos todos los que dependen de este
-                deactivate_dependent_buttons(room_data["progress"], f"{era}-{button_idx}")
-            else:
-                # Si estamos activando, simplemente activamos este botón
-                room_data["progress"][era][button_idx] = True
-                
-                # NUEVO: Si es el botón de "Se ha plantado la semilla de un árbol" en pasado (índice 4)
-                if era == "pasado" and button_idx == 4:
-                    # Activar automáticamente los botones correspondientes en presente y futuro
-                    room_data["progress"]["presente"][4] = True  # Semilla en Presente
-                    room_data["progress"]["futuro"][3] = True    # Semilla en Futuro
-        else:
-            # Verificar si se cumplen las dependencias para activar
-            if is_activating:
-                can_toggle = True
-                for dep in GameData.button_dependencies[era][button_idx]:
-                    dep_era, dep_idx = dep.split('-')
-                    dep_idx = int(dep_idx)
-                    if not room_data["progress"][dep_era][dep_idx]:
-                        can_toggle = False
-                        break
-                
-                if can_toggle:
-                    # Cambiar el estado del botón (activar)
-                    room_data["progress"][era][button_idx] = True
-                    
-                    # NUEVO: Si es el botón de "Se ha plantado la semilla de un árbol" en pasado (índice 4)
-                    if era == "pasado" and button_idx == 4:
-                        # Activar automáticamente los botones correspondientes en presente y futuro
-                        room_data["progress"]["presente"][4] = True  # Semilla en Presente
-                        room_data["progress"]["futuro"][3] = True    # Semilla en Futuro
-            else:
-                # Si está desactivando, verificar y desactivar dependientes
-                room_data["progress"][era][button_idx] = False
-                deactivate_dependent_buttons(room_data["progress"], f"{era}-{button_idx}")
-                
-                # NUEVO: Si es el botón de "Se ha plantado la semilla de un árbol" en pasado (índice 4)
-                if era == "pasado" and button_idx == 4:
-                    # Desactivar automáticamente los botones correspondientes en presente y futuro
-                    room_data["progress"]["presente"][4] = False  # Semilla en Presente
-                    room_data["progress"]["futuro"][3] = False    # Semilla en Futuro
-        
-        # Verificar todos los botones en todas las eras para determinar las dependencias correctamente
-        all_available_buttons = get_available_buttons(room_data["progress"])
+        # Activar o desactivar el botón. Los admins pueden activar cualquier botón sin restricciones;
+        # el resto solo si se cumplen las dependencias. Al activar se activan también los enlaces
+        # (p. ej. la semilla en Pasado activa la de Presente y Futuro) y al desactivar se desactivan
+        # todos los botones que dependen de este
+        with GameData.room_lock(room_id):
+            room_data = GameData.initialize_room_data(room_id)
+            previous_progress = room_data.progress
+            is_activating = GameData.toggle_button(room_id, era, button_idx,
+                                                   force='is_admin' in session and session['is_admin'])
+            
+            # Solo se envían los bits que cambian (incluidas las dependencias) respecto al progreso anterior
+            button_update = button_delta(room_id, previous_progress, room_data.progress)
         
         # Verificar si se han cumplido las condiciones de victoria después del cambio
-        victory_conditions_met = check_victory_conditions()
+        victory_conditions_met = announce_victory_conditions()
         
         # Emitir evento de actualización a todos los clientes en la sala
-        socketio.emit('button_update', {
-            'room_id': room_id,
-            'era': era,
-            'progress': room_data["progress"],
-            'available_buttons': all_available_buttons,
-            'button_idx': button_idx,  # Enviar qué botón específico se ha cambiado
-            'is_activating': is_activating  # Indicar si se está activando o desactivando
-        }, room=f"room_{room_id}")
-        
-        # Si se cumplen las condiciones de victoria, emitir evento especial
-        if victory_conditions_met:
-            socketio.emit('victory_conditions_met', {
-                'message': "->R1"
-            })
+        dispatcher.emit('button_update', button_update, room=f"room_{room_id}")
         
         # Determinar si la solicitud fue AJAX o normal
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({
                 'success': True,
                 'message': 'Botón actualizado correctamente',
-                'progress': room_data["progress"],
-                'available_buttons': all_available_buttons,
+                'is_activating': is_activating,
+                **button_update,
                 'victory_conditions_met': victory_conditions_met
             })
         else:
             return redirect(url_for('game.era', room_id=room_id, era=era))
     except Exception as e:
         error_msg = f"Error al actualizar botón: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({
@@ -284,92 +198,85 @@ def update_resources(room_id, era):
         if data is None:
             return jsonify({"success": False, "error": "Datos no proporcionados o formato incorrecto"})
             
-        resource_amount = data.get('amount', 0)
-        
-        # Inicializar o cargar datos de la sala
-        room_data = GameData.initialize_room_data(room_id)
+        resource_amount = amount_value(data)
+        if resource_amount is None:
+            return jsonify({"success": False, "error": "Cantidad inválida"})
         
         # Actualizar los recursos
-        room_data["resources"][era] += resource_amount
-        room_data["resources"]["total"] += resource_amount
+        with GameData.room_lock(room_id):
+            # Los recursos son enteros de 32 bits: rechazar la cantidad antes de modificar nada
+            current = GameData.initialize_room_data(room_id).resources_dict()
+            if not fits_counter(current[era] + resource_amount, current["total"] + resource_amount):
+                return jsonify({"success": False, "error": "Cantidad fuera de rango"})
+            resources = GameData.add_resources(room_id, era, resource_amount)
         
         # Emitir evento de actualización de recursos a todos los clientes en la sala
-        socketio.emit('resource_update', {
+        dispatcher.emit('resource_update', {
             'room_id': room_id,
-            'resources': room_data["resources"]
+            'resources': resources
         }, room=f"room_{room_id}")
         
         return jsonify({
             "success": True,
-            "resources": room_data["resources"]
+            "resources": resources
         })
     except Exception as e:
         error_msg = f"Error al actualizar recursos: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
         return jsonify({"success": False, "error": error_msg})
 
 # Función interna para ajustar todos los valores de fluzo
 def adjust_all_fluzo_values_internal():
-    """Ajusta los valores de fluzo en todas las salas según las reglas especificadas (función interna)"""
+    """Ajusta los valores de fluzo en todas las salas según las reglas especificadas (función interna).
+    
+    Toma el lock global y el de cada sala; no emite eventos: devuelve la lista de eventos
+    fluzo_update pendientes (ver emit_fluzo_updates), o None si se ha producido un error.
+    """
     try:
-        # Obtener todas las salas con datos
-        room_ids = []
-        for key in GameData._game_data.keys():
-            if key.startswith("room_"):
-                room_id = int(key.split("_")[1])
-                room_ids.append(room_id)
-        
-        # Para cada sala, ajustar los valores de fluzo en todas las eras
-        for room_id in room_ids:
-            for era in ["pasado", "presente", "futuro"]:
-                # Obtener los datos de la sala
-                column_totals = GameData.initialize_room_column_totals(room_id)
-                
-                # Asegurarse de que fluzo existe en los datos
-                if "fluzo" not in column_totals[era]:
-                    column_totals[era]["fluzo"] = 0
-                
-                # Obtener el valor actual
-                current_fluzo = column_totals[era]["fluzo"]
-                new_fluzo = current_fluzo
-                
-                # Aplicar las reglas de ajuste:
-                if current_fluzo > 86:
-                    new_fluzo = current_fluzo - 10
-                elif current_fluzo < 76:
-                    new_fluzo = current_fluzo + 10
-                elif current_fluzo >= 80 and current_fluzo <= 82:
-                    new_fluzo = current_fluzo - 5
-                
-                # Solo actualizar si el valor ha cambiado
-                if new_fluzo != current_fluzo:
-                    # Actualizar el valor en la sala
-                    column_totals[era]["fluzo"] = new_fluzo
-                    
-                    # Guardar los cambios
-                    GameData.save_column_totals(room_id, column_totals)
-                    
-                    # Emitir evento de actualización
-                    socketio.emit('fluzo_update', {
-                        'room_id': room_id,
-                        'era': era,
-                        'fluzoTotal': new_fluzo,
-                        'fluzoValue': 0,  # La caja siempre muestra 0
-                    }, room=f"room_{room_id}")
-        
-        # Verificar si se cumplen las condiciones de victoria después de ajustar
-        victory_conditions_met = check_victory_conditions()
-        if victory_conditions_met:
-            socketio.emit('victory_conditions_met', {
-                'message': "->R1"
-            })
-            
-        return True
+        fluzo_updates = []
+        with GameData.global_lock():
+            # Para cada sala, ajustar los valores de fluzo en todas las eras
+            for room_data in GameData.all_rooms():
+                room_id = room_data.room_id
+                with GameData.room_lock(room_id):
+                    for era in ["pasado", "presente", "futuro"]:
+                        # Obtener el valor actual (0 si aún no se ha fijado)
+                        current_fluzo = room_data.get_counter(era, "fluzo")
+                        new_fluzo = current_fluzo
+                        
+                        # Aplicar las reglas de ajuste:
+                        if current_fluzo > 86:
+                            new_fluzo = current_fluzo - 10
+                        elif current_fluzo < 76:
+                            new_fluzo = current_fluzo + 10
+                        elif current_fluzo >= 80 and current_fluzo <= 82:
+                            new_fluzo = current_fluzo - 5
+                        
+                        # Guardar el valor (también fija el fluzo en las eras donde aún no existía)
+                        GameData.set_column_value(room_id, era, "fluzo", new_fluzo)
+                        
+                        # Solo notificar si el valor ha cambiado
+                        if new_fluzo != current_fluzo:
+                            fluzo_updates.append({
+                                'room_id': room_id,
+                                'era': era,
+                                'fluzoTotal': new_fluzo,
+                                'fluzoValue': 0,  # La caja siempre muestra 0
+                            })
+        
+        return fluzo_updates
     except Exception as e:
-        print(f"Error al ajustar valores de fluzo internamente: {str(e)}")
-        traceback.print_exc()
-        return False
+        logger.exception(f"Error al ajustar valores de fluzo internamente: {str(e)}")
+        return None
+
+# Función auxiliar para emitir los eventos generados por adjust_all_fluzo_values_internal
+def emit_fluzo_updates(fluzo_updates):
+    """Emite los eventos fluzo_update del ajuste de fluzo y comprueba las condiciones de victoria"""
+    for fluzo_update in fluzo_updates:
+        dispatcher.emit('fluzo_update', fluzo_update, room=f"room_{fluzo_update['room_id']}")
+    
+    # Verificar si se cumplen las condiciones de victoria después de ajustar
+    announce_victory_conditions()
 @room_bp.route('/adjust_all_fluzo_values', methods=['POST'])
 def adjust_all_fluzo_values():
     """Ajusta los valores de fluzo en todas las salas según las reglas especificadas"""
@@ -378,9 +285,11 @@ def adjust_all_fluzo_values():
         return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
     
     try:
-        success = adjust_all_fluzo_values_internal()
+        fluzo_updates = adjust_all_fluzo_values_internal()
         
-        if success:
+        if fluzo_updates is not None:
+            emit_fluzo_updates(fluzo_updates)
+            
             # Verificar si se cumplen las condiciones de victoria después del ajuste
             victory_conditions_met = check_victory_conditions()
             
@@ -396,115 +305,111 @@ def adjust_all_fluzo_values():
             })
     except Exception as e:
         error_msg = f"Error al ajustar valores de fluzo: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
         return jsonify({"success": False, "error": error_msg})
 
 @room_bp.route('/biff_defeat/<int:room_id>/<era>', methods=['POST'])
 def biff_defeat(room_id, era):
     """Incrementa el contador de derrotas de Biff"""
+    return jsonify(biff_defeat_command(room_id, era, request.get_json(silent=True) or {}))
+
+def biff_defeat_command(room_id, era, data):
+    """Lógica de /biff_defeat (también evento de Socket.IO); devuelve el dict de la respuesta"""
     # Verificar acceso
     if not ('is_admin' in session and session['is_admin']) and ('assigned_group' not in session or session['assigned_group'] != room_id):
-        return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
+        return {"success": False, "error": "No tienes permiso para realizar esta acción."}
     
     if era not in ["pasado", "presente", "futuro"]:
-        return jsonify({"success": False, "error": "Era inválida"})
+        return {"success": False, "error": "Era inválida"}
     
     try:
-        # Inicializar o cargar datos de la sala
-        room_data = GameData.initialize_room_data(room_id)
-        
-        # Obtener el ciclo actual de perdición
-        global_counters = GameData.initialize_global_counters()
-        current_cycle = global_counters["perdicion_cycle"]
-        is_plan_1a = (current_cycle == 1)
-        
-        # Si el botón ya está desactivado, no hacer nada
-        if room_data["biff_disabled"][era]:
-            return jsonify({
-                "success": True,
-                "defeats": room_data["biff_defeats"][era],
-                "disable_button": True,
-                "message": "Biff Tannen ya ha sido añadido a la zona de victoria."
-            })
-        
-        # Obtener el número actual de derrotas y sumamos 1 para obtener la nueva cantidad
-        current_defeats = room_data["biff_defeats"][era]
-        new_defeats = current_defeats + 1
-        
-        # Determinar el mensaje según el número de derrotas
-        biff_message = ""
-        # Variable para indicar si se debe desactivar el botón
-        disable_button = False
-        
-        if new_defeats == 1:
-            biff_message = "\"¡Hey, McFly!\" Biff Tannen aparece agotado. Si en la partida esta Marty McFly, aparece en el Lugar de Marty, ignorando sus instrucciones de Aparición"
-        elif new_defeats == 2:
-            biff_message = "\"¿Te estoy haciendo perder el tiempo?\": en lugar de derrotar a Biff Tannen, agótalo. No se considera que haya sido derrotado."
-        elif new_defeats == 3:
-            biff_message = "\"¿Te estoy despistando?\": cada investigador debe colocar una de sus pistas sobre su Lugar, o bien recibir 1 punto de horror."
-        elif new_defeats == 4:
-            biff_message = "\"¡Llevo mucho tiempo preparando esto!\": Decides seguir el rastro que ha dejado Biff durante sus viajes en el tiempo. Coloca 1 pista (de la reserva de fichas) sobre cada Lugar en juego."
-        elif new_defeats >= 5:
-            # A partir de la quinta derrota (incluida)
-            if not is_plan_1a:
-                # Si NO estamos en Plan 1a, siempre mostrar este mensaje
-                biff_message = "Dale la vuelta a Biff Tannen y añadelo a la zona de victoria."
-                # Indicar que se debe desactivar el botón
-                disable_button = True
-                # Guardar el estado de desactivación
-                room_data["biff_disabled"][era] = True
-            else:
-                # Si estamos en Plan 1a, depende del número exacto de derrotas
-                if new_defeats == 5:
-                    biff_message = "\"Deja de golpearte, deja de golpearte, deja de golpearte\": Realiza una prueba de <span style=\"font-family: 'AHLCG';\">S</span>(2). Por cada punto que falte para tener éxito, recibe 1 punto de daño."
-                elif new_defeats == 6:
-                    biff_message = "\"¡Tenemos tiempo de sobra!\": añade 1 ficha de Perdición al Plan en curso."
-                elif new_defeats == 7:
-                    biff_message = "\"¡Ya no vas a necesitar esto!\": El investigador que ha derrotado a Biff descarta 1 Apoyo que controle, a ser posible un Apoyo usado para derrotar a Biff Tannen."
-                else:  # 8 o más derrotas
-                    # Seleccionar mensaje aleatorio entre los 3 disponibles
-                    import random
-                    random_messages = [
-                        "\"Deja de golpearte, deja de golpearte, deja de golpearte\": Realiza una prueba de <span style=\"font-family: 'AHLCG';\">S</span>(2). Por cada punto que falte para tener éxito, recibe 1 punto de daño.",
-                        "\"¡Tenemos tiempo de sobra!\": añade 1 ficha de Perdición al Plan en curso.",
-                        "\"¡Ya no vas a necesitar esto!\": El investigador que ha derrotado a Biff descarta 1 Apoyo que controle, a ser posible un Apoyo usado para derrotar a Biff Tannen."
-                    ]
-                    biff_message = random.choice(random_messages)
-        
-        # Incrementar el contador de derrotas de Biff (sin límite)
-        room_data["biff_defeats"][era] += 1
+        # Las derrotas se leen y se incrementan bajo el lock de la sala
+        with GameData.room_lock(room_id):
+            # Inicializar o cargar datos de la sala
+            room_data = GameData.initialize_room_data(room_id)
+            
+            # Obtener el ciclo actual de perdición
+            global_counters = GameData.initialize_global_counters()
+            current_cycle = global_counters["perdicion_cycle"]
+            is_plan_1a = (current_cycle == 1)
+            
+            # Si el botón ya está desactivado, no hacer nada
+            if room_data.is_biff_disabled(era):
+                return {
+                    "success": True,
+                    "defeats": room_data.biff_defeats[ERA_INDEX[era]],
+                    "disable_button": True,
+                    "message": "Biff Tannen ya ha sido añadido a la zona de victoria."
+                }
+            
+            # Obtener el número actual de derrotas y sumamos 1 para obtener la nueva cantidad
+            current_defeats = room_data.biff_defeats[ERA_INDEX[era]]
+            new_defeats = current_defeats + 1
+            
+            # Determinar el mensaje según el número de derrotas
+            biff_message = ""
+            # Variable para indicar si se debe desactivar el botón
+            disable_button = False
+            
+            if new_defeats == 1:
+                biff_message = "\"¡Hey, McFly!\" Biff Tannen aparece agotado. Si en la partida esta Marty McFly, aparece en el Lugar de Marty, ignorando sus instrucciones de Aparición"
+            elif new_defeats == 2:
+                biff_message = "\"¿Te estoy haciendo perder el tiempo?\": en lugar de derrotar a Biff Tannen, agótalo. No se considera que haya sido derrotado."
+            elif new_defeats == 3:
+                biff_message = "\"¿Te estoy despistando?\": cada investigador debe colocar una de sus pistas sobre su Lugar, o bien recibir 1 punto de horror."
+            elif new_defeats == 4:
+                biff_message = "\"¡Llevo mucho tiempo preparando esto!\": Decides seguir el rastro que ha dejado Biff durante sus viajes en el tiempo. Coloca 1 pista (de la reserva de fichas) sobre cada Lugar en juego."
+            elif new_defeats >= 5:
+                # A partir de la quinta derrota (incluida)
+                if not is_plan_1a:
+                    # Si NO estamos en Plan 1a, siempre mostrar este mensaje
+                    biff_message = "Dale la vuelta a Biff Tannen y añadelo a la zona de victoria."
+                    # Indicar que se debe desactivar el botón (el estado se guarda al sumar la derrota)
+                    disable_button = True
+                else:
+                    # Si estamos en Plan 1a, depende del número exacto de derrotas
+                    if new_defeats == 5:
+                        biff_message = "\"Deja de golpearte, deja de golpearte, deja de golpearte\": Realiza una prueba de <span style=\"font-family: 'AHLCG';\">S</span>(2). Por cada punto que falte para tener éxito, recibe 1 punto de daño."
+                    elif new_defeats == 6:
+                        biff_message = "\"¡Tenemos tiempo de sobra!\": añade 1 ficha de Perdición al Plan en curso."
+                    elif new_defeats == 7:
+                        biff_message = "\"¡Ya no vas a necesitar esto!\": El investigador que ha derrotado a Biff descarta 1 Apoyo que controle, a ser posible un Apoyo usado para derrotar a Biff Tannen."
+                    else:  # 8 o más derrotas
+                        # Seleccionar mensaje aleatorio entre los 3 disponibles
+                        import random
+                        random_messages = [
+                            "\"Deja de golpearte, deja de golpearte, deja de golpearte\": Realiza una prueba de <span style=\"font-family: 'AHLCG';\">S</span>(2). Por cada punto que falte para tener éxito, recibe 1 punto de daño.",
+                            "\"¡Tenemos tiempo de sobra!\": añade 1 ficha de Perdición al Plan en curso.",
+                            "\"¡Ya no vas a necesitar esto!\": El investigador que ha derrotado a Biff descarta 1 Apoyo que controle, a ser posible un Apoyo usado para derrotar a Biff Tannen."
+                        ]
+                        biff_message = random.choice(random_messages)
+            
+            # Incrementar el contador de derrotas de Biff (sin límite) y guardar la desactivación
+            defeats = GameData.add_biff_defeat(room_id, era, disable=disable_button)
         
         # Verificar si se cumplen las condiciones de victoria después del cambio
-        victory_conditions_met = check_victory_conditions() if disable_button else False
+        victory_conditions_met = announce_victory_conditions() if disable_button else False
         
         # Emitir evento de actualización a todos los clientes en la sala
-        socketio.emit('biff_update', {
+        dispatcher.emit('biff_update', {
             'room_id': room_id,
             'era': era,
-            'defeats': room_data["biff_defeats"][era],
+            'defeats': defeats,
             'message': biff_message,  # Añadir el mensaje a la respuesta
             'disable_button': disable_button  # Indicar si se debe desactivar el botón
         }, room=f"room_{room_id}")
         
-        # Si se cumplen las condiciones de victoria, emitir evento especial
-        if victory_conditions_met:
-            socketio.emit('victory_conditions_met', {
-                'message': "->R1"
-            })
-        
-        return jsonify({
+        return {
             "success": True,
-            "defeats": room_data["biff_defeats"][era],
+            "defeats": defeats,
             "message": biff_message,  # Añadir el mensaje a la respuesta
             "disable_button": disable_button,  # Indicar si se debe desactivar el botón
             "victory_conditions_met": victory_conditions_met
-        })
+        }
     except Exception as e:
         error_msg = f"Error al actualizar derrotas de Biff: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
-        return jsonify({"success": False, "error": error_msg})
+        logger.exception(error_msg)
+        return {"success": False, "error": error_msg}
 @room_bp.route('/update_column_resource/<int:room_id>/<era>/<column>', methods=['POST'])
 def update_column_resource(room_id, era, column):
     """Actualiza un contador de columna específico"""
@@ -524,393 +429,408 @@ def update_column_resource(room_id, era, column):
         if data is None:
             return jsonify({"success": False, "error": "Datos no proporcionados o formato incorrecto"})
             
-        amount = data.get('amount', 0)
-        
-        # Inicializar datos de la sala y contadores
-        room_data = GameData.initialize_room_data(room_id)
-        column_totals = GameData.initialize_room_column_totals(room_id)
-        global_counters = GameData.initialize_global_counters()
-        
-        # MODIFICACIÓN: Lógica para valores negativos en Perdición
-        if column == "perdicion" and amount < 0:
-            # Verificar que el valor global no se vuelva negativo
-            new_global_value = global_counters["perdicion"] + amount
-            
-            if new_global_value < 0:
-                # Limitar la reducción para que el total sea 0
-                amount = -global_counters["perdicion"]
-                new_global_value = 0
-        
-        # Variable para controlar si estamos completando un ciclo
-        cycle_completed = False
-        notification = None
-        
-        # Lógica especial para perdición
-        if column == "perdicion":
-            # Si estamos en el ciclo 3 y ya ha terminado, no permitimos más cambios
-            if global_counters["perdicion_cycle"] > 3:
-                return jsonify({
-                    "success": False,
-                    "error": "El contador de perdición ha completado todos sus ciclos."
-                })
-            
-            # Calculamos el nuevo valor después del cambio
-            new_perdicion_value = global_counters["perdicion"] + amount
+        amount = amount_value(data)
+        if amount is None:
+            return jsonify({"success": False, "error": "Cantidad inválida"})
+        
+        # Eventos que se emiten después de liberar los locks
+        r2_reached = False
+        fluzo_updates = []
+        
+        # Los contadores globales y los de la sala se leen y modifican bajo el lock global y el de
+        # la sala, de modo que un cambio de ciclo no puede intercalarse con un incremento normal
+        with GameData.global_lock(), GameData.room_lock(room_id):
+            # Inicializar datos de la sala y contadores
+            room_data = GameData.initialize_room_data(room_id)
+            global_counters = GameData.initialize_global_counters()
             
-            # Verificar que el nuevo valor no sea negativo
-            if new_perdicion_value < 0:
-                new_perdicion_value = 0
-                # Ajustar la cantidad para que el contador de la sala también se actualice correctamente
-                amount = -global_counters["perdicion"]
+            # MODIFICACIÓN: Lógica para valores negativos en Perdición
+            if column == "perdicion" and amount < 0:
+                # Verificar que el valor global no se vuelva negativo
+                new_global_value = global_counters["perdicion"] + amount
                 
-            # Verificar límites según el ciclo actual
-            cycle_limits = {1: 60, 2: 60, 3: 60}
-            current_cycle = global_counters["perdicion_cycle"]
+                if new_global_value < 0:
+                    # Limitar la reducción para que el total sea 0
+                    amount = -global_counters["perdicion"]
+                    new_global_value = 0
             
-            # Si alcanzamos o superamos el límite del ciclo actual
-            if current_cycle in cycle_limits and new_perdicion_value >= cycle_limits[current_cycle]:
-                # Enviamos una notificación según el ciclo
-                notifications = {
-                    1: "Haz avanzar al Plan 1b",
-                    2: "Haz avanzar al Plan 1b. El valor de Fluzo ha sido alterado",
-                    3: "->R2"
-                }
-                notification = notifications[current_cycle]
+            # Variable para controlar si estamos completando un ciclo
+            cycle_completed = False
+            notification = None
+            
+            # Lógica especial para perdición
+            if column == "perdicion":
+                # Si estamos en el ciclo 3 y ya ha terminado, no permitimos más cambios
+                if global_counters["perdicion_cycle"] > 3:
+                    return jsonify({
+                        "success": False,
+                        "error": "El contador de perdición ha completado todos sus ciclos."
+                    })
                 
-                # Actualizamos el ciclo y reseteamos el contador global
-                global_counters["perdicion_cycle"] += 1
-                global_counters["perdicion"] = 0
+                # Calculamos el nuevo valor después del cambio
+                new_perdicion_value = global_counters["perdicion"] + amount
                 
-                # Marcamos que se completó un ciclo
-                cycle_completed = True
+                # Verificar que el nuevo valor no sea negativo
+                if new_perdicion_value < 0:
+                    new_perdicion_value = 0
+                    # Ajustar la cantidad para que el contador de la sala también se actualice correctamente
+                    amount = -global_counters["perdicion"]
                 
-                # Si estamos en el ciclo 3 (pasando a 4), emitir evento de victoria R2
-                if current_cycle == 3:
-                    socketio.emit('victory_conditions_met', {
-                        'message': "->R2"
-                    })
+                # El contador de la sala es un entero de 32 bits: rechazar antes de modificar nada
+                if not fits_counter(room_data.get_counter(era, column) + amount):
+                    return jsonify({"success": False, "error": "Cantidad fuera de rango"})
+                    
+                # Verificar límites según el ciclo actual
+                cycle_limits = {1: 60, 2: 60, 3: 60}
+                current_cycle = global_counters["perdicion_cycle"]
                 
-                # Reiniciamos los contadores de perdición para todas las salas
-                # 1. Reiniciamos los contadores de la sala actual
-                for reset_era in ["pasado", "presente", "futuro"]:
-                    column_totals[reset_era]["perdicion"] = 0
+                # Si alcanzamos o superamos el límite del ciclo actual
+                if current_cycle in cycle_limits and new_perdicion_value >= cycle_limits[current_cycle]:
+                    # Enviamos una notificación según el ciclo
+                    notifications = {
+                        1: "Haz avanzar al Plan 1b",
+                        2: "Haz avanzar al Plan 1b. El valor de Fluzo ha sido alterado",
+                        3: "->R2"
+                    }
+                    notification = notifications[current_cycle]
+                    
+                    # Actualizamos el ciclo y reseteamos el contador global
+                    global_counters["perdicion_cycle"] += 1
+                    global_counters["perdicion"] = 0
+                    
+                    # Marcamos que se completó un ciclo
+                    cycle_completed = True
+                    
+                    # Si estamos en el ciclo 3 (pasando a 4), emitir evento de victoria R2 (tras liberar los locks)
+                    if current_cycle == 3:
+                        r2_reached = True
+                    
+                    # Reiniciamos los contadores de perdición en TODAS las salas (incluida la actual)
+                    GameData.reset_perdicion_all_rooms()
+                    
+                    # Si estamos pasando del ciclo 2 al ciclo 3, ajustar valores de fluzo
+                    if current_cycle == 2:
+                        # Llamar a la función para ajustar todos los valores de fluzo (los eventos se emiten después)
+                        fluzo_updates = adjust_all_fluzo_values_internal() or []
+                else:
+                    # Si no alcanzamos el límite, actualizamos normalmente
+                    GameData.add_column_value(room_id, era, column, amount)
+                    global_counters["perdicion"] = new_perdicion_value
+            elif column == "fluzo":
+                # Para fluzo, simplemente actualizamos el valor en la sala
+                if not fits_counter(room_data.get_counter(era, column) + amount):
+                    return jsonify({"success": False, "error": "Cantidad fuera de rango"})
+                GameData.add_column_value(room_id, era, column, amount)
+            else:
+                # Para otros contadores (reserva) actualizamos normalmente
+                # También evitamos valores negativos para la reserva global
+                new_value = global_counters[column] + amount
+                if new_value < 0:
+                    new_value = 0
+                    # Ajustar la cantidad para que el contador de la sala también se actualice correctamente
+                    amount = -global_counters[column]
                 
-                # 2. Guardar en la sala actual
-                GameData.save_column_totals(room_id, column_totals)
+                # También evitamos valores negativos para el contador de la sala
+                new_room_value = room_data.get_counter(era, column) + amount
+                if new_room_value < 0:
+                    new_room_value = 0
+                    amount = -room_data.get_counter(era, column)
                 
-                # 3. Reiniciar contadores de perdición en TODAS las salas
-                GameData.reset_perdicion_all_rooms()
+                # El contador de la sala es un entero de 32 bits: rechazar antes de modificar nada
+                if not fits_counter(new_room_value):
+                    return jsonify({"success": False, "error": "Cantidad fuera de rango"})
                 
-                # 4. Si estamos pasando del ciclo 2 al ciclo 3, ajustar valores de fluzo
-                if current_cycle == 2:
-                    # Llamar a la función para ajustar todos los valores de fluzo
-                    adjust_all_fluzo_values_internal()
-            else:
-                # Si no alcanzamos el límite, actualizamos normalmente
-                global_counters["perdicion"] = new_perdicion_value
-                column_totals[era][column] += amount
-        elif column == "fluzo":
-            # Para fluzo, simplemente actualizamos el valor en la sala
-            column_totals[era][column] += amount
-            
-            # Verificar si se cumplen las condiciones de victoria después del cambio
-            victory_conditions_met = check_victory_conditions()
-            
-            # Si se cumplen las condiciones de victoria, emitir evento especial
-            if victory_conditions_met:
-                socketio.emit('victory_conditions_met', {
-                    'message': "->R1"
-                })
-        else:
-            # Para otros contadores (reserva) actualizamos normalmente
-            # También evitamos valores negativos para la reserva global
-            new_value = global_counters[column] + amount
-            if new_value < 0:
-                new_value = 0
-                # Ajustar la cantidad para que el contador de la sala también se actualice correctamente
-                amount = -global_counters[column]
-            
-            global_counters[column] = new_value
+                GameData.set_column_value(room_id, era, column, new_room_value)
+                global_counters[column] = new_value
             
-            # También evitamos valores negativos para el contador de la sala
-            new_room_value = column_totals[era][column] + amount
-            if new_room_value < 0:
-                new_room_value = 0
-                amount = -column_totals[era][column]
-            
-            column_totals[era][column] = new_room_value
+            # Guardar los cambios
+            GameData.save_global_counters(global_counters)
+            column_totals = room_data.column_totals(era)
+            global_totals = dict(global_counters)
         
-        # Guardar los cambios
-        GameData.save_column_totals(room_id, column_totals)
-        GameData.save_global_counters(global_counters)
+        # Si estamos en el ciclo 3 (pasando a 4), emitir evento de victoria R2
+        if r2_reached:
+            dispatcher.emit('victory_conditions_met', {
+                'message': "->R2"
+            })
+        
+        # Notificar los valores de fluzo alterados al pasar del ciclo 2 al 3
+        if fluzo_updates:
+            emit_fluzo_updates(fluzo_updates)
         
         # Emitir eventos según corresponda
         if cycle_completed:
             # Si se completó un ciclo, enviar un evento a TODAS las mesas en TODAS las salas
             # Este evento forzará la actualización de todos los contadores de perdición
-            socketio.emit('perdicion_cycle_completed', {
-                'perdicionCycle': global_counters["perdicion_cycle"],
+            dispatcher.emit('perdicion_cycle_completed', {
+                'perdicionCycle': global_totals["perdicion_cycle"],
                 'notification': notification,
                 'originRoom': room_id,
                 'originEra': era
             })
         else:
             # Comportamiento normal - enviar solo para la era actual
-            socketio.emit('column_resource_update', {
+            dispatcher.emit('column_resource_update', {
                 'room_id': room_id,
                 'era': era,
-                'columnTotals': column_totals[era],
+                'columnTotals': column_totals,
                 'notification': notification,
-                'perdicionCycle': global_counters["perdicion_cycle"]
+                'perdicionCycle': global_totals["perdicion_cycle"]
             }, room=f"room_{room_id}")
         
         # Emitir evento global a todos los clientes conectados
-        socketio.emit('global_counter_update', {
-            'globalTotals': global_counters,
+        dispatcher.emit('global_counter_update', {
+            'globalTotals': global_totals,
             'notification': notification,
             'cycleCompleted': cycle_completed
         })
         
         # Verificar si se cumplen las condiciones de victoria
-        victory_conditions_met = check_victory_conditions()
-        if victory_conditions_met:
-            socketio.emit('victory_conditions_met', {
-                'message': "->R1"
-            })
+        victory_conditions_met = announce_victory_conditions()
         
         return jsonify({
             "success": True,
-            "columnTotals": column_totals[era],
-            "globalTotals": global_counters,
+            "columnTotals": column_totals,
+            "globalTotals": global_totals,
             "notification": notification,
             "victory_conditions_met": victory_conditions_met
         })
     except Exception as e:
         error_msg = f"Error al actualizar columna: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
         return jsonify({"success": False, "error": error_msg})
 # Controlador para Perdición
 @room_bp.route('/update_perdicion/<int:room_id>/<era>', methods=['POST'])
 def update_perdicion(room_id, era):
     """Actualiza específicamente el contador de perdición"""
+    return jsonify(update_perdicion_command(room_id, era, request.get_json(silent=True)))
+
+def update_perdicion_command(room_id, era, data):
+    """Lógica de /update_perdicion (también evento de Socket.IO); devuelve el dict de la respuesta"""
     # Verificar acceso
     if not ('is_admin' in session and session['is_admin']) and ('assigned_group' not in session or session['assigned_group'] != room_id):
-        return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
+        return {"success": False, "error": "No tienes permiso para realizar esta acción."}
     
     if era not in ["pasado", "presente", "futuro"]:
-        return jsonify({"success": False, "error": "Era inválida"})
+        return {"success": False, "error": "Era inválida"}
     
     try:
-        # Obtener datos del POST
-        data = request.get_json()
         if data is None:
-            return jsonify({"success": False, "error": "Datos no proporcionados o formato incorrecto"})
-            
-        amount = data.get('amount', 0)
-        
-        # Inicializar datos de la sala y contadores
-        room_data = GameData.initialize_room_data(room_id)
-        column_totals = GameData.initialize_room_column_totals(room_id)
-        global_counters = GameData.initialize_global_counters()
-        
-        # Lógica para valores negativos en Perdición
-        if amount < 0:
-            # Verificar que el valor global no se vuelva negativo
-            new_global_value = global_counters["perdicion"] + amount
+            return {"success": False, "error": "Datos no proporcionados o formato incorrecto"}
             
-            if new_global_value < 0:
-                # Limitar la reducción para que el total sea 0
-                amount = -global_counters["perdicion"]
-                new_global_value = 0
-        
-        # Variable para controlar si estamos completando un ciclo
-        cycle_completed = False
-        notification = None
-        
-        # Si estamos en el ciclo 3 y ya ha terminado, no permitimos más cambios
-        if global_counters["perdicion_cycle"] > 3:
-            return jsonify({
-                "success": False,
-                "error": "El contador de perdición ha completado todos sus ciclos."
-            })
-        
-        # Calculamos el nuevo valor después del cambio
-        new_perdicion_value = global_counters["perdicion"] + amount
-        
-        # Verificar que el nuevo valor no sea negativo
-        if new_perdicion_value < 0:
-            new_perdicion_value = 0
-            # Ajustar la cantidad para que el contador de la sala también se actualice correctamente
-            amount = -global_counters["perdicion"]
+        amount = amount_value(data)
+        if amount is None:
+            return {"success": False, "error": "Cantidad inválida"}
+        
+        # Eventos que se emiten después de liberar los locks
+        r2_reached = False
+        fluzo_updates = []
+        
+        # Los contadores globales y los de la sala se leen y modifican bajo el lock global y el de
+        # la sala, de modo que un cambio de ciclo no puede intercalarse con un incremento normal
+        with GameData.global_lock(), GameData.room_lock(room_id):
+            # Inicializar datos de la sala y contadores
+            room_data = GameData.initialize_room_data(room_id)
+            global_counters = GameData.initialize_global_counters()
             
-        # Verificar límites según el ciclo actual
-        cycle_limits = {1: 60, 2: 60, 3: 60}
-        current_cycle = global_counters["perdicion_cycle"]
-        
-        # Si alcanzamos o superamos el límite del ciclo actual
-        if current_cycle in cycle_limits and new_perdicion_value >= cycle_limits[current_cycle]:
-            # Enviamos una notificación según el ciclo
-            notifications = {
-                1: "Haz avanzar al Plan 1b",
-                2: "Haz avanzar al Plan 1b. El valor de Fluzo ha sido alterado",
-                3: "->R2"
-            }
-            notification = notifications[current_cycle]
+            # Lógica para valores negativos en Perdición
+            if amount < 0:
+                # Verificar que el valor global no se vuelva negativo
+                new_global_value = global_counters["perdicion"] + amount
+                
+                if new_global_value < 0:
+                    # Limitar la reducción para que el total sea 0
+                    amount = -global_counters["perdicion"]
+                    new_global_value = 0
             
-            # Actualizamos el ciclo y reseteamos el contador global
-            global_counters["perdicion_cycle"] += 1
-            global_counters["perdicion"] = 0
+            # Variable para controlar si estamos completando un ciclo
+            cycle_completed = False
+            notification = None
             
-            # Marcamos que se completó un ciclo
-            cycle_completed = True
+            # Si estamos en el ciclo 3 y ya ha terminado, no permitimos más cambios
+            if global_counters["perdicion_cycle"] > 3:
+                return {
+                    "success": False,
+                    "error": "El contador de perdición ha completado todos sus ciclos."
+                }
             
-            # Si estamos en el ciclo 3 (pasando a 4), emitir evento de victoria R2
-            if current_cycle == 3:
-                socketio.emit('victory_conditions_met', {
-                    'message': "->R2"
-                })
+            # Calculamos el nuevo valor después del cambio
+            new_perdicion_value = global_counters["perdicion"] + amount
             
-            # Reiniciamos los contadores de perdición para todas las salas
-            # 1. Reiniciamos los contadores de la sala actual
-            for reset_era in ["pasado", "presente", "futuro"]:
-                column_totals[reset_era]["perdicion"] = 0
+            # Verificar que el nuevo valor no sea negativo
+            if new_perdicion_value < 0:
+                new_perdicion_value = 0
+                # Ajustar la cantidad para que el contador de la sala también se actualice correctamente
+                amount = -global_counters["perdicion"]
             
-            # 2. Guardar en la sala actual
-            GameData.save_column_totals(room_id, column_totals)
+            # El contador de la sala es un entero de 32 bits: rechazar antes de modificar nada
+            if not fits_counter(room_data.get_counter(era, "perdicion") + amount):
+                return {"success": False, "error": "Cantidad fuera de rango"}
+                
+            # Verificar límites según el ciclo actual
+            cycle_limits = {1: 60, 2: 60, 3: 60}
+            current_cycle = global_counters["perdicion_cycle"]
             
-            # 3. Reiniciar contadores de perdición en TODAS las salas
-            GameData.reset_perdicion_all_rooms()
+            # Si alcanzamos o superamos el límite del ciclo actual
+            if current_cycle in cycle_limits and new_perdicion_value >= cycle_limits[current_cycle]:
+                # Enviamos una notificación según el ciclo
+                notifications = {
+                    1: "Haz avanzar al Plan 1b",
+                    2: "Haz avanzar al Plan 1b. El valor de Fluzo ha sido alterado",
+                    3: "->R2"
+                }
+                notification = notifications[current_cycle]
+                
+                # Actualizamos el ciclo y reseteamos el contador global
+                global_counters["perdicion_cycle"] += 1
+                global_counters["perdicion"] = 0
+                
+                # Marcamos que se completó un ciclo
+                cycle_completed = True
+                
+                # Si estamos en el ciclo 3 (pasando a 4), emitir evento de victoria R2 (tras liberar los locks)
+                if current_cycle == 3:
+                    r2_reached = True
+                
+                # Reiniciamos los contadores de perdición en TODAS las salas (incluida la actual)
+                GameData.reset_perdicion_all_rooms()
+                
+                # Si estamos pasando del ciclo 2 al ciclo 3, ajustar valores de fluzo
+                if current_cycle == 2:
+                    # Llamar a la función para ajustar todos los valores de fluzo (los eventos se emiten después)
+                    fluzo_updates = adjust_all_fluzo_values_internal() or []
+            else:
+                # Si no alcanzamos el límite, actualizamos normalmente
+                GameData.add_column_value(room_id, era, "perdicion", amount)
+                global_counters["perdicion"] = new_perdicion_value
             
-            # 4. Si estamos pasando del ciclo 2 al ciclo 3, ajustar valores de fluzo
-            if current_cycle == 2:
-                # Llamar a la función para ajustar todos los valores de fluzo
-                adjust_all_fluzo_values_internal()
-        else:
-            # Si no alcanzamos el límite, actualizamos normalmente
-            global_counters["perdicion"] = new_perdicion_value
-            column_totals[era]["perdicion"] += amount
+            # Guardar los cambios
+            GameData.save_global_counters(global_counters)
+            perdicion_total = room_data.get_counter(era, "perdicion")
+            global_totals = dict(global_counters)
         
-        # Guardar los cambios
-        GameData.save_column_totals(room_id, column_totals)
-        GameData.save_global_counters(global_counters)
+        # Si estamos en el ciclo 3 (pasando a 4), emitir evento de victoria R2
+        if r2_reached:
+            dispatcher.emit('victory_conditions_met', {
+                'message': "->R2"
+            })
+        
+        # Notificar los valores de fluzo alterados al pasar del ciclo 2 al 3
+        if fluzo_updates:
+            emit_fluzo_updates(fluzo_updates)
         
         # Emitir eventos según corresponda
         if cycle_completed:
             # Si se completó un ciclo, enviar un evento a TODAS las mesas en TODAS las salas
-            socketio.emit('perdicion_cycle_completed', {
-                'perdicionCycle': global_counters["perdicion_cycle"],
+            dispatcher.emit('perdicion_cycle_completed', {
+                'perdicionCycle': global_totals["perdicion_cycle"],
                 'notification': notification,
                 'originRoom': room_id,
                 'originEra': era
             })
         else:
             # Comportamiento normal - enviar solo para la era actual
-            socketio.emit('perdicion_update', {
+            dispatcher.emit('perdicion_update', {
                 'room_id': room_id,
                 'era': era,
-                'columnTotal': column_totals[era]["perdicion"],
+                'columnTotal': perdicion_total,
                 'notification': notification,
-                'perdicionCycle': global_counters["perdicion_cycle"]
+                'perdicionCycle': global_totals["perdicion_cycle"]
             }, room=f"room_{room_id}")
         
         # Emitir evento global a todos los clientes conectados
-        socketio.emit('global_perdicion_update', {
-            'globalTotal': global_counters["perdicion"],
-            'perdicionCycle': global_counters["perdicion_cycle"],
+        dispatcher.emit('global_perdicion_update', {
+            'globalTotal': global_totals["perdicion"],
+            'perdicionCycle': global_totals["perdicion_cycle"],
             'notification': notification,
             'cycleCompleted': cycle_completed
         })
         
         # Verificar si se cumplen las condiciones de victoria
-        victory_conditions_met = check_victory_conditions()
-        if victory_conditions_met:
-            socketio.emit('victory_conditions_met', {
-                'message': "->R1"
-            })
+        victory_conditions_met = announce_victory_conditions()
         
-        return jsonify({
+        return {
             "success": True,
-            "columnTotal": column_totals[era]["perdicion"],
-            "globalTotal": global_counters["perdicion"],
-            "perdicionCycle": global_counters["perdicion_cycle"],
+            "columnTotal": perdicion_total,
+            "globalTotal": global_totals["perdicion"],
+            "perdicionCycle": global_totals["perdicion_cycle"],
             "notification": notification,
             "victory_conditions_met": victory_conditions_met
-        })
+        }
     except Exception as e:
         error_msg = f"Error al actualizar perdición: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
-        return jsonify({"success": False, "error": error_msg})
+        logger.exception(error_msg)
+        return {"success": False, "error": error_msg}
 # Controlador para Reserva
 @room_bp.route('/update_reserva/<int:room_id>/<era>', methods=['POST'])
 def update_reserva(room_id, era):
     """Actualiza específicamente el contador de reserva"""
+    return jsonify(update_reserva_command(room_id, era, request.get_json(silent=True)))
+
+def update_reserva_command(room_id, era, data):
+    """Lógica de /update_reserva (también evento de Socket.IO); devuelve el dict de la respuesta"""
     # Verificar acceso
     if not ('is_admin' in session and session['is_admin']) and ('assigned_group' not in session or session['assigned_group'] != room_id):
-        return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
+        return {"success": False, "error": "No tienes permiso para realizar esta acción."}
     
     if era not in ["pasado", "presente", "futuro"]:
-        return jsonify({"success": False, "error": "Era inválida"})
+        return {"success": False, "error": "Era inválida"}
     
     try:
-        # Obtener datos del POST
-        data = request.get_json()
         if data is None:
-            return jsonify({"success": False, "error": "Datos no proporcionados o formato incorrecto"})
+            return {"success": False, "error": "Datos no proporcionados o formato incorrecto"}
             
-        amount = data.get('amount', 0)
+        amount = amount_value(data)
+        if amount is None:
+            return {"success": False, "error": "Cantidad inválida"}
         
-        # Inicializar datos de la sala y contadores
-        room_data = GameData.initialize_room_data(room_id)
-        column_totals = GameData.initialize_room_column_totals(room_id)
-        global_counters = GameData.initialize_global_counters()
-        
-        # MODIFICACIÓN: Lógica para valores negativos en Reserva
-        if amount < 0:
-            # Verificar que el valor global no se vuelva negativo
-            new_global_value = global_counters["reserva"] + amount
+        # El contador global y el de la sala se modifican bajo el lock global y el de la sala
+        with GameData.global_lock(), GameData.room_lock(room_id):
+            # Inicializar datos de la sala y contadores
+            room_data = GameData.initialize_room_data(room_id)
+            global_counters = GameData.initialize_global_counters()
             
+            # MODIFICACIÓN: Lógica para valores negativos en Reserva
+            new_global_value = global_counters["reserva"] + amount
             if new_global_value < 0:
                 # Limitar la reducción para que el total sea 0
                 amount = -global_counters["reserva"]
                 new_global_value = 0
             
+            # El contador de la sala es un entero de 32 bits: rechazar antes de modificar nada
+            if not fits_counter(room_data.get_counter(era, "reserva") + amount):
+                return {"success": False, "error": "Cantidad fuera de rango"}
+            
+            # IMPORTANTE: Permitir valores negativos en el contador de la sala
+            # Actualizar el valor de la sala directamente sin forzar que sea positivo
+            reserva_total = GameData.add_column_value(room_id, era, "reserva", amount)
             global_counters["reserva"] = new_global_value
-        else:
-            # Si es un valor positivo, simplemente sumarlo
-            global_counters["reserva"] += amount
-        
-        # IMPORTANTE: Permitir valores negativos en el contador de la sala
-        # Actualizar el valor de la sala directamente sin forzar que sea positivo
-        column_totals[era]["reserva"] += amount
-        
-        # Guardar los cambios
-        GameData.save_column_totals(room_id, column_totals)
-        GameData.save_global_counters(global_counters)
+            
+            # Guardar los cambios
+            GameData.save_global_counters(global_counters)
+            global_reserva = global_counters["reserva"]
         
         # Emitir evento de actualización a la sala actual
-        socketio.emit('reserva_update', {
+        dispatcher.emit('reserva_update', {
             'room_id': room_id,
             'era': era,
-            'columnTotal': column_totals[era]["reserva"]
+            'columnTotal': reserva_total
         }, room=f"room_{room_id}")
         
         # Emitir evento global a todos los clientes conectados
-        socketio.emit('global_reserva_update', {
-            'globalTotal': global_counters["reserva"]
+        dispatcher.emit('global_reserva_update', {
+            'globalTotal': global_reserva
         })
         
-        return jsonify({
+        return {
             "success": True,
-            "columnTotal": column_totals[era]["reserva"],
-            "globalTotal": global_counters["reserva"]
-        })
+            "columnTotal": reserva_total,
+            "globalTotal": global_reserva
+        }
     except Exception as e:
         error_msg = f"Error al actualizar reserva: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
-        return jsonify({"success": False, "error": error_msg})
+        logger.exception(error_msg)
+        return {"success": False, "error": error_msg}
 
 # Controlador para Fluzo
 @room_bp.route('/update_fluzo/<int:room_id>/<era>', methods=['POST'])
@@ -929,53 +849,41 @@ def update_fluzo(room_id, era):
         if data is None:
             return jsonify({"success": False, "error": "Datos no proporcionados o formato incorrecto"})
             
-        amount = data.get('amount', 0)
-        
-        # Inicializar datos de la sala
-        column_totals = GameData.initialize_room_column_totals(room_id)
-        
-        # Asegurarse de que fluzo existe en los datos de la columna
-        if "fluzo" not in column_totals[era]:
-            column_totals[era]["fluzo"] = 0
+        amount = amount_value(data)
+        if amount is None:
+            return jsonify({"success": False, "error": "Cantidad inválida"})
         
-        # Actualizar valor de fluzo en la sala
-        column_totals[era]["fluzo"] += amount
-        
-        # Si el valor se vuelve negativo, establecerlo a 0
-        if column_totals[era]["fluzo"] < 0:
-            column_totals[era]["fluzo"] = 0
-        
-        # Guardar los cambios
-        GameData.save_column_totals(room_id, column_totals)
+        with GameData.room_lock(room_id):
+            # Inicializar datos de la sala
+            room_data = GameData.initialize_room_data(room_id)
+            
+            # Actualizar valor de fluzo en la sala (si se vuelve negativo, establecerlo a 0)
+            new_fluzo = max(0, room_data.get_counter(era, "fluzo") + amount)
+            if not fits_counter(new_fluzo):
+                return jsonify({"success": False, "error": "Cantidad fuera de rango"})
+            fluzo_total = GameData.set_column_value(room_id, era, "fluzo", new_fluzo)
         
         # Verificar si se cumplen las condiciones de victoria
-        victory_conditions_met = check_victory_conditions()
+        victory_conditions_met = announce_victory_conditions()
         
         # Emitir evento de actualización a la sala actual
-        socketio.emit('fluzo_update', {
+        dispatcher.emit('fluzo_update', {
             'room_id': room_id,
             'era': era,
-            'fluzoTotal': column_totals[era]["fluzo"],
+            'fluzoTotal': fluzo_total,
             'fluzoValue': 0,  # La caja siempre muestra 0
             'isRandomValue': True  # Indicar que este es un valor aleatorio
         }, room=f"room_{room_id}")
         
-        # Si se cumplen las condiciones de victoria, emitir evento especial
-        if victory_conditions_met:
-            socketio.emit('victory_conditions_met', {
-                'message': "->R1"
-            })
-
         return jsonify({
             "success": True,
-            "fluzoTotal": column_totals[era]["fluzo"],
+            "fluzoTotal": fluzo_total,
             "fluzoValue": 0,  # Siempre devolver 0 para la caja
             "victory_conditions_met": victory_conditions_met
         })
     except Exception as e:
         error_msg = f"Error al actualizar fluzo: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
         return jsonify({"success": False, "error": error_msg})
 @room_bp.route('/get_column_totals/<int:room_id>/<era>', methods=['GET'])
 def get_column_totals(room_id, era):
@@ -989,22 +897,23 @@ def get_column_totals(room_id, era):
     
     try:
         # Inicializar datos de la sala y contadores
-        column_totals = GameData.initialize_room_column_totals(room_id)
+        room_data = GameData.initialize_room_data(room_id)
         global_counters = GameData.initialize_global_counters()
         
-        # Verificar condiciones de victoria
+        # La respuesta solo cambia con la versión de la sala, la de los contadores globales o
+        # el resultado de las condiciones de victoria
         victory_conditions_met = check_victory_conditions()
+        etag = state_etag(room_id, victory_conditions_met)
         
-        return jsonify({
+        return versioned_json(('column_totals', room_id, era), etag, lambda: {
             "success": True,
-            "columnTotals": column_totals[era],
+            "columnTotals": room_data.column_totals(era),
             "globalTotals": global_counters,
             "victory_conditions_met": victory_conditions_met
         })
     except Exception as e:
         error_msg = f"Error al obtener totales de columna: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
         return jsonify({"success": False, "error": error_msg})
 
 @room_bp.route('/get_global_counters', methods=['GET'])
@@ -1025,16 +934,42 @@ def get_global_counters():
         
         # Verificar condiciones de victoria
         victory_conditions_met = check_victory_conditions()
+        etag = state_etag(None, victory_conditions_met)
         
-        return jsonify({
+        return versioned_json(('global_counters',), etag, lambda: {
             "success": True,
             "globalTotals": global_counters,
             "victory_conditions_met": victory_conditions_met
         })
     except Exception as e:
         error_msg = f"Error al obtener contadores globales: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
+        return jsonify({"success": False, "error": error_msg})
+
+@room_bp.route('/state/<int:room_id>/<era>', methods=['GET'])
+def get_state(room_id, era):
+    """Obtiene en una sola respuesta el estado de la página de una era (totales de columna,
+    contadores globales y botones)"""
+    # Verificar acceso
+    if not ('is_admin' in session and session['is_admin']) and ('assigned_group' not in session or session['assigned_group'] != room_id):
+        return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
+    
+    if era not in ["pasado", "presente", "futuro"]:
+        return jsonify({"success": False, "error": "Era inválida"})
+    
+    try:
+        room_data = GameData.initialize_room_data(room_id)
+        global_counters = GameData.initialize_global_counters()
+        victory_conditions_met = check_victory_conditions()
+        etag = state_etag(room_id, victory_conditions_met)
+        
+        return versioned_json(('state', room_id, era), etag, lambda: {
+            "success": True,
+            **era_state(room_data, era, global_counters, victory_conditions_met)
+        })
+    except Exception as e:
+        error_msg = f"Error al obtener el estado de la sala: {str(e)}"
+        logger.exception(error_msg)
         return jsonify({"success": False, "error": error_msg})
 
 @room_bp.route('/reset_announcements/<int:room_id>/<era>', methods=['POST'])
@@ -1048,23 +983,20 @@ def reset_announcements(room_id, era):
         return jsonify({"success": False, "error": "Era inválida"})
     
     try:
-        # Inicializar o cargar datos de la sala
-        room_data = GameData.initialize_room_data(room_id)
-        
-        # Resetear todos los anuncios de esta era
-        for i in range(len(room_data["progress"][era])):
-            room_data["progress"][era][i] = False
+        with GameData.room_lock(room_id):
+            # Resetear todos los anuncios de esta era
+            room_data = GameData.initialize_room_data(room_id)
+            previous_progress = room_data.progress
+            GameData.reset_era_progress(room_id, era)
+            
+            # Delta con los anuncios desmarcados y los botones que dejan de estar disponibles
+            button_update = button_delta(room_id, previous_progress, room_data.progress)
         
-        # Verificar todos los botones para actualizar las dependencias
-        all_available_buttons = get_available_buttons(room_data["progress"])
+        # Actualizar el estado de las condiciones de victoria
+        announce_victory_conditions()
         
         # Emitir evento de actualización a todos los clientes en la sala
-        socketio.emit('button_update', {
-            'room_id': room_id,
-            'era': era,
-            'progress': room_data["progress"],
-            'available_buttons': all_available_buttons
-        }, room=f"room_{room_id}")
+        dispatcher.emit('button_update', button_update, room=f"room_{room_id}")
         
         return jsonify({
             "success": True,
@@ -1072,8 +1004,7 @@ def reset_announcements(room_id, era):
         })
     except Exception as e:
         error_msg = f"Error al resetear anuncios: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
         return jsonify({"success": False, "error": error_msg})
 @room_bp.route('/reset_biff/<int:room_id>/<era>', methods=['POST'])
 def reset_biff(room_id, era):
@@ -1086,17 +1017,15 @@ def reset_biff(room_id, era):
         return jsonify({"success": False, "error": "Era inválida"})
     
     try:
-        # Inicializar o cargar datos de la sala
-        room_data = GameData.initialize_room_data(room_id)
+        # Resetear el contador de Biff y también el estado de desactivación
+        with GameData.room_lock(room_id):
+            GameData.reset_biff(room_id, era)
         
-        # Resetear el contador de Biff
-        room_data["biff_defeats"][era] = 0
-        
-        # Resetear también el estado de desactivación
-        room_data["biff_disabled"][era] = False
+        # Actualizar el estado de las condiciones de victoria
+        announce_victory_conditions()
         
         # Emitir evento de actualización a todos los clientes en la sala
-        socketio.emit('biff_update', {
+        dispatcher.emit('biff_update', {
             'room_id': room_id,
             'era': era,
             'defeats': 0,
@@ -1109,8 +1038,7 @@ def reset_biff(room_id, era):
         })
     except Exception as e:
         error_msg = f"Error al resetear contador de Biff: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
         return jsonify({"success": False, "error": error_msg})
 
 @room_bp.route('/reset_column/<int:room_id>/<column>', methods=['POST'])
@@ -1124,34 +1052,34 @@ def reset_column(room_id, column):
         return jsonify({"success": False, "error": "Columna inválida"})
     
     try:
-        # Inicializar datos de la sala
-        column_totals = GameData.initialize_room_column_totals(room_id)
-        global_counters = GameData.initialize_global_counters()
-        
-        # Resetear la columna en todas las eras
-        for era in ["pasado", "presente", "futuro"]:
-            column_totals[era][column] = 0
-        
-        # Guardar los cambios
-        GameData.save_column_totals(room_id, column_totals)
-        
-        # Resetear también el contador global si corresponde
-        if column in global_counters:
-            global_counters[column] = 0
-            GameData.save_global_counters(global_counters)
+        with GameData.global_lock(), GameData.room_lock(room_id):
+            # Inicializar datos de la sala
+            room_data = GameData.initialize_room_data(room_id)
+            global_counters = GameData.initialize_global_counters()
+            
+            # Resetear la columna en todas las eras
+            for era in ["pasado", "presente", "futuro"]:
+                GameData.set_column_value(room_id, era, column, 0)
+            
+            # Resetear también el contador global si corresponde
+            if column in global_counters:
+                global_counters[column] = 0
+                GameData.save_global_counters(global_counters)
+            column_totals = room_data.column_totals_dict()
+            global_totals = dict(global_counters)
         
         # Emitir eventos de actualización a todos los clientes en la sala
         for era in ["pasado", "presente", "futuro"]:
-            socketio.emit('column_resource_update', {
+            dispatcher.emit('column_resource_update', {
                 'room_id': room_id,
                 'era': era,
                 'columnTotals': column_totals[era]
             }, room=f"room_{room_id}")
         
         # Emitir evento global si corresponde
-        if column in global_counters:
-            socketio.emit('global_counter_update', {
-                'globalTotals': global_counters
+        if column in global_totals:
+            dispatcher.emit('global_counter_update', {
+                'globalTotals': global_totals
             })
         
         return jsonify({
@@ -1160,236 +1088,352 @@ def reset_column(room_id, column):
         })
     except Exception as e:
         error_msg = f"Error al resetear columna: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
         return jsonify({"success": False, "error": error_msg})
 @room_bp.route('/set_fluzo_value/<int:room_id>/<era>', methods=['POST'])
 def set_fluzo_value(room_id, era):
     """Establece un valor específico para el contador de fluzo"""
+    return jsonify(set_fluzo_value_command(room_id, era, request.get_json(silent=True)))
+
+def set_fluzo_value_command(room_id, era, data):
+    """Lógica de /set_fluzo_value (también evento de Socket.IO); devuelve el dict de la respuesta"""
     # Verificar acceso
     if not ('is_admin' in session and session['is_admin']) and ('assigned_group' not in session or session['assigned_group'] != room_id):
-        return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
+        return {"success": False, "error": "No tienes permiso para realizar esta acción."}
     
     if era not in ["pasado", "presente", "futuro"]:
-        return jsonify({"success": False, "error": "Era inválida"})
+        return {"success": False, "error": "Era inválida"}
     
     try:
-        # Obtener datos del POST
-        data = request.get_json()
         if data is None:
-            return jsonify({"success": False, "error": "Datos no proporcionados o formato incorrecto"})
+            return {"success": False, "error": "Datos no proporcionados o formato incorrecto"}
             
         value = data.get('value', 0)
         silent = data.get('silent', False)  # Indicador para no mostrar notificación
         
-        # Inicializar datos de la sala
-        column_totals = GameData.initialize_room_column_totals(room_id)
-        
-        # Asegurarse de que fluzo existe en los datos de la columna
-        if "fluzo" not in column_totals[era]:
-            column_totals[era]["fluzo"] = 0
+        if not fits_counter(int(value)):
+            return {"success": False, "error": "Cantidad fuera de rango"}
         
         # Establecer el valor directamente en lugar de incrementarlo
-        column_totals[era]["fluzo"] = value
-        
-        # Guardar los cambios
-        GameData.save_column_totals(room_id, column_totals)
+        with GameData.room_lock(room_id):
+            fluzo_total = GameData.set_column_value(room_id, era, "fluzo", int(value))
         
         # Verificar si se cumplen las condiciones de victoria
-        victory_conditions_met = check_victory_conditions()
+        victory_conditions_met = announce_victory_conditions()
         
         # Emitir evento de actualización a la sala actual - no incluimos mensaje si es silencioso
-        socketio.emit('fluzo_update', {
+        dispatcher.emit('fluzo_update', {
             'room_id': room_id,
             'era': era,
-            'fluzoTotal': column_totals[era]["fluzo"],
+            'fluzoTotal': fluzo_total,
             'fluzoValue': 0,  # La caja siempre muestra 0
             'isRandomValue': True,  # Indicar que este es un valor aleatorio
             'silent': silent  # Indicador para no mostrar notificación
         }, room=f"room_{room_id}")
         
-        # Si se cumplen las condiciones de victoria, emitir evento especial
-        if victory_conditions_met:
-            socketio.emit('victory_conditions_met', {
-                'message': "->R1"
-            })
-        
-        return jsonify({
+        return {
             "success": True,
-            "fluzoTotal": column_totals[era]["fluzo"],
+            "fluzoTotal": fluzo_total,
             "fluzoValue": 0,  # Siempre devolver 0 para la caja
             "victory_conditions_met": victory_conditions_met
-        })
+        }
     except Exception as e:
         error_msg = f"Error al establecer valor de fluzo: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
-        return jsonify({"success": False, "error": error_msg})
+        logger.exception(error_msg)
+        return {"success": False, "error": error_msg}
 
 @room_bp.route('/check_fluzo_value/<int:room_id>/<era>', methods=['POST'])
 def check_fluzo_value(room_id, era):
     """Comprueba y actualiza el contador de fluzo, mostrando mensajes personalizados basados en el valor"""
+    return jsonify(check_fluzo_value_command(room_id, era, request.get_json(silent=True)))
+
+def check_fluzo_value_command(room_id, era, data):
+    """Lógica de /check_fluzo_value (también evento de Socket.IO); devuelve el dict de la respuesta"""
     # Verificar acceso
     if not ('is_admin' in session and session['is_admin']) and ('assigned_group' not in session or session['assigned_group'] != room_id):
-        return jsonify({"success": False, "error": "No tienes permiso para realizar esta acción."})
+        return {"success": False, "error": "No tienes permiso para realizar esta acción."}
     
     if era not in ["pasado", "presente", "futuro"]:
-        return jsonify({"success": False, "error": "Era inválida"})
+        return {"success": False, "error": "Era inválida"}
     
     try:
-        # Obtener datos del POST
-        data = request.get_json()
         if data is None:
-            return jsonify({"success": False, "error": "Datos no proporcionados o formato incorrecto"})
+            return {"success": False, "error": "Datos no proporcionados o formato incorrecto"}
             
         total_value = data.get('total_value', 0)
         checked_value = data.get('checked_value', 0)
         custom_message = data.get('custom_message')  # Mensaje personalizado desde el cliente
         
-        # Inicializar datos de la sala
-        column_totals = GameData.initialize_room_column_totals(room_id)
-        global_counters = GameData.initialize_global_counters()
-        
-        # Asegurarse de que fluzo existe en los datos de la columna
-        if "fluzo" not in column_totals[era]:
-            column_totals[era]["fluzo"] = 0
-        
-        # Establecer el nuevo valor total (puede ser un valor reducido)
-        column_totals[era]["fluzo"] = max(0, total_value)  # Evitar valores negativos en el total
-        
-        # Guardar los cambios
-        GameData.save_column_totals(room_id, column_totals)
-        
-        # Verificar si se ha completado "Consecuencias Imprevistas"
-        all_have_81 = True
-        consecuencias_completado = False
+        if not fits_counter(int(total_value)):
+            return {"success": False, "error": "Cantidad fuera de rango"}
         
-        # Inicializar la variable para "consecuencias_imprevistas" si no existe
-        if "consecuencias_imprevistas" not in global_counters:
-            global_counters["consecuencias_imprevistas"] = False
-        
-        # Recuperar el estado actual
-        consecuencias_completado = global_counters["consecuencias_imprevistas"]
+        # Evento que se emite después de liberar los locks
+        consecuencias_just_completed = False
         
-        # Si ya está completado, no necesitamos verificar de nuevo
-        if not consecuencias_completado:
-            # Verificar todas las salas
-            for key in GameData._game_data.keys():
-                if key.startswith("room_"):
-                    room_id_check = int(key.split("_")[1])
-                    room_data = GameData.initialize_room_column_totals(room_id_check)
+        # "Consecuencias Imprevistas" depende de todas las salas: lock global y de la sala
+        with GameData.global_lock(), GameData.room_lock(room_id):
+            # Inicializar datos de la sala
+            global_counters = GameData.initialize_global_counters()
+            
+            # Establecer el nuevo valor total (puede ser un valor reducido)
+            fluzo_total = GameData.set_column_value(room_id, era, "fluzo", max(0, int(total_value)))  # Evitar valores negativos en el total
+            
+            # Verificar si se ha completado "Consecuencias Imprevistas"
+            consecuencias_completado = False
+            
+            # Inicializar la variable para "consecuencias_imprevistas" si no existe
+            if "consecuencias_imprevistas" not in global_counters:
+                global_counters["consecuencias_imprevistas"] = False
+            
+            # Recuperar el estado actual
+            consecuencias_completado = global_counters["consecuencias_imprevistas"]
+            
+            # Si ya está completado, no necesitamos verificar de nuevo
+            if not consecuencias_completado:
+                # Verificar todas las salas (el índice de victoria cuenta las salas con fluzo 81 en todas las eras)
+                all_have_81 = GameData.all_rooms_fluzo_81()
+                                
+                # Si todos tienen 81, marcar como completado y usar un mensaje especial
+                if all_have_81:
+                    consecuencias_completado = True
+                    global_counters["consecuencias_imprevistas"] = True
+                    GameData.save_global_counters(global_counters)
                     
-                    # Verificar cada era en esta sala
-                    for check_era in ["pasado", "presente", "futuro"]:
-                        if "fluzo" not in room_data[check_era] or room_data[check_era]["fluzo"] != 81:
-                            all_have_81 = False
-                            break
+                    # Notificar a todos los clientes (tras liberar los locks)
+                    consecuencias_just_completed = True
                     
-                    if not all_have_81:
-                        break
-                            
-            # Si todos tienen 81, marcar como completado y usar un mensaje especial
-            if all_have_81:
-                consecuencias_completado = True
-                global_counters["consecuencias_imprevistas"] = True
-                GameData.save_global_counters(global_counters)
-                
-                # Emitir evento especial para notificar a todos los clientes
-                socketio.emit('consecuencias_imprevistas_completed', {
-                    'message': "Se ha completado Consecuencias Imprevistas"
-                })
-                
-                message = "Se ha completado Consecuencias Imprevistas"
+                    message = "Se ha completado Consecuencias Imprevistas"
+                else:
+                    # Usar el mensaje personalizado del cliente si está disponible
+                    message = custom_message
+                    
+                    # Si no hay mensaje personalizado y estamos en Plan 1a. Primer avance (ciclo 2), generarlo basado en el valor
+                    if message is None and global_counters["perdicion_cycle"] == 2:
+                        if fluzo_total < 78:
+                            message = "El valor de fluzo condensado es inferior a la media"
+                        elif fluzo_total > 78:
+                            message = "El valor de fluzo condensado es superior a la media"
+                        elif fluzo_total == 78:
+                            message = "¡Estas en la media! No alteres más tu valor de fluzo condensado, trata de ayudar a otros grupos colocando pistas en la Reserva temporal"
+                    
+                    # Si no hay mensaje personalizado y estamos en Plan 1a. Segundo avance (ciclo 3), generarlo basado en el valor
+                    elif message is None and global_counters["perdicion_cycle"] == 3:
+                        if fluzo_total < 81:
+                            message = "El valor de fluzo condensado es inferior a la media"
+                        elif fluzo_total > 81:
+                            message = "El valor de fluzo condensado es superior a la media"
+                        elif fluzo_total == 81:
+                            message = "¡Estas en la media! No alteres más tu valor de fluzo condensado, trata de ayudar a otros grupos colocando pistas en la Reserva temporal"
             else:
-                # Usar el mensaje personalizado del cliente si está disponible
-                message = custom_message
-                
-                # Si no hay mensaje personalizado y estamos en Plan 1a. Primer avance (ciclo 2), generarlo basado en el valor
-                if message is None and global_counters["perdicion_cycle"] == 2:
-                    if column_totals[era]["fluzo"] < 78:
-                        message = "El valor de fluzo condensado es inferior a la media"
-                    elif column_totals[era]["fluzo"] > 78:
-                        message = "El valor de fluzo condensado es superior a la media"
-                    elif column_totals[era]["fluzo"] == 78:
-                        message = "¡Estas en la media! No alteres más tu valor de fluzo condensado, trata de ayudar a otros grupos colocando pistas en la Reserva temporal"
-                
-                # Si no hay mensaje personalizado y estamos en Plan 1a. Segundo avance (ciclo 3), generarlo basado en el valor
-                elif message is None and global_counters["perdicion_cycle"] == 3:
-                    if column_totals[era]["fluzo"] < 81:
-                        message = "El valor de fluzo condensado es inferior a la media"
-                    elif column_totals[era]["fluzo"] > 81:
-                        message = "El valor de fluzo condensado es superior a la media"
-                    elif column_totals[era]["fluzo"] == 81:
-                        message = "¡Estas en la media! No alteres más tu valor de fluzo condensado, trata de ayudar a otros grupos colocando pistas en la Reserva temporal"
-        else:
-            # Si ya está completado, mantener el mensaje especial
-            message = "Se ha completado Consecuencias Imprevistas"
+                # Si ya está completado, mantener el mensaje especial
+                message = "Se ha completado Consecuencias Imprevistas"
+        
+        # Emitir evento especial para notificar a todos los clientes
+        if consecuencias_just_completed:
+            dispatcher.emit('consecuencias_imprevistas_completed', {
+                'message': "Se ha completado Consecuencias Imprevistas"
+            })
         
         # Verificar si se cumplen las condiciones de victoria
-        victory_conditions_met = check_victory_conditions()
+        victory_conditions_met = announce_victory_conditions()
         
         # Emitir evento de actualización a la sala actual
-        socketio.emit('fluzo_update', {
+        dispatcher.emit('fluzo_update', {
             'room_id': room_id,
             'era': era,
-            'fluzoTotal': column_totals[era]["fluzo"],
+            'fluzoTotal': fluzo_total,
             'fluzoValue': 0,  # Resetear la caja a 0
             'checkedValue': checked_value,
             'message': message,
             'consecuenciasCompleted': consecuencias_completado
         }, room=f"room_{room_id}")
         
-        # Si se cumplen las condiciones de victoria, emitir evento especial
-        if victory_conditions_met:
-            socketio.emit('victory_conditions_met', {
-                'message': "->R1"
-            })
-        
-        return jsonify({
+        return {
             "success": True,
-            "fluzoTotal": column_totals[era]["fluzo"],
+            "fluzoTotal": fluzo_total,
             "message": message,
             "consecuenciasCompleted": consecuencias_completado,
             "victory_conditions_met": victory_conditions_met
-        })
+        }
     except Exception as e:
         error_msg = f"Error al comprobar fluzo: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
-        return jsonify({"success": False, "error": error_msg})
+        logger.exception(error_msg)
+        return {"success": False, "error": error_msg}
+
+# Operaciones admitidas en /batch y sus campos numéricos
+BATCH_OPERATIONS = {
+    'update_perdicion': ('amount',),
+    'update_reserva': ('amount',),
+    'set_fluzo_value': ('value',),
+    'check_fluzo_value': ('total_value', 'checked_value'),
+    'biff_defeat': (),
+}
+BATCH_MAX_OPERATIONS = 20
+
+@room_bp.route('/batch/<int:room_id>/<era>', methods=['POST'])
+def batch(room_id, era):
+    """Aplica en orden y de una vez una lista de operaciones de mesa"""
+    return jsonify(batch_command(room_id, era, request.get_json(silent=True)))
+
+def batch_command(room_id, era, data):
+    """Lógica de /batch (también evento de Socket.IO batch_actions). data es
+    {"operations": [{"op": "update_reserva", "amount": 1}, {"op": "update_perdicion", "amount": 2}, ...]}.
+    
+    Las operaciones se validan antes de aplicar ninguna y se ejecutan seguidas con los locks global
+    y de la sala, de modo que ninguna otra acción se intercala. Los eventos se retienen hasta el
+    final (cada cliente recibe un único mensaje con el estado final) y las condiciones de victoria
+    se anuncian una sola vez. El lote es atómico: si una operación falla, las siguientes no se
+    aplican, se deshacen las anteriores (GameData.atomic) y se descartan sus eventos.
+    Devuelve la respuesta de cada operación y el estado final de la era (como /state)."""
+    # Verificar acceso
+    if not ('is_admin' in session and session['is_admin']) and ('assigned_group' not in session or session['assigned_group'] != room_id):
+        return {"success": False, "error": "No tienes permiso para realizar esta acción."}
+    
+    if era not in ["pasado", "presente", "futuro"]:
+        return {"success": False, "error": "Era inválida"}
+    
+    try:
+        operations = data.get('operations') if isinstance(data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return {"success": False, "error": "Datos no proporcionados o formato incorrecto"}
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return {"success": False, "error": f"Como máximo {BATCH_MAX_OPERATIONS} operaciones por lote"}
+        
+        # Validar todas las operaciones antes de aplicar ninguna
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+                return {"success": False, "error": f"Operación {index} desconocida", "failed_index": index}
+            for field in BATCH_OPERATIONS[operation['op']]:
+                if field == 'amount':
+                    if amount_value(operation) is None:
+                        return {"success": False, "error": f"Operación {index}: Cantidad inválida", "failed_index": index}
+                    continue
+                try:
+                    int(operation.get(field, 0))
+                except (TypeError, ValueError):
+                    return {"success": False, "error": f"Operación {index}: {field} debe ser un número", "failed_index": index}
+        
+        results = []
+        failed_index = None
+        # Los locks son reentrantes: cada operación los vuelve a tomar dentro del lote
+        with dispatcher.hold() as held_events, GameData.global_lock(), GameData.room_lock(room_id):
+            try:
+                with GameData.atomic(room_id) as rollback:
+                    g.batch_in_progress = True
+                    try:
+                        for index, operation in enumerate(operations):
+                            result = TABLE_COMMANDS[operation['op']](room_id, era, operation)
+                            results.append(result)
+                            if not result.get("success"):
+                                failed_index = index
+                                break
+                    finally:
+                        g.batch_in_progress = False
+                    
+                    if failed_index is not None:
+                        # Deshacer las operaciones aplicadas: ni el estado ni los clientes las ven
+                        rollback()
+                        del held_events[:]
+                    
+                    # Comprobación de victoria única y estado final
+                    victory_conditions_met = announce_victory_conditions()
+                    state = era_state(GameData.initialize_room_data(room_id), era,
+                                      GameData.initialize_global_counters(), victory_conditions_met)
+            except Exception:
+                # GameData.atomic ya ha deshecho el lote: descartar también sus eventos
+                del held_events[:]
+                raise
+        
+        response = {"success": failed_index is None, "results": results, "state": state}
+        if failed_index is not None:
+            response["failed_index"] = failed_index
+            response["error"] = results[failed_index].get("error")
+        return response
+    except Exception as e:
+        error_msg = f"Error al aplicar el lote de operaciones: {str(e)}"
+        logger.exception(error_msg)
+        return {"success": False, "error": error_msg}
 # Función auxiliar para desactivar botones dependientes
-def deactivate_dependent_buttons(progress, dependency_key):
-    """Desactiva recursivamente todos los botones que dependen de uno específico"""
-    for era in ["pasado", "presente", "futuro"]:
-        for idx, deps in GameData.button_dependencies[era].items():
-            if dependency_key in deps:
-                # Este botón depende del que estamos desactivando, lo desactivamos también
-                if progress[era][idx]:
-                    progress[era][idx] = False
-                    # Y propagamos la desactivación recursivamente
-                    deactivate_dependent_buttons(progress, f"{era}-{idx}")
+def deactivate_dependent_buttons(progress, node):
+    """Desactiva un botón y todos los botones que dependen de él (recorrido en anchura del grafo).
+    Recibe y devuelve el bitmask de progreso de la sala"""
+    return GameData.deactivate_button(progress, node)
 
 # Función auxiliar para verificar qué botones están disponibles
 def get_available_buttons(progress):
-    """Verifica qué botones están disponibles según las dependencias actuales"""
-    available_buttons = {
-        "pasado": [],
-        "presente": [],
-        "futuro": []
+    """Verifica qué botones están disponibles según las dependencias actuales (bitmask de progreso)"""
+    # La disponibilidad está precalculada en GameData para cada estado de progreso
+    return GameData.lookup_available_buttons(progress)
+
+# Funciones auxiliares para el protocolo de actualización de botones
+def button_delta(room_id, previous_progress, progress):
+    """Evento button_update: el cliente aplica los cambios si su versión (bitmask de progreso)
+    coincide con base y, si no, pide una instantánea con button_sync"""
+    return {'room_id': room_id, **GameData.button_delta(previous_progress, progress)}
+
+def button_snapshot(room_data):
+    """Estado completo de los botones de una sala: versión (bitmask de progreso) y disponibles"""
+    return {
+        'room_id': room_data.room_id,
+        'version': room_data.progress,
+        'available': GameData.lookup_available_mask(room_data.progress)
     }
-    
-    for era in ["pasado", "presente", "futuro"]:
-        for i in range(len(GameData.button_info[era])):
-            is_available = True
-            for dep in GameData.button_dependencies[era][i]:
-                dep_era, dep_idx = dep.split('-')
-                dep_idx = int(dep_idx)
-                if not progress[dep_era][dep_idx]:
-                    is_available = False
-                    break
-            available_buttons[era].append(is_available)
-    
-    return available_buttons
+
+def era_state(room_data, era, global_counters, victory_conditions_met):
+    """Estado de la página de una era: se incluye como JSON en era.html (lo lee era.js al cargar)
+    y lo devuelve /state tras una reconexión"""
+    return {
+        'room_id': room_data.room_id,
+        'era': era,
+        'perdicion_cycle': global_counters["perdicion_cycle"],
+        'column_totals': room_data.column_totals(era),
+        'global_counters': dict(global_counters),
+        'victory_conditions_met': victory_conditions_met,
+        'button_state': button_snapshot(room_data),
+        'button_offset': GameData.button_offsets[era],
+        'button_count': len(GameData.button_info[era])
+    }
+
+# Funciones auxiliares para las respuestas con ETag de los endpoints de consulta
+def state_etag(room_id, victory_conditions_met):
+    """ETag del estado de una sala (o solo de los contadores globales si room_id es None)"""
+    room_version = 'g' if room_id is None else GameData.room_version(room_id)
+    return f"{GameData.version_epoch()}-{room_version}-{GameData.globals_version()}-{int(victory_conditions_met)}"
+
+def versioned_json(key, etag, build):
+    """Respuesta JSON con ETag fuerte: 304 si el cliente ya tiene esa versión. build() genera
+    el contenido, que se serializa una sola vez por versión"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        cached = _json_responses.get(key)
+        if cached is None or cached[0] != etag:
+            cached = _json_responses[key] = (etag, current_app.json.dumps(build()))
+        response = Response(cached[1], mimetype='application/json')
+    response.set_etag(etag)
+    # El navegador guarda la respuesta pero la revalida en cada petición
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    return response
+
+# Manejador para la conexión de un cliente (Socket.IO)
+@socketio.on('connect')
+def handle_connect():
+    """Registra la conexión con la mesa de la sesión"""
+    try:
+        if 'is_admin' in session and session['is_admin']:
+            Presence.connected(request.sid, is_admin=True)
+        else:
+            Presence.connected(request.sid, session.get('mesa_code'), False,
+                               session.get('assigned_group'), session.get('assigned_era'))
+    except Exception as e:
+        logger.exception(f"Error al registrar la conexión: {str(e)}")
+
+# Función auxiliar para avisar al panel de administración de las mesas conectadas
+def push_presence():
+    """Envía a admin_room las mesas conectadas, si algún administrador está escuchando"""
+    if dispatcher.has_listeners('admin_room'):
+        dispatcher.emit('presence_update', Presence.snapshot(), room='admin_room')
 
 # Manejador para unirse a una sala (Socket.IO)
 @socketio.on('join')
@@ -1399,15 +1443,76 @@ def on_join(data):
         room = data.get('room')
         if room:
             join_room(room)
-            print(f"Cliente unido a sala: {room}")
+            Presence.joined(request.sid, room, data.get('era'))
+            Logs.debug_sampled(logger, 'join', "Cliente unido a sala", room=room)
             
             # Si es un administrador, unirlo a la sala admin_room
             if 'is_admin' in session and session['is_admin']:
                 join_room('admin_room')
-                print(f"Administrador unido a sala admin_room")
+                Presence.joined(request.sid, 'admin_room')
+                Logs.debug_sampled(logger, 'join', "Cliente unido a sala", room='admin_room')
+            
+            push_presence()
+    except Exception as e:
+        logger.exception(f"Error al unir a sala: {str(e)}")
+
+# Manejador para pedir el estado completo de los botones (Socket.IO)
+@socketio.on('button_sync')
+def on_button_sync(data):
+    """Devuelve (como ack) la instantánea de los botones a un cliente que ha detectado un salto de versión"""
+    try:
+        room_id = int(data.get('room_id'))
+        if not ('is_admin' in session and session['is_admin']) and session.get('assigned_group') != room_id:
+            return {'success': False, 'error': 'No tienes permiso para acceder a este grupo.'}
+        
+        # Los eventos de Socket.IO no pasan por before_request: sincronizar con el resto de workers
+        GameData.begin()
+        with GameData.room_lock(room_id):
+            snapshot = button_snapshot(GameData.initialize_room_data(room_id))
+        GameData.commit()
+        
+        return {'success': True, **snapshot}
     except Exception as e:
-        print(f"Error al unir a sala: {str(e)}")
-        traceback.print_exc()
+        logger.exception(f"Error al sincronizar botones: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+# Acciones de mesa por Socket.IO: mismas operaciones y respuestas que las rutas POST, pero sobre la
+# conexión ya abierta y con la sesión autenticada al conectar. La respuesta se devuelve como ack.
+# También son las operaciones de /batch; el lote completo es el evento batch_actions ('batch' ya es
+# el nombre de los mensajes agrupados que envía el servidor)
+TABLE_COMMANDS = {
+    'biff_defeat': biff_defeat_command,
+    'update_perdicion': update_perdicion_command,
+    'update_reserva': update_reserva_command,
+    'set_fluzo_value': set_fluzo_value_command,
+    'check_fluzo_value': check_fluzo_value_command,
+}
+SOCKET_COMMANDS = dict(TABLE_COMMANDS, batch_actions=batch_command)
+
+def run_socket_command(command, data=None):
+    """Ejecuta una acción de mesa recibida por Socket.IO ({room_id, era, ...datos}) en una
+    transacción de GameData, como hacen before_request/after_request con las rutas POST"""
+    try:
+        if not isinstance(data, dict):
+            return {'success': False, 'error': 'Datos no proporcionados o formato incorrecto'}
+        room_id = int(data.get('room_id'))
+        era = data.get('era')
+        
+        GameData.begin(write=True)
+        try:
+            result = command(room_id, era, data)
+            GameData.commit()
+        finally:
+            GameData.rollback()
+        Logs.debug_sampled(logger, 'table_command', "Acción de mesa por Socket.IO",
+                           command=command.__name__, room_id=room_id, era=era)
+        return result
+    except Exception as e:
+        logger.exception(f"Error en acción de mesa por Socket.IO: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+for event_name, command in SOCKET_COMMANDS.items():
+    socketio.on_event(event_name, functools.partial(run_socket_command, command))
 
 # Manejador para abandonar una sala (Socket.IO)
 @socketio.on('leave')
@@ -1417,24 +1522,27 @@ def on_leave(data):
         room = data.get('room')
         if room:
             leave_room(room)
-            print(f"Cliente abandonó la sala: {room}")
+            Presence.left(request.sid, room)
+            Logs.debug_sampled(logger, 'leave', "Cliente abandonó la sala", room=room)
             
             # Si es un administrador, hacer que abandone la sala admin_room
             if 'is_admin' in session and session['is_admin']:
                 leave_room('admin_room')
-                print(f"Administrador abandonó la sala admin_room")
+                Presence.left(request.sid, 'admin_room')
+                Logs.debug_sampled(logger, 'leave', "Cliente abandonó la sala", room='admin_room')
+            
+            push_presence()
     except Exception as e:
-        print(f"Error al abandonar sala: {str(e)}")
-        traceback.print_exc()
+        logger.exception(f"Error al abandonar sala: {str(e)}")
 
 # Manejador para la desconexión de un cliente (Socket.IO)
 @socketio.on('disconnect')
 def handle_disconnect():
     """Maneja la desconexión de un cliente"""
     try:
-        print(f"Cliente desconectado")
-        # No es necesario hacer nada aquí, Flask-SocketIO maneja automáticamente
-        # el abandono de las salas cuando un cliente se desconecta
+        # Flask-SocketIO saca al cliente de sus salas; el registro de presencia se actualiza aquí
+        Presence.disconnected(request.sid)
+        Logs.debug_sampled(logger, 'disconnect', "Cliente desconectado")
+        push_presence()
     except Exception as e:
-        print(f"Error en desconexión: {str(e)}")
-        traceback.print_exc()
\ No newline at end of file
+        logger.exception(f"Error en desconexión: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""Agrupación de los eventos de Socket.IO salientes.
+
+Los handlers emiten varios eventos por acción (actualización de la sala, contador global,
+avisos) y algunos recorren todas las salas y eras. En lugar de escribir cada evento en los
+sockets al momento, BroadcastDispatcher los acumula por destino (sala o difusión global) y los
+envía cada SOCKETIO_COALESCE_MS milisegundos en un único mensaje 'batch' por destino, con la
+lista de pares [evento, datos]. Si solo hay un evento pendiente se envía tal cual.
+
+Los eventos de estado (totales, botones, recursos) sustituyen al evento pendiente con la misma
+clave, que pasa al final de la cola para respetar el orden respecto a los avisos; los deltas de
+botones consecutivos se combinan en uno. Los eventos que llevan un aviso o mensaje nunca se
+descartan.
+
+Dentro de hold() (acciones compuestas como /batch) los eventos se retienen y se encolan todos
+juntos al final, de modo que los clientes solo ven el estado final de la acción completa.
+
+Los eventos para salas sin oyentes según el registro de presencia se descartan al emitirlos, sin
+llegar a serializarse; has_listeners() permite además no construir los datos.
+"""
+import contextlib
+import contextvars
+import itertools
+import logging
+import threading
+
+from app.presence import Presence
+
+logger = logging.getLogger(__name__)
+
+# Campos de los que depende la clave de agrupación de cada evento de estado
+COALESCE_KEYS = {
+    'button_update': ('room_id',),
+    'resource_update': ('room_id',),
+    'column_resource_update': ('room_id', 'era'),
+    'reserva_update': ('room_id', 'era'),
+    'perdicion_update': ('room_id', 'era'),
+    'fluzo_update': ('room_id', 'era'),
+    'biff_update': ('room_id', 'era'),
+    'global_counter_update': (),
+    'global_reserva_update': (),
+    'global_perdicion_update': (),
+    'presence_update': (),
+}
+
+# Campos que convierten un evento de estado en un aviso que el cliente debe recibir
+NOTICE_FIELDS = ('notification', 'message', 'consecuenciasCompleted', 'cycleCompleted')
+
+
+def merge_button_deltas(previous, current):
+    """Combina dos deltas de button_update consecutivos; None si current no parte del estado
+    al que lleva previous"""
+    if current['base'] != previous['base'] ^ previous['changed']:
+        return None
+    return dict(current,
+                base=previous['base'],
+                changed=previous['changed'] ^ current['changed'],
+                flips=previous['flips'] ^ current['flips'])
+
+
+# Eventos cuyo estado pendiente no se sustituye sino que se combina con el nuevo
+MERGE_FUNCTIONS = {
+    'button_update': merge_button_deltas,
+}
+
+# Eventos retenidos por hold() en el contexto actual (hilo o greenlet): [(evento, datos, sala)]
+_held_events = contextvars.ContextVar('held_events', default=None)
+
+
+class BroadcastDispatcher:
+    """Buffer de eventos salientes por destino que se vacía periódicamente"""
+
+    def __init__(self, socketio, interval=0.03):
+        self.socketio = socketio
+        self.interval = interval
+        self._lock = threading.Lock()
+        # Por destino: lista de entradas [evento, datos] en orden y entradas reemplazables por clave
+        self._buffers = {}
+        self._unique = itertools.count()
+        self._task = None
+        self.events_received = 0
+        self.events_merged = 0
+        self.events_skipped = 0
+        self.frames_sent = 0
+        self.skip_empty_rooms = True
+
+    def init_app(self, app):
+        self.interval = app.config.get('SOCKETIO_COALESCE_MS', 30) / 1000.0
+        # Con cola de mensajes los oyentes pueden estar conectados a otro worker
+        self.skip_empty_rooms = not app.config.get('SOCKETIO_MESSAGE_QUEUE')
+
+    def has_listeners(self, room):
+        """Si algún cliente puede recibir los eventos de la sala (siempre True para la difusión
+        global o si el registro de presencia no ve todas las conexiones)"""
+        return room is None or not self.skip_empty_rooms or Presence.listeners(room) > 0
+
+    def emit(self, event, data=None, room=None):
+        """Encola un evento para la sala room (o para todos los clientes si room es None)"""
+        if not self.has_listeners(room):
+            with self._lock:
+                self.events_skipped += 1
+            return
+
+        held = _held_events.get()
+        if held is not None:
+            held.append((event, data, room))
+            return
+
+        if self.interval <= 0:
+            with self._lock:
+                self.events_received += 1
+                self.frames_sent += 1
+            self.socketio.emit(event, data, room=room)
+            return
+
+        with self._lock:
+            self._append(self._buffers, event, data, room)
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    @contextlib.contextmanager
+    def hold(self):
+        """Retiene los eventos emitidos dentro del bloque y al salir los encola juntos: los de
+        estado se combinan y cada destino recibe un único mensaje. Devuelve la lista de eventos
+        retenidos, (evento, datos, sala), que se puede vaciar para descartarlos"""
+        held = _held_events.get()
+        if held is not None:
+            # Ya retenidos por un bloque exterior
+            yield held
+            return
+
+        held = []
+        token = _held_events.set(held)
+        try:
+            yield held
+        finally:
+            _held_events.reset(token)
+            if self.interval <= 0:
+                # Sin envío periódico: agrupar aquí y enviar ya
+                buffers = {}
+                with self._lock:
+                    for event, data, room in held:
+                        self._append(buffers, event, data, room)
+                self._send(buffers)
+            elif held:
+                with self._lock:
+                    for event, data, room in held:
+                        self._append(self._buffers, event, data, room)
+                    if self._task is None:
+                        self._task = self.socketio.start_background_task(self._run)
+
+    def _append(self, buffers, event, data, room):
+        """Añade un evento al buffer de su destino, sustituyendo o combinando el estado pendiente
+        con la misma clave (llamar con el lock tomado)"""
+        key = self._coalesce_key(event, data)
+        merge = MERGE_FUNCTIONS.get(event)
+        self.events_received += 1
+        entries, replaceable = buffers.setdefault(room, ([], {}))
+        previous = replaceable.pop(key, None)
+        if previous is not None:
+            merged = merge(previous[1], data) if merge else data
+            if merged is not None:
+                # El último estado sustituye al anterior, que se envía vacío (y se omite)
+                previous[0] = None
+                data = merged
+                self.events_merged += 1
+        entry = [event, data]
+        entries.append(entry)
+        if not self._is_notice(data):
+            replaceable[key] = entry
+
+    def flush(self):
+        """Envía los eventos pendientes: un mensaje por destino"""
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+        self._send(buffers)
+
+    def _send(self, buffers):
+        for room, (entries, _) in buffers.items():
+            events = [entry for entry in entries if entry[0] is not None]
+            if not events:
+                continue
+            if len(events) == 1:
+                self.socketio.emit(events[0][0], events[0][1], room=room)
+            else:
+                self.socketio.emit('batch', events, room=room)
+            with self._lock:
+                self.frames_sent += 1
+
+    def stats(self):
+        """Eventos recibidos, descartados por un estado posterior o por no tener oyentes y mensajes
+        enviados"""
+        with self._lock:
+            return {
+                "interval_ms": round(self.interval * 1000),
+                "events_received": self.events_received,
+                "events_merged": self.events_merged,
+                "events_skipped": self.events_skipped,
+                "frames_sent": self.frames_sent,
+                "pending_rooms": len(self._buffers),
+            }
+
+    def _coalesce_key(self, event, data):
+        fields = COALESCE_KEYS.get(event)
+        if fields is None or not isinstance(data, dict):
+            # Eventos que no representan un estado: siempre se envían
+            return (event, next(self._unique))
+        return (event,) + tuple(data.get(field) for field in fields)
+
+    @staticmethod
+    def _is_notice(data):
+        return isinstance(data, dict) and any(data.get(field) for field in NOTICE_FIELDS)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception(f"Error al enviar los eventos agrupados: {str(e)}")
@@ -0,0 +1,251 @@
+"""Variantes redimensionadas de las imágenes estáticas en WebP y AVIF.
+
+Cada imagen de static/ se convierte a varios anchos (nunca mayores que el original) en los
+formatos que soporte Pillow; AVIF solo si el Pillow instalado puede codificarlo (Pillow >= 11.2
+o el plugin pillow-avif-plugin). Los archivos se guardan en static/variants con el hash de su
+contenido en el nombre, y manifest.json recuerda qué variantes corresponden a cada original para
+no regenerarlas mientras el original no cambie.
+
+Las variantes se generan al desplegar (python -m app.image_variants, que además muestra el ahorro
+por imagen) o, si falta alguna, la primera vez que una plantilla las pide. Las plantillas usan
+responsive_image(), que devuelve un <picture> con un srcset por formato y la imagen original
+como alternativa.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
+
+from markupsafe import Markup, escape
+from PIL import Image
+
+try:
+    # Plugin opcional que añade AVIF a versiones de Pillow sin soporte propio
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Formatos de las variantes, en orden de preferencia para el navegador: (formato de Pillow,
+# tipo MIME, extensión, opciones de guardado)
+FORMATS = [
+    ('AVIF', 'image/avif', 'avif', {'quality': 55, 'speed': 6}),
+    ('WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 4}),
+]
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def file_hash(data):
+    """Hash corto del contenido para los nombres de archivo"""
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+class ImageVariants:
+    """Genera y localiza las variantes de las imágenes estáticas"""
+
+    _static_folder = None
+    _output_dir = 'variants'
+    _widths = (480, 800)
+    _manifest = None
+    # Entradas ya comprobadas en este proceso (las plantillas no vuelven a mirar el disco)
+    _checked = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def init_app(cls, app):
+        """Configura las rutas y anchos y registra responsive_image() en las plantillas"""
+        cls.configure(app.static_folder,
+                      app.config.get('IMAGE_VARIANT_WIDTHS', cls._widths),
+                      app.config.get('IMAGE_VARIANTS_DIR', cls._output_dir))
+
+        @app.context_processor
+        def image_variant_helpers():
+            return {"responsive_image": cls.responsive_image, "image_srcset": cls.srcset}
+
+    @classmethod
+    def configure(cls, static_folder, widths=None, output_dir=None):
+        with cls._lock:
+            cls._static_folder = static_folder
+            if widths is not None:
+                cls._widths = tuple(sorted(widths))
+            if output_dir is not None:
+                cls._output_dir = output_dir
+            cls._manifest = None
+            cls._checked = {}
+
+    @classmethod
+    def formats(cls):
+        """Formatos de variante que puede codificar el Pillow instalado"""
+        Image.init()
+        return [fmt for fmt in FORMATS if fmt[0] in Image.SAVE]
+
+    @classmethod
+    def _manifest_path(cls):
+        return os.path.join(cls._static_folder, cls._output_dir, 'manifest.json')
+
+    @classmethod
+    def _load_manifest(cls):
+        if cls._manifest is None:
+            try:
+                with open(cls._manifest_path(), encoding='utf-8') as manifest_file:
+                    cls._manifest = json.load(manifest_file)
+            except (OSError, ValueError):
+                cls._manifest = {}
+        return cls._manifest
+
+    @classmethod
+    def _save_manifest(cls):
+        path = cls._manifest_path()
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(cls._manifest, manifest_file, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def _write(cls, filename, data):
+        """Escribe una variante (sin efecto si ya existe: el nombre depende del contenido)"""
+        path = os.path.join(cls._static_folder, cls._output_dir, filename)
+        if not os.path.exists(path):
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as variant_file:
+                variant_file.write(data)
+            os.replace(temp_path, path)
+
+    @classmethod
+    def _is_current(cls, entry, source_path):
+        """Comprueba que la entrada del manifiesto corresponde al original y sus archivos existen"""
+        stat = os.stat(source_path)
+        if (entry.get("mtime_ns"), entry.get("size")) != (stat.st_mtime_ns, stat.st_size):
+            # Fecha distinta (p. ej. tras un checkout): comparar el contenido
+            with open(source_path, 'rb') as source_file:
+                if file_hash(source_file.read()) != entry.get("hash"):
+                    return False
+            entry["mtime_ns"], entry["size"] = stat.st_mtime_ns, stat.st_size
+        output_dir = os.path.join(cls._static_folder, cls._output_dir)
+        expected = {fmt[2] for fmt in cls.formats()}
+        return (expected <= set(entry["variants"]) and
+                all(os.path.exists(os.path.join(output_dir, variant["file"]))
+                    for variants in entry["variants"].values() for variant in variants))
+
+    @classmethod
+    def variants(cls, filename):
+        """Entrada del manifiesto de una imagen de static/ (generando las variantes si hace falta),
+        o None si la imagen no existe"""
+        if filename in cls._checked:
+            return cls._checked[filename]
+        with cls._lock:
+            source_path = os.path.join(cls._static_folder, filename)
+            if not os.path.isfile(source_path):
+                entry = None
+            else:
+                manifest = cls._load_manifest()
+                entry = manifest.get(filename)
+                if entry is None or not cls._is_current(entry, source_path):
+                    entry = manifest[filename] = cls._build(filename, source_path)
+                    cls._save_manifest()
+            cls._checked[filename] = entry
+            return entry
+
+    @classmethod
+    def _build(cls, filename, source_path):
+        with open(source_path, 'rb') as source_file:
+            source = source_file.read()
+        stat = os.stat(source_path)
+        image = Image.open(io.BytesIO(source))
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        # Anchos configurados menores que el original, más el ancho original
+        widths = [width for width in cls._widths if width < image.width] + [image.width]
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        os.makedirs(os.path.join(cls._static_folder, cls._output_dir), exist_ok=True)
+
+        entry = {"hash": file_hash(source), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                 "width": image.width, "height": image.height, "variants": {}}
+        for pil_format, _, extension, options in cls.formats():
+            variants = entry["variants"][extension] = []
+            for width in widths:
+                height = round(image.height * width / image.width)
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                buffer = io.BytesIO()
+                resized.save(buffer, format=pil_format, **options)
+                data = buffer.getvalue()
+                variant_name = f"{stem}-{width}w-{file_hash(data)}.{extension}"
+                cls._write(variant_name, data)
+                variants.append({"file": variant_name, "width": width, "bytes": len(data)})
+        return entry
+
+    @classmethod
+    def _url(cls, filename):
+        from flask import url_for
+        return url_for('static', filename=filename)
+
+    @classmethod
+    def srcset(cls, filename, extension='webp'):
+        """Valor de srcset con las variantes de una imagen en un formato ('' si no hay)"""
+        entry = cls.variants(filename)
+        if entry is None:
+            return ''
+        return ', '.join(f"{cls._url(cls._output_dir + '/' + variant['file'])} {variant['width']}w"
+                         for variant in entry["variants"].get(extension, []))
+
+    @classmethod
+    def responsive_image(cls, filename, alt='', class_='', sizes='100vw'):
+        """<picture> con las variantes de la imagen y el original como alternativa"""
+        entry = cls.variants(filename)
+        img_attributes = f'src="{escape(cls._url(filename))}" alt="{escape(alt)}"'
+        if class_:
+            img_attributes += f' class="{escape(class_)}"'
+        if entry is None:
+            return Markup(f'<img {img_attributes}>')
+
+        img_attributes += f' width="{entry["width"]}" height="{entry["height"]}"'
+        sources = ''.join(
+            f'<source type="{mimetype}" srcset="{escape(cls.srcset(filename, extension))}" '
+            f'sizes="{escape(sizes)}">'
+            for _, mimetype, extension, _ in cls.formats() if entry["variants"].get(extension))
+        return Markup(f'<picture>{sources}<img {img_attributes}></picture>')
+
+    @classmethod
+    def build_all(cls, directories=('images', 'img')):
+        """Genera las variantes de todas las imágenes de los directorios indicados. Devuelve
+        [(imagen, bytes del original, entrada del manifiesto)]"""
+        results = []
+        for directory in directories:
+            path = os.path.join(cls._static_folder, directory)
+            if not os.path.isdir(path):
+                continue
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    filename = f"{directory}/{name}"
+                    entry = cls.variants(filename)
+                    results.append((filename, os.path.getsize(os.path.join(path, name)), entry))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera las variantes WebP/AVIF de las imágenes estáticas")
+    parser.add_argument('--widths', type=int, nargs='+')
+    args = parser.parse_args()
+
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    widths = args.widths
+    if widths is None:
+        from app.config import get_config
+        widths = get_config().IMAGE_VARIANT_WIDTHS
+    ImageVariants.configure(static_folder, widths)
+
+    print(f"Formatos: {', '.join(fmt[2] for fmt in ImageVariants.formats())}")
+    print(f"{'imagen':<34} {'original':>9} {'formato':>7} {'ancho':>6} {'variante':>9} {'ahorro':>7} {'menor':>9}")
+    for filename, original_bytes, entry in ImageVariants.build_all():
+        for extension, variants in entry["variants"].items():
+            full_width = variants[-1]
+            print(f"{filename:<34} {original_bytes / 1024:>7.0f}KB {extension:>7} {full_width['width']:>6} "
+                  f"{full_width['bytes'] / 1024:>7.0f}KB {1 - full_width['bytes'] / original_bytes:>7.0%} "
+                  f"{variants[0]['bytes'] / 1024:>7.0f}KB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Registro estructurado (una línea JSON por evento) sin escribir en stdout desde los handlers.
+
+Los handlers registran con logging (logger = logging.getLogger(__name__)) y el handler del logger
+'app' solo encola el registro; un hilo escritor vacía la cola, da formato a los registros y los
+escribe en stdout de varios en varios con una sola escritura. El escritor es un hilo del sistema
+operativo también bajo gevent (ver app.threads) y la cola es una SimpleQueue de _queue, segura
+entre ese hilo y los greenlets: una escritura lenta en stdout solo bloquea al escritor, no al hub
+(el formato de los registros sí compite por el GIL con los greenlets, ver benchmarks/bench_logging.py).
+Si la cola se llena (stdout bloqueado) los registros nuevos se descartan y se cuentan en
+'dropped', en lugar de bloquear al handler.
+
+Los campos pasados en extra se añaden a la línea JSON:
+
+    logger.info("Sala reiniciada", extra={"room_id": 3})
+    {"ts": "...", "level": "INFO", "logger": "app.controllers.room_controller", "msg": "Sala reiniciada", "room_id": 3}
+
+Los eventos muy frecuentes (unirse a una sala, acciones de mesa) se registran en DEBUG con
+Logs.debug_sampled(logger, <clave>, mensaje, **campos): solo se registra uno de cada
+LOG_SAMPLE_RATE por clave (el resto se descarta antes de crear el registro) y la línea lleva
+"sampled": LOG_SAMPLE_RATE para poder estimar el total.
+
+El logger de Flask (app.logger) también es 'app', así que sus errores salen por el mismo camino.
+"""
+import atexit
+import datetime
+import json
+import logging
+import sys
+import traceback
+
+from app import threads
+
+# Atributos propios de LogRecord (el resto vienen de extra y se añaden a la línea JSON)
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Da formato a un registro como una línea JSON"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueLogHandler(logging.Handler):
+    """Encola los registros para el hilo escritor (hasta maxsize pendientes); nunca escribe ni
+    bloquea"""
+
+    def __init__(self, records, maxsize):
+        super().__init__()
+        self.records = records
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def emit(self, record):
+        # qsize() es aproximado entre hilos, basta para acotar la memoria
+        if self.records.qsize() >= self.maxsize:
+            self.dropped += 1
+        else:
+            self.records.put(record)
+
+    def handle(self, record):
+        # Sin el lock del handler: put ya es seguro entre hilos
+        self.emit(record)
+        return record
+
+
+class Logs:
+    """Configuración del logger 'app' y del hilo que escribe los registros"""
+
+    # Registros que el escritor escribe de una vez como máximo
+    BATCH_SIZE = 256
+
+    _handler = None
+    _writer = None
+    _sample_rate = 100
+    # Clave de muestreo -> eventos vistos
+    _sample_counts = {}
+    _stream = None
+    _formatter = JsonFormatter()
+
+    @classmethod
+    def init_app(cls, app):
+        cls.configure(level=app.config.get('LOG_LEVEL', 'INFO'),
+                      sample_rate=app.config.get('LOG_SAMPLE_RATE', 100),
+                      queue_size=app.config.get('LOG_QUEUE_SIZE', 10000))
+
+    @classmethod
+    def configure(cls, level='INFO', sample_rate=100, queue_size=10000, stream=None):
+        """Envía los registros del logger 'app' (y sus hijos) a la cola y arranca el escritor"""
+        cls.close()
+        cls._stream = stream
+        cls._handler = QueueLogHandler(threads.SimpleQueue(), queue_size)
+        cls._sample_rate = max(1, sample_rate)
+        cls._sample_counts = {}
+
+        logger = logging.getLogger('app')
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.addHandler(cls._handler)
+        logger.setLevel(level)
+        logger.propagate = False
+
+        cls._writer = threads.BackgroundThread(target=cls._run_writer, args=(cls._handler.records,),
+                                               name="log-writer")
+        cls._writer.start()
+
+    @classmethod
+    def debug_sampled(cls, logger, key, message, **fields):
+        """Registra en DEBUG uno de cada LOG_SAMPLE_RATE eventos con la misma clave"""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        # Sin lock: una carrera entre hilos solo altera el muestreo
+        count = cls._sample_counts.get(key, 0)
+        cls._sample_counts[key] = count + 1
+        if count % cls._sample_rate == 0:
+            logger.debug(message, extra=dict(fields, sampled=cls._sample_rate))
+
+    @classmethod
+    def _run_writer(cls, records):
+        while True:
+            batch = [records.get()]
+            while len(batch) < cls.BATCH_SIZE:
+                try:
+                    batch.append(records.get_nowait())
+                except threads.Empty:
+                    break
+
+            lines = []
+            for record in batch:
+                if record is None:
+                    cls._write(lines)
+                    return
+                try:
+                    lines.append(cls._formatter.format(record))
+                except Exception as e:
+                    lines.append(json.dumps({"level": "ERROR", "logger": __name__,
+                                             "msg": f"Error al dar formato a un registro: {str(e)}"}))
+            cls._write(lines)
+
+    @classmethod
+    def _write(cls, lines):
+        if not lines:
+            return
+        # sys.stdout en el momento de escribir (puede redirigirse después de configurar)
+        stream = cls._stream or sys.stdout
+        try:
+            stream.write('\n'.join(lines) + '\n')
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def stats(cls):
+        """Registros pendientes de escribir y descartados por tener la cola llena"""
+        if cls._handler is None:
+            return {"pending": 0, "dropped": 0}
+        return {"pending": cls._handler.records.qsize(), "dropped": cls._handler.dropped}
+
+    @classmethod
+    def close(cls, timeout=5):
+        """Escribe los registros pendientes y detiene el escritor"""
+        if cls._writer is None:
+            return
+        logging.getLogger('app').removeHandler(cls._handler)
+        cls._handler.records.put(None)
+        cls._writer.join(timeout)
+        cls._writer = None
+
+
+atexit.register(Logs.close)
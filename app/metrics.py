@@ -0,0 +1,188 @@
+"""Métricas de la aplicación en el formato de texto de Prometheus (GET /admin/metrics).
+
+- Duración de las peticiones HTTP: histograma por blueprint, ruta (endpoint) y método. Se mide
+  desde el primer before_request hasta el último after_request, incluida la sincronización del
+  estado con GameData.begin()/commit().
+- Eventos de Socket.IO enviados: número y bytes del JSON por nombre de evento (los eventos de un
+  mensaje 'batch' del dispatcher se cuentan por separado) y mensajes enviados. Serializar cada
+  mensaje solo para medirlo duplicaría el coste de emitirlo, así que los bytes se miden en uno de
+  cada METRICS_BYTES_SAMPLE_RATE mensajes y se multiplican por la tasa (una estimación).
+- Clientes conectados y salas con clientes, según el registro de presencia (app.presence).
+- Tamaño del estado: salas de GameData y ciclo de perdición, y contadores del dispatcher.
+
+En cada petición solo se guarda el instante inicial en el entorno WSGI y se suma la duración en
+su bucket (sin pasar por los proxies request/g, que cuestan ~1 µs por acceso); el resto del
+trabajo (acumular buckets, leer GameData) se hace al generar el texto. Con varios
+workers cada proceso tiene sus propias métricas: Prometheus debe consultar cada worker o sumar
+las series.
+"""
+import bisect
+import hmac
+import json
+import threading
+import time
+
+from flask import request
+
+from app.presence import Presence
+
+# Límites superiores (segundos) de los buckets del histograma de duración
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def label_value(value):
+    """Valor de etiqueta escapado según el formato de texto de Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Contadores, histogramas y gauges de la aplicación"""
+
+    _lock = threading.Lock()
+    # (endpoint, método) -> [peticiones por bucket..., por encima del último, suma]
+    _requests = {}
+    # evento -> [eventos enviados, bytes]
+    _events = {}
+    _frames = 0
+    _bytes_sample_rate = 100
+    _token = None
+
+    @classmethod
+    def init_app(cls, app, socketio):
+        """Registra la medición de las peticiones (debe llamarse antes de registrar el resto de
+        hooks, para que la medición los incluya) y cuenta los eventos que emite socketio"""
+        cls._token = app.config.get('METRICS_TOKEN')
+        cls._bytes_sample_rate = max(1, app.config.get('METRICS_BYTES_SAMPLE_RATE', 100))
+        app.before_request(cls._start_request)
+        app.after_request(cls._end_request)
+
+        emit = socketio.emit
+
+        def counted_emit(event, *args, **kwargs):
+            cls.count_emit(event, args[0] if args else kwargs.get('data'))
+            return emit(event, *args, **kwargs)
+
+        socketio.emit = counted_emit
+
+    @classmethod
+    def _start_request(cls):
+        request._get_current_object().environ['metrics.start'] = time.perf_counter()
+
+    @classmethod
+    def _end_request(cls, response):
+        current = request._get_current_object()
+        start = current.environ.pop('metrics.start', None)
+        if start is not None:
+            cls.observe_request(current.endpoint or '', current.method, time.perf_counter() - start)
+        return response
+
+    @classmethod
+    def observe_request(cls, endpoint, method, seconds):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        key = (endpoint, method)
+        with cls._lock:
+            series = cls._requests.get(key)
+            if series is None:
+                series = cls._requests[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += seconds
+
+    @classmethod
+    def count_emit(cls, event, data):
+        """Cuenta un mensaje de Socket.IO y sus eventos (los de un 'batch' por separado); sus bytes
+        solo en uno de cada METRICS_BYTES_SAMPLE_RATE mensajes"""
+        events = data if event == 'batch' and isinstance(data, list) else [(event, data)]
+        with cls._lock:
+            sampled = cls._frames % cls._bytes_sample_rate == 0
+            cls._frames += 1
+            for name, _ in events:
+                counters = cls._events.get(name)
+                if counters is None:
+                    counters = cls._events[name] = [0, 0]
+                counters[0] += 1
+        if not sampled:
+            return
+
+        sizes = [(name, len(json.dumps(payload, separators=(',', ':'), default=str))) for name, payload in events]
+        with cls._lock:
+            for name, size in sizes:
+                cls._events[name][1] += size * cls._bytes_sample_rate
+
+    @classmethod
+    def token_matches(cls, authorization):
+        """Comprueba la cabecera Authorization: Bearer <METRICS_TOKEN> (para Prometheus)"""
+        if not cls._token or not authorization or not authorization.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(authorization[len('Bearer '):].encode(), cls._token.encode())
+
+    @classmethod
+    def render(cls):
+        """Texto de todas las métricas"""
+        from app import dispatcher
+        from app.models.game_data import GameData
+
+        with cls._lock:
+            requests = {key: list(series) for key, series in cls._requests.items()}
+            events = {name: list(counters) for name, counters in cls._events.items()}
+            frames = cls._frames
+        room_clients = Presence.room_counts()
+        clients = Presence.client_count()
+
+        lines = [
+            '# HELP http_request_duration_seconds Duración de las peticiones HTTP por blueprint y ruta',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (endpoint, method), series in sorted(requests.items()):
+            # El blueprint es el prefijo del endpoint, como request.blueprint
+            blueprint = endpoint.rpartition('.')[0]
+            labels = f'blueprint="{label_value(blueprint)}",endpoint="{label_value(endpoint)}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {series[-1]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+        lines += ['# HELP socketio_events_total Eventos de Socket.IO enviados por nombre',
+                  '# TYPE socketio_events_total counter']
+        lines += [f'socketio_events_total{{event="{label_value(name)}"}} {counters[0]}'
+                  for name, counters in sorted(events.items())]
+        lines += ['# HELP socketio_event_bytes_total Bytes del JSON de los eventos de Socket.IO enviados (estimados por muestreo)',
+                  '# TYPE socketio_event_bytes_total counter']
+        lines += [f'socketio_event_bytes_total{{event="{label_value(name)}"}} {counters[1]}'
+                  for name, counters in sorted(events.items())]
+        lines += ['# HELP socketio_frames_total Mensajes de Socket.IO enviados (un batch cuenta como uno)',
+                  '# TYPE socketio_frames_total counter',
+                  f'socketio_frames_total {frames}',
+                  '# HELP socketio_connected_clients Clientes de Socket.IO conectados',
+                  '# TYPE socketio_connected_clients gauge',
+                  f'socketio_connected_clients {clients}',
+                  '# HELP socketio_joined_rooms Salas de Socket.IO con algún cliente',
+                  '# TYPE socketio_joined_rooms gauge',
+                  f'socketio_joined_rooms {len(room_clients)}',
+                  '# HELP socketio_room_clients Clientes unidos a cada sala de Socket.IO',
+                  '# TYPE socketio_room_clients gauge']
+        lines += [f'socketio_room_clients{{room="{label_value(room)}"}} {count}'
+                  for room, count in sorted(room_clients.items())]
+
+        stats = dispatcher.stats()
+        global_counters = GameData.initialize_global_counters()
+        lines += ['# HELP gamedata_rooms Salas con estado en GameData',
+                  '# TYPE gamedata_rooms gauge',
+                  f'gamedata_rooms {len(GameData.all_rooms())}',
+                  '# HELP gamedata_perdicion_cycle Ciclo de perdición actual',
+                  '# TYPE gamedata_perdicion_cycle gauge',
+                  f'gamedata_perdicion_cycle {global_counters["perdicion_cycle"]}',
+                  '# HELP dispatcher_events_received_total Eventos encolados en el dispatcher',
+                  '# TYPE dispatcher_events_received_total counter',
+                  f'dispatcher_events_received_total {stats["events_received"]}',
+                  '# HELP dispatcher_events_merged_total Eventos de estado sustituidos por uno posterior antes de enviarse',
+                  '# TYPE dispatcher_events_merged_total counter',
+                  f'dispatcher_events_merged_total {stats["events_merged"]}',
+                  '# HELP dispatcher_events_skipped_total Eventos descartados por ir a salas sin oyentes',
+                  '# TYPE dispatcher_events_skipped_total counter',
+                  f'dispatcher_events_skipped_total {stats["events_skipped"]}',
+                  '# HELP dispatcher_pending_rooms Destinos con eventos pendientes de envío',
+                  '# TYPE dispatcher_pending_rooms gauge',
+                  f'dispatcher_pending_rooms {stats["pending_rooms"]}']
+        return '\n'.join(lines) + '\n'
@@ -1,5 +1,6 @@
 from .auth import Auth
 from .game_data import GameData
+from .room_state import RoomState
 
 # Esta importación permite acceder a los modelos directamente desde app.models
 # Por ejemplo: from app.models import Auth, GameData
@@ -30,6 +30,9 @@ class Auth:
     # Lista de salas/grupos disponibles
     _rooms = [{"name": f"Grupo {i+1}", "id": i+1} for i in range(4)]
     
+    # Se incrementa cada vez que cambian los códigos de mesa (p. ej. para invalidar los QR en caché)
+    _codes_generation = 0
+    
     @classmethod
     def get_mesa_info(cls, access_code):
         """Obtiene la información de una mesa a partir de su código de acceso"""
@@ -80,6 +83,7 @@ class Auth:
                 "group": next_id,
                 "era": era
             }
+        cls._codes_generation += 1
         
         return new_room
     
@@ -87,3 +91,23 @@ class Auth:
     def get_all_mesa_codes(cls):
         """Retorna todos los códigos de mesa disponibles"""
         return cls._mesa_access_codes
+    
+    @classmethod
+    def codes_generation(cls):
+        """Retorna un contador que cambia cada vez que se modifican los códigos de mesa"""
+        return cls._codes_generation
+    
+    @classmethod
+    def export_state(cls):
+        """Exporta los grupos y códigos de mesa para compartirlos con otros workers"""
+        return {
+            "rooms": cls._rooms,
+            "mesa_access_codes": cls._mesa_access_codes
+        }
+    
+    @classmethod
+    def import_state(cls, state):
+        """Sustituye los grupos y códigos de mesa por los exportados por otro worker"""
+        cls._rooms = state["rooms"]
+        cls._mesa_access_codes = state["mesa_access_codes"]
+        cls._codes_generation += 1
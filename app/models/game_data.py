@@ -1,4 +1,26 @@
+import contextlib
+import contextvars
+import itertools
 import random
+import secrets
+import threading
+from collections import deque
+from .room_state import RoomState, ERAS, COLUMNS, ERA_INDEX, COLUMN_INDEX
+from .storage import MemoryStorage
+from .auth import Auth
+from . import journal
+
+# Cambios retenidos por GameData.atomic() en el contexto actual (hilo o greenlet)
+_held_changes = contextvars.ContextVar('held_changes', default=None)
+
+
+class HeldChanges:
+    """Salas y contadores globales modificados dentro de GameData.atomic()"""
+    __slots__ = ("rooms", "global_counters")
+
+    def __init__(self):
+        self.rooms = {}
+        self.global_counters = None
 
 class GameData:
     """Modelo para los datos del juego"""
@@ -57,141 +79,660 @@ class GameData:
         }
     }
     
-    # Almacenamiento del progreso y recursos
-    _game_data = {}
+    # Enlaces automáticos entre botones: al activar el botón origen se activan también los enlazados
+    button_links = {
+        "pasado": {
+            4: ["presente-4", "futuro-3"]  # Semilla en Pasado: activa la semilla en Presente y Futuro
+        }
+    }
+    
+    # Orden de las eras para numerar los nodos del grafo de botones
+    eras = ERAS
+    
+    # Grafo compilado de botones (se rellena al importar el módulo, ver compile_button_graph):
+    # cada botón es un nodo con id entero; button_requires contiene las dependencias de cada nodo,
+    # button_dependents el índice inverso y button_linked los enlaces automáticos al activar
+    button_offsets = {}
+    button_nodes = ()
+    button_requires = ()
+    button_dependents = ()
+    button_linked = ()
+    button_required_masks = ()
+    
+    # Tabla de disponibilidad precalculada: como la disponibilidad solo depende de los botones que
+    # son dependencia de algún otro, la tabla se indexa por la proyección del bitmask de progreso
+    # sobre dependency_mask y cubre así los 2^17 estados posibles
+    dependency_mask = 0
+    _availability_table = {}
+    
+    # Índice del anuncio "Un noble legado" en cada era
+    noble_legado_indices = {
+        "pasado": 5,
+        "presente": 5,
+        "futuro": 4
+    }
+    noble_legado_mask = 0
+    
+    # Almacenamiento del progreso y recursos: registro de salas indexado por id entero
+    # y contadores globales
+    _rooms = {}
+    _global_counters = None
+    
+    # Almacenamiento persistente (por defecto solo en memoria, ver configure_storage)
+    _storage = MemoryStorage()
+    
+    # Modelo de concurrencia: cada sala tiene su propio lock, que serializa sus mutaciones sin
+    # bloquear al resto de salas, y un lock global protege los contadores globales y las
+    # transiciones que afectan a todas las salas (cambio de ciclo de perdición, ajuste de fluzo).
+    # Orden de adquisición: global -> sala. Bajo gevent son locks cooperativos (monkey patching);
+    # los eventos de Socket.IO se emiten después de liberarlos
+    _room_locks = {}
+    _room_locks_guard = threading.Lock()
+    _global_lock = threading.RLock()
+    
+    # Índice incremental de condiciones de victoria (R1):
+    # para cada sala guarda (biff desactivado en todas las eras, fluzo == 81 en todas las eras,
+    # "Un noble legado" marcado en todas las eras) y cuántas salas cumplen cada condición
+    _victory_flags = {}
+    _victory_counts = [0, 0, 0]
+    _victory_announced = False
+    _victory_lock = threading.Lock()
+    
+    # Versiones del estado para los ETag de las respuestas JSON: cada cambio de una sala o de los
+    # contadores globales recibe un número nuevo de un contador monótono (nunca se repite dentro
+    # del proceso). La época distingue procesos y cargas del almacenamiento, ya que cada worker
+    # numera por su cuenta y el estado recién cargado tiene versión 0
+    _version_counter = itertools.count(1)
+    _version_epoch = secrets.token_hex(4)
+    _room_versions = {}
+    _globals_version = 0
+    
+    @classmethod
+    def compile_button_graph(cls):
+        """Compila las dependencias y enlaces de botones a un grafo con ids enteros"""
+        offsets = {}
+        nodes = []
+        for era in cls.eras:
+            offsets[era] = len(nodes)
+            nodes.extend((era, idx) for idx in range(len(cls.button_info[era])))
+        
+        def parse(key):
+            dep_era, dep_idx = key.split('-')
+            return offsets[dep_era] + int(dep_idx)
+        
+        requires = [[] for _ in nodes]
+        dependents = [[] for _ in nodes]
+        linked = [[] for _ in nodes]
+        for era in cls.eras:
+            for idx, deps in cls.button_dependencies[era].items():
+                node = offsets[era] + idx
+                for dep in deps:
+                    dep_node = parse(dep)
+                    requires[node].append(dep_node)
+                    dependents[dep_node].append(node)
+            for idx, links in cls.button_links.get(era, {}).items():
+                linked[offsets[era] + idx] = [parse(link) for link in links]
+        
+        cls.button_offsets = offsets
+        cls.button_nodes = tuple(nodes)
+        cls.button_requires = tuple(tuple(deps) for deps in requires)
+        cls.button_dependents = tuple(tuple(deps) for deps in dependents)
+        cls.button_linked = tuple(tuple(links) for links in linked)
+        cls.button_required_masks = tuple(sum(1 << dep for dep in set(deps)) for deps in requires)
+        cls.dependency_mask = 0
+        for required in cls.button_required_masks:
+            cls.dependency_mask |= required
+        cls.noble_legado_mask = sum(1 << (offsets[era] + idx) for era, idx in cls.noble_legado_indices.items())
+        RoomState.configure_layout(
+            [offsets[era] for era in cls.eras],
+            [len(cls.button_info[era]) for era in cls.eras]
+        )
+        cls.precompute_availability()
+    
+    @classmethod
+    def precompute_availability(cls):
+        """Precalcula la disponibilidad de botones para todos los estados de progreso relevantes"""
+        table = {}
+        nodes = cls.button_nodes
+        required_masks = cls.button_required_masks
+        
+        # Recorrer todos los submasks de dependency_mask (incluido el 0)
+        mask = cls.dependency_mask
+        while True:
+            available_mask = 0
+            available_buttons = {era: [] for era in cls.eras}
+            for node, (era, idx) in enumerate(nodes):
+                is_available = (mask & required_masks[node]) == required_masks[node]
+                if is_available:
+                    available_mask |= 1 << node
+                available_buttons[era].append(is_available)
+            table[mask] = (available_mask, available_buttons)
+            if mask == 0:
+                break
+            mask = (mask - 1) & cls.dependency_mask
+        
+        cls._availability_table = table
+    
+    @classmethod
+    def progress_mask(cls, progress):
+        """Codifica el progreso de una sala (17 botones) como un entero"""
+        mask = 0
+        bit = 1
+        for era in cls.eras:
+            for active in progress[era]:
+                if active:
+                    mask |= bit
+                bit <<= 1
+        return mask
+    
+    @classmethod
+    def lookup_available_mask(cls, mask):
+        """Devuelve el bitmask de botones disponibles para un bitmask de progreso (O(1))"""
+        return cls._availability_table[mask & cls.dependency_mask][0]
+    
+    @classmethod
+    def lookup_available_buttons(cls, mask):
+        """Devuelve la estructura available_buttons para un bitmask de progreso (O(1)).
+        
+        La estructura es compartida entre llamadas: no debe modificarse.
+        """
+        return cls._availability_table[mask & cls.dependency_mask][1]
+    
+    @classmethod
+    def button_delta(cls, before, after):
+        """Codifica un cambio de progreso como delta: el bitmask anterior (versión sobre la que se
+        aplica), los bits de progreso que cambian y los botones cuya disponibilidad cambia"""
+        return {
+            "base": before,
+            "changed": before ^ after,
+            "flips": cls.lookup_available_mask(before) ^ cls.lookup_available_mask(after)
+        }
+    
+    @classmethod
+    def button_node(cls, era, idx):
+        """Devuelve el id de nodo de un botón"""
+        return cls.button_offsets[era] + idx
+    
+    @classmethod
+    def activate_button(cls, progress, node):
+        """Activa un botón y los botones enlazados a él; devuelve el nuevo bitmask de progreso"""
+        progress |= 1 << node
+        for linked in cls.button_linked[node]:
+            progress |= 1 << linked
+        return progress
+    
+    @classmethod
+    def deactivate_button(cls, progress, node):
+        """Desactiva un botón y, en cascada, todos los botones activos que dependen de él;
+        devuelve el nuevo bitmask de progreso"""
+        dependents = cls.button_dependents
+        progress &= ~(1 << node)
+        
+        # Recorrido en anchura por las aristas inversas: solo se visitan los dependientes reales
+        pending = deque([node])
+        while pending:
+            current = pending.popleft()
+            for dependent in dependents[current]:
+                if progress >> dependent & 1:
+                    progress &= ~(1 << dependent)
+                    pending.append(dependent)
+        return progress
+    
+    @classmethod
+    def configure_storage(cls, storage):
+        """Establece el almacenamiento y carga en bloque el estado guardado"""
+        cls._storage.close()
+        cls._storage = storage
+        
+        rooms, global_counters = storage.load()
+        cls._rooms = rooms
+        cls._global_counters = global_counters
+        cls._new_version_epoch()
+        cls._victory_flags = {}
+        cls._victory_counts = [0, 0, 0]
+        for room_id in rooms:
+            cls.refresh_victory_conditions(room_id)
+        
+        # Reproducir las mutaciones registradas tras lo cargado sin volver a registrarlas
+        cls._storage = MemoryStorage()
+        storage.replay(cls.apply_record)
+        cls._storage = storage
+        storage.bind(lambda: (cls._rooms, cls._global_counters))
+        
+        cls._victory_announced = cls.victory_conditions_met()
+        cls.initialize_global_counters()
+    
+    @classmethod
+    def begin(cls, write=False):
+        """Empieza una petición: incorpora los cambios hechos por otros workers y, si la petición
+        modifica el estado, toma el lock de escritura del almacenamiento compartido"""
+        changes = cls._storage.begin(write)
+        if changes is None:
+            return
+        
+        full, rooms, documents = changes
+        if full:
+            cls._new_version_epoch()
+            cls._rooms = {}
+            cls._victory_flags = {}
+            cls._victory_counts = [0, 0, 0]
+            cls._global_counters = None
+        for room_id, room in rooms.items():
+            cls._rooms[room_id] = room
+            cls._room_versions[room_id] = next(cls._version_counter)
+            cls.refresh_victory_conditions(room_id)
+        if "globals" in documents:
+            cls._global_counters = documents["globals"]
+            cls._globals_version = next(cls._version_counter)
+        if "auth" in documents:
+            Auth.import_state(documents["auth"])
+        if full or rooms:
+            # La victoria provocada por otro worker ya la ha anunciado ese worker
+            cls._victory_announced = cls.victory_conditions_met()
+        if cls._global_counters is None:
+            cls.initialize_global_counters()
+    
+    @classmethod
+    def commit(cls):
+        """Confirma los cambios de la petición en el almacenamiento"""
+        cls._storage.commit()
+    
+    @classmethod
+    def rollback(cls):
+        """Descarta los cambios de la petición en el almacenamiento"""
+        cls._storage.rollback()
+    
+    @classmethod
+    def save_auth_state(cls):
+        """Comparte los grupos y códigos de mesa de Auth con el resto de workers"""
+        cls._storage.save_document("auth", Auth.export_state())
+    
+    @classmethod
+    def close_storage(cls):
+        """Escribe los cambios pendientes y cierra el almacenamiento"""
+        cls._storage.close()
+    
+    @classmethod
+    def _record(cls, kind, *fields):
+        """Registra una mutación tipada en el almacenamiento (ver app.models.journal); dentro de
+        atomic() no hace falta, el bloque registra al final el estado completo"""
+        if _held_changes.get() is None:
+            cls._storage.record(kind, *fields)
+    
+    @classmethod
+    def _room_changed(cls, room):
+        """Nueva versión de la sala y marca para persistir"""
+        cls._room_versions[room.room_id] = next(cls._version_counter)
+        held = _held_changes.get()
+        if held is not None:
+            held.rooms[room.room_id] = room
+        else:
+            cls._storage.mark_room_dirty(room)
+    
+    @classmethod
+    def _globals_changed(cls, global_counters):
+        """Nueva versión de los contadores globales y marca para persistir"""
+        cls._globals_version = next(cls._version_counter)
+        held = _held_changes.get()
+        if held is not None:
+            held.global_counters = global_counters
+        else:
+            cls._storage.mark_globals_dirty(global_counters)
+    
+    @classmethod
+    @contextlib.contextmanager
+    def atomic(cls, room_id):
+        """Aplica las mutaciones del bloque de una vez o ninguna (requiere los locks global y de
+        la sala room_id). Devuelve una función rollback() que restaura el estado del principio del
+        bloque: la sala room_id, los contadores (perdición y fluzo, que cambian en todas las salas
+        con el lock global al cambiar de ciclo) del resto de salas modificadas en el bloque, los
+        contadores globales y el índice de victoria. Si el bloque lanza una excepción también se
+        restaura.
+        
+        Dentro del bloque las mutaciones no se registran una a una: al terminar (también tras
+        rollback()) se registra de una vez el estado completo de las salas y contadores globales
+        modificados (MemoryStorage.record_state). Así el diario nunca contiene la mitad de un
+        bloque ni mutaciones deshechas, y sus registros son absolutos: si una rotación toma la
+        instantánea a mitad del bloque (otro greenlet escribe mientras este espera un lock), el
+        grupo posterior la corrige en lugar de aplicarse dos veces."""
+        room = cls.initialize_room_data(room_id)
+        global_counters = cls.initialize_global_counters()
+        saved_room = room.copy()
+        saved_globals = dict(global_counters)
+        saved_counters = {other.room_id: (other.counters[:], other.fluzo_set) for other in cls._rooms.values()}
+        saved_victory_announced = cls._victory_announced
+        
+        held = HeldChanges()
+        token = _held_changes.set(held)
+        
+        def rollback():
+            # La sala y los contadores se restauran en el sitio: el almacenamiento puede tener
+            # referencias pendientes de escribir a los mismos objetos
+            room.assign(saved_room)
+            changed = held.rooms
+            for other_id, other in changed.items():
+                saved = saved_counters.get(other_id)
+                if other is not room and saved is not None:
+                    with cls.room_lock(other_id):
+                        other.counters[:], other.fluzo_set = saved
+            for other_id in changed.keys() | {room_id}:
+                cls.refresh_victory_conditions(other_id)
+            global_counters.clear()
+            global_counters.update(saved_globals)
+            cls._global_counters = held.global_counters = global_counters
+            cls._victory_announced = saved_victory_announced
+        
+        try:
+            yield rollback
+        except BaseException:
+            rollback()
+            raise
+        finally:
+            _held_changes.reset(token)
+            # Las salas restauradas también se registran: una instantánea o escritura de SQLite
+            # hecha a mitad del bloque puede contener su estado intermedio
+            cls._storage.record_state(list(held.rooms.values()), held.global_counters)
+    
+    @classmethod
+    def _new_version_epoch(cls):
+        cls._version_epoch = secrets.token_hex(4)
+        cls._room_versions = {}
+        cls._globals_version = 0
+    
+    @classmethod
+    def room_version(cls, room_id):
+        """Versión del estado de una sala (crece con cada cambio)"""
+        return cls._room_versions.get(room_id, 0)
+    
+    @classmethod
+    def globals_version(cls):
+        """Versión de los contadores globales (crece con cada cambio)"""
+        return cls._globals_version
+    
+    @classmethod
+    def version_epoch(cls):
+        """Identificador del proceso y de la carga del estado a la que se refieren las versiones"""
+        return cls._version_epoch
+    
+    @classmethod
+    def room_lock(cls, room_id):
+        """Lock que serializa las mutaciones de una sala"""
+        lock = cls._room_locks.get(room_id)
+        if lock is None:
+            with cls._room_locks_guard:
+                lock = cls._room_locks.setdefault(room_id, threading.RLock())
+        return lock
+    
+    @classmethod
+    def global_lock(cls):
+        """Lock de los contadores globales y las transiciones entre salas (tomar antes que el de sala)"""
+        return cls._global_lock
     
     @classmethod
     def initialize_room_data(cls, room_id):
         """Inicializa o carga datos de una sala"""
-        room_key = f"room_{room_id}"
-        if room_key not in cls._game_data:
-            cls._game_data[room_key] = {
-                "progress": {
-                    "pasado": [False] * len(cls.button_info["pasado"]),
-                    "presente": [False] * len(cls.button_info["presente"]),
-                    "futuro": [False] * len(cls.button_info["futuro"])
-                },
-                "resources": {
-                    "pasado": 0,
-                    "presente": 0,
-                    "futuro": 0,
-                    "total": 0
-                },
-                "biff_defeats": {
-                    "pasado": 0,
-                    "presente": 0,
-                    "futuro": 0
-                },
-                "biff_disabled": {
-                    "pasado": False,
-                    "presente": False,
-                    "futuro": False
-                }
-            }
-        # Asegurar retrocompatibilidad: si el campo biff_disabled no existe, añadirlo
-        elif "biff_disabled" not in cls._game_data[room_key]:
-            cls._game_data[room_key]["biff_disabled"] = {
-                "pasado": False,
-                "presente": False,
-                "futuro": False
-            }
-        return cls._game_data[room_key]
+        room = cls._rooms.get(room_id)
+        if room is None:
+            room = cls._rooms[room_id] = RoomState(room_id)
+            # Registrar la nueva sala en el índice de victoria (no cumple ninguna condición)
+            cls._victory_flags[room_id] = (False, False, False)
+            cls._record(journal.RECORD_ROOM, room_id)
+            cls._room_changed(room)
+        return room
+    
+    @classmethod
+    def get_room(cls, room_id):
+        """Devuelve los datos de una sala si existen (sin crearlos)"""
+        return cls._rooms.get(room_id)
+    
+    @classmethod
+    def all_rooms(cls):
+        """Devuelve los datos de todas las salas inicializadas"""
+        return list(cls._rooms.values())
     
     @classmethod
     def initialize_global_counters(cls):
         """Inicializa los contadores globales"""
-        if "global_counters" not in cls._game_data:
-            cls._game_data["global_counters"] = {
+        if cls._global_counters is None:
+            cls._global_counters = {
                 "perdicion": 0,
                 "reserva": 0,
                 "perdicion_cycle": 1,  # Ciclo 1, 2 o 3
                 "consecuencias_imprevistas": False,  # Nuevo campo para Consecuencias Imprevistas
             }
-        else:
-            # Asegurar que los campos existan en datos existentes
-            if "perdicion_cycle" not in cls._game_data["global_counters"]:
-                cls._game_data["global_counters"]["perdicion_cycle"] = 1
-            if "consecuencias_imprevistas" not in cls._game_data["global_counters"]:
-                cls._game_data["global_counters"]["consecuencias_imprevistas"] = False
-    
-        return cls._game_data["global_counters"]
+            cls._globals_changed(cls._global_counters)
+        return cls._global_counters
     
     @classmethod
     def initialize_room_column_totals(cls, room_id):
-        """Inicializa los contadores por columna en una sala"""
-        room_key = f"room_{room_id}"
-        room_data = cls.initialize_room_data(room_id)
-        
-        if "column_totals" not in room_data:
-            room_data["column_totals"] = {
-                "pasado": {
-                    "perdicion": 0,
-                    "reserva": 0
-                },
-                "presente": {
-                    "perdicion": 0,
-                    "reserva": 0
-                },
-                "futuro": {
-                    "perdicion": 0,
-                    "reserva": 0
-                }
-            }
-        # Asegurar compatibilidad con versiones anteriores
-        elif not isinstance(room_data["column_totals"].get("perdicion", {}), dict):
-            # Convertir formato antiguo a nuevo formato
-            old_totals = room_data["column_totals"].copy()
-            room_data["column_totals"] = {
-                "pasado": {
-                    "perdicion": 0,
-                    "reserva": 0
-                },
-                "presente": {
-                    "perdicion": 0,
-                    "reserva": 0
-                },
-                "futuro": {
-                    "perdicion": 0,
-                    "reserva": 0
-                }
-            }
-        
-        return room_data["column_totals"]
+        """Inicializa la sala y devuelve sus contadores por columna con el formato {era: {...}}"""
+        return cls.initialize_room_data(room_id).column_totals_dict()
     
     @classmethod
-    def save_column_totals(cls, room_id, column_totals):
-        """Guarda los totales de columna en la estructura de datos en memoria"""
-        room_key = f"room_{room_id}"
-        if room_key in cls._game_data:
-            cls._game_data[room_key]["column_totals"] = column_totals
+    def save_global_counters(cls, global_counters):
+        """Guarda los contadores globales en memoria y los marca para persistir"""
+        cls._global_counters = global_counters
+        cls._globals_changed(global_counters)
         return True
     
+    # ---- Mutaciones de salas ----
+    # Todas las modificaciones del estado de una sala pasan por estos métodos para mantener
+    # actualizados los índices derivados (condiciones de victoria) y marcar la sala para persistir
+    
     @classmethod
-    def save_global_counters(cls, global_counters):
-        """Guarda los contadores globales en la estructura de datos en memoria"""
-        cls._game_data["global_counters"] = global_counters
-        return True
+    def toggle_button(cls, room_id, era, button_idx, force=False):
+        """Activa o desactiva un botón de anuncio; devuelve True si se intentaba activar.
+        
+        Al activar se respetan las dependencias salvo que force sea True (admins) y se activan los
+        botones enlazados; al desactivar se desactivan en cascada los botones dependientes.
+        """
+        if not 0 <= button_idx < len(cls.button_info[era]):
+            raise IndexError("list index out of range")
+        
+        room = cls.initialize_room_data(room_id)
+        node = cls.button_node(era, button_idx)
+        is_activating = not room.is_active(node)
+        
+        if is_activating:
+            if not force and not cls.lookup_available_mask(room.progress) >> node & 1:
+                # Activación rechazada por las dependencias: sin cambios que registrar
+                return is_activating
+            room.progress = cls.activate_button(room.progress, node)
+        else:
+            room.progress = cls.deactivate_button(room.progress, node)
+        
+        cls.refresh_victory_conditions(room_id)
+        cls._record(journal.RECORD_PROGRESS, room_id, room.progress)
+        cls._room_changed(room)
+        return is_activating
+    
+    @classmethod
+    def reset_era_progress(cls, room_id, era):
+        """Desmarca todos los anuncios de una era"""
+        room = cls.initialize_room_data(room_id)
+        room.clear_era_progress(era)
+        cls.refresh_victory_conditions(room_id)
+        cls._record(journal.RECORD_PROGRESS, room_id, room.progress)
+        cls._room_changed(room)
+    
+    @classmethod
+    def set_column_value(cls, room_id, era, column, value):
+        """Establece el valor de un contador de columna de una sala"""
+        room = cls.initialize_room_data(room_id)
+        room.set_counter(era, column, value)
+        if column == "fluzo":
+            cls.refresh_victory_conditions(room_id)
+        cls._record(journal.RECORD_COUNTER_SET, room_id, ERA_INDEX[era], COLUMN_INDEX[column], value)
+        cls._room_changed(room)
+        return value
+    
+    @classmethod
+    def add_column_value(cls, room_id, era, column, amount):
+        """Suma una cantidad a un contador de columna de una sala; devuelve el nuevo valor"""
+        room = cls.initialize_room_data(room_id)
+        value = room.get_counter(era, column) + amount
+        room.set_counter(era, column, value)
+        if column == "fluzo":
+            cls.refresh_victory_conditions(room_id)
+        cls._record(journal.RECORD_COUNTER_SET, room_id, ERA_INDEX[era], COLUMN_INDEX[column], value)
+        cls._room_changed(room)
+        return value
+    
+    @classmethod
+    def add_resources(cls, room_id, era, amount):
+        """Suma recursos a una era y al total de la sala"""
+        room = cls.initialize_room_data(room_id)
+        room.resources[ERA_INDEX[era]] += amount
+        room.resources[-1] += amount
+        cls._record(journal.RECORD_RESOURCES_SET, room_id, ERA_INDEX[era], room.resources[ERA_INDEX[era]],
+                    room.resources[-1])
+        cls._room_changed(room)
+        return room.resources_dict()
+    
+    @classmethod
+    def add_biff_defeat(cls, room_id, era, disable=False):
+        """Suma una derrota de Biff y opcionalmente lo añade a la zona de victoria"""
+        room = cls.initialize_room_data(room_id)
+        room.biff_defeats[ERA_INDEX[era]] += 1
+        if disable:
+            room.set_biff_disabled(era, True)
+            cls.refresh_victory_conditions(room_id)
+        cls._record(journal.RECORD_BIFF_SET, room_id, ERA_INDEX[era], room.biff_defeats[ERA_INDEX[era]],
+                    room.is_biff_disabled(era))
+        cls._room_changed(room)
+        return room.biff_defeats[ERA_INDEX[era]]
+    
+    @classmethod
+    def reset_biff(cls, room_id, era):
+        """Resetea las derrotas de Biff y su estado de desactivación en una era"""
+        room = cls.initialize_room_data(room_id)
+        room.biff_defeats[ERA_INDEX[era]] = 0
+        room.set_biff_disabled(era, False)
+        cls.refresh_victory_conditions(room_id)
+        cls._record(journal.RECORD_BIFF_RESET, room_id, ERA_INDEX[era])
+        cls._room_changed(room)
     
     @classmethod
     def reset_perdicion_all_rooms(cls):
         """Reinicia el contador de perdición en todas las salas"""
-        # Iterar por todas las salas
-        for key in list(cls._game_data.keys()):
-            # Solo procesar las llaves que corresponden a salas
-            if key.startswith("room_"):
-                # Asegurarse de que existe la estructura de column_totals
-                if "column_totals" in cls._game_data[key]:
-                    # Reiniciar el contador de perdición para todas las eras en esta sala
-                    for era in ["pasado", "presente", "futuro"]:
-                        if era in cls._game_data[key]["column_totals"]:
-                            cls._game_data[key]["column_totals"][era]["perdicion"] = 0
+        for room in cls._rooms.values():
+            for era in ERAS:
+                room.set_counter(era, "perdicion", 0)
+            cls._room_changed(room)
+        cls._record(journal.RECORD_PERDICION_RESET)
         
         return True
     
+    @classmethod
+    def apply_record(cls, kind, fields):
+        """Aplica un registro del diario de mutaciones (ver app.models.journal)"""
+        if kind == journal.RECORD_ROOM:
+            cls.initialize_room_data(*fields)
+        elif kind == journal.RECORD_TOGGLE:
+            room_id, node, force = fields
+            era, idx = cls.button_nodes[node]
+            cls.toggle_button(room_id, era, idx, force=force)
+        elif kind == journal.RECORD_ERA_RESET:
+            room_id, era_idx = fields
+            cls.reset_era_progress(room_id, ERAS[era_idx])
+        elif kind == journal.RECORD_COUNTER_SET:
+            room_id, era_idx, column_idx, value = fields
+            cls.set_column_value(room_id, ERAS[era_idx], COLUMNS[column_idx], value)
+        elif kind == journal.RECORD_COUNTER_DELTA:
+            room_id, era_idx, column_idx, amount = fields
+            cls.add_column_value(room_id, ERAS[era_idx], COLUMNS[column_idx], amount)
+        elif kind == journal.RECORD_RESOURCES:
+            room_id, era_idx, amount = fields
+            cls.add_resources(room_id, ERAS[era_idx], amount)
+        elif kind == journal.RECORD_BIFF_DEFEAT:
+            room_id, era_idx, disable = fields
+            cls.add_biff_defeat(room_id, ERAS[era_idx], disable=disable)
+        elif kind == journal.RECORD_BIFF_RESET:
+            room_id, era_idx = fields
+            cls.reset_biff(room_id, ERAS[era_idx])
+        elif kind == journal.RECORD_PERDICION_RESET:
+            cls.reset_perdicion_all_rooms()
+        elif kind == journal.RECORD_GLOBALS:
+            cls.save_global_counters(fields[0])
+        elif kind == journal.RECORD_PROGRESS:
+            room_id, progress = fields
+            room = cls.initialize_room_data(room_id)
+            room.progress = progress
+            cls.refresh_victory_conditions(room_id)
+            cls._room_changed(room)
+        elif kind == journal.RECORD_RESOURCES_SET:
+            room_id, era_idx, value, total = fields
+            room = cls.initialize_room_data(room_id)
+            room.resources[era_idx] = value
+            room.resources[-1] = total
+            cls._room_changed(room)
+        elif kind == journal.RECORD_BIFF_SET:
+            room_id, era_idx, defeats, disabled = fields
+            room = cls.initialize_room_data(room_id)
+            room.biff_defeats[era_idx] = defeats
+            room.set_biff_disabled(ERAS[era_idx], disabled)
+            cls.refresh_victory_conditions(room_id)
+            cls._room_changed(room)
+        elif kind == journal.RECORD_ROOM_STATE:
+            state = journal.decode_room_state(fields)
+            room = cls.initialize_room_data(state.room_id)
+            room.assign(state)
+            cls.refresh_victory_conditions(state.room_id)
+            cls._room_changed(room)
+    
+    @classmethod
+    def refresh_victory_conditions(cls, room_id):
+        """Recalcula las condiciones de victoria de una sala y actualiza el índice en O(1)"""
+        room = cls._rooms.get(room_id)
+        if room is None:
+            return
+        
+        all_eras = (1 << len(ERAS)) - 1
+        flags = (
+            room.biff_disabled == all_eras,
+            room.fluzo_set == all_eras and all(room.get_counter(era, "fluzo") == 81 for era in ERAS),
+            room.progress & cls.noble_legado_mask == cls.noble_legado_mask
+        )
+        
+        old_flags = cls._victory_flags.get(room_id, (False, False, False))
+        for i in range(3):
+            cls._victory_counts[i] += flags[i] - old_flags[i]
+        cls._victory_flags[room_id] = flags
+    
+    @classmethod
+    def all_rooms_fluzo_81(cls):
+        """Indica si todas las salas tienen fluzo == 81 en todas las eras (lectura en O(1))"""
+        return cls._victory_counts[1] == len(cls._victory_flags)
+    
+    @classmethod
+    def victory_conditions_met(cls):
+        """Indica si todas las salas cumplen las tres condiciones de victoria (lectura en O(1))"""
+        room_count = len(cls._victory_flags)
+        if not room_count:
+            return False  # No hay salas para verificar
+        return all(count == room_count for count in cls._victory_counts)
+    
+    @classmethod
+    def mark_victory_announced(cls, victory_conditions_met):
+        """Registra el último resultado anunciado; devuelve True si acaba de cumplirse la victoria"""
+        with cls._victory_lock:
+            changed = victory_conditions_met and not cls._victory_announced
+            cls._victory_announced = victory_conditions_met
+        return changed
+    
     @classmethod
     def reset_all_data(cls):
         """Resetea todos los datos del juego"""
-        cls._game_data = {}
+        cls._rooms = {}
+        cls._global_counters = None
+        cls._victory_flags = {}
+        cls._victory_counts = [0, 0, 0]
+        cls._victory_announced = False
+        cls._storage.clear()
         # Inicializar contadores globales para evitar errores
         cls.initialize_global_counters()
-        return True
\ No newline at end of file
+        return True
+
+
+# Compilar el grafo de botones una sola vez al importar el módulo
+GameData.compile_button_graph()
@@ -0,0 +1,378 @@
+import json
+import logging
+import os
+import re
+import struct
+import time
+
+from .room_state import RoomState
+from .storage import MemoryStorage
+from .. import threads
+
+logger = logging.getLogger(__name__)
+
+# Tipos de registro del diario de mutaciones. Las eras y columnas se codifican con su índice
+# en ERAS y COLUMNS, y los botones con su id de nodo en el grafo de GameData.
+#
+# Los registros que se escriben guardan valores absolutos (el resultado de la mutación), de modo
+# que reproducir uno cuyo efecto ya recoge la instantánea no cambia nada: GameData modifica la
+# memoria antes de registrar, y una rotación de otro hilo o greenlet entre ambos pasos toma la
+# instantánea con la mutación incluida y deja su registro detrás. Los tipos marcados como
+# antiguos (deltas) solo se leen, para reproducir diarios escritos antes de este formato.
+RECORD_ROOM = 1             # sala creada: room_id
+RECORD_TOGGLE = 2           # (antiguo) botón pulsado: room_id, nodo, forzado
+RECORD_ERA_RESET = 3        # (antiguo) anuncios de una era desmarcados: room_id, era
+RECORD_COUNTER_SET = 4      # contador fijado (incluye ajustes de fluzo): room_id, era, columna, valor
+RECORD_COUNTER_DELTA = 5    # (antiguo) cantidad sumada a un contador: room_id, era, columna, cantidad
+RECORD_RESOURCES = 6        # (antiguo) recursos sumados: room_id, era, cantidad
+RECORD_BIFF_DEFEAT = 7      # (antiguo) derrota de Biff: room_id, era, añadido a la zona de victoria
+RECORD_BIFF_RESET = 8       # Biff reseteado: room_id, era
+RECORD_PERDICION_RESET = 9  # perdición a 0 en todas las salas (cambio de ciclo)
+RECORD_GLOBALS = 10         # contadores globales (ciclo de perdición, totales): JSON
+RECORD_ROOM_STATE = 11      # estado completo de una sala: room_id, progress, fluzo_set,
+                            # biff_disabled y los arrays de RoomState (grupos de GameData.atomic)
+RECORD_PROGRESS = 12        # progreso de anuncios: room_id, bitmask
+RECORD_RESOURCES_SET = 13   # recursos: room_id, era, recursos de la era, total
+RECORD_BIFF_SET = 14        # Biff: room_id, era, derrotas, en la zona de victoria
+
+# Formato binario de los campos de cada tipo (el registro empieza por un byte con el tipo)
+RECORD_FORMATS = {
+    RECORD_ROOM: struct.Struct('<I'),
+    RECORD_TOGGLE: struct.Struct('<IB?'),
+    RECORD_ERA_RESET: struct.Struct('<IB'),
+    RECORD_COUNTER_SET: struct.Struct('<IBBi'),
+    RECORD_COUNTER_DELTA: struct.Struct('<IBBi'),
+    RECORD_RESOURCES: struct.Struct('<IBi'),
+    RECORD_BIFF_DEFEAT: struct.Struct('<IB?'),
+    RECORD_BIFF_RESET: struct.Struct('<IB'),
+    RECORD_PERDICION_RESET: struct.Struct('<'),
+    RECORD_PROGRESS: struct.Struct('<II'),
+    RECORD_RESOURCES_SET: struct.Struct('<IBii'),
+    RECORD_BIFF_SET: struct.Struct('<IBi?'),
+}
+# Los arrays de una sala tienen tamaño fijo (mismo orden que RoomState.to_row)
+_ROW_TEMPLATE = RoomState(0).to_row()
+RECORD_FORMATS[RECORD_ROOM_STATE] = struct.Struct(
+    f'<IIBB{len(_ROW_TEMPLATE[2])}s{len(_ROW_TEMPLATE[4])}s{len(_ROW_TEMPLATE[5])}s')
+# Los contadores globales son un JSON de longitud variable precedido por su tamaño
+GLOBALS_LENGTH = struct.Struct('<H')
+
+SNAPSHOT_MAGIC = b'AHS1'
+SNAPSHOT_HEADER = struct.Struct('<II')          # tamaño del JSON global, número de salas
+SNAPSHOT_ROOM = struct.Struct('<IIBB')          # room_id, progress, fluzo_set, biff_disabled
+
+SEGMENT_PATTERN = re.compile(r'^(journal|snapshot)-(\d{8})\.bin$')
+
+
+def encode_record(kind, *fields):
+    """Codifica un registro del diario"""
+    if kind == RECORD_GLOBALS:
+        data = json.dumps(fields[0], separators=(',', ':')).encode('utf-8')
+        return bytes((kind,)) + GLOBALS_LENGTH.pack(len(data)) + data
+    return bytes((kind,)) + RECORD_FORMATS[kind].pack(*fields)
+
+
+def encode_room_state(room):
+    """Codifica el estado completo de una sala como registro RECORD_ROOM_STATE"""
+    room_id, progress, counters, fluzo_set, resources, biff_defeats, biff_disabled = room.to_row()
+    return encode_record(RECORD_ROOM_STATE, room_id, progress, fluzo_set, biff_disabled,
+                         counters, resources, biff_defeats)
+
+
+def decode_room_state(fields):
+    """Reconstruye la sala de los campos de un registro RECORD_ROOM_STATE"""
+    room_id, progress, fluzo_set, biff_disabled, counters, resources, biff_defeats = fields
+    return RoomState.from_row((room_id, progress, counters, fluzo_set, resources, biff_defeats, biff_disabled))
+
+
+def iter_records(data):
+    """Decodifica los registros de un segmento; un registro final incompleto (escritura
+    interrumpida) se descarta"""
+    formats = RECORD_FORMATS
+    offset = 0
+    end = len(data)
+    while offset < end:
+        kind = data[offset]
+        offset += 1
+        if kind == RECORD_GLOBALS:
+            if offset + GLOBALS_LENGTH.size > end:
+                return
+            (length,) = GLOBALS_LENGTH.unpack_from(data, offset)
+            offset += GLOBALS_LENGTH.size
+            if offset + length > end:
+                return
+            yield kind, (json.loads(data[offset:offset + length]),)
+            offset += length
+        else:
+            record_format = formats.get(kind)
+            if record_format is None or offset + record_format.size > end:
+                return
+            yield kind, record_format.unpack_from(data, offset)
+            offset += record_format.size
+
+
+def encode_snapshot(rooms, global_counters):
+    """Codifica una instantánea compacta de todas las salas y los contadores globales"""
+    globals_data = json.dumps(global_counters, separators=(',', ':')).encode('utf-8')
+    parts = [SNAPSHOT_MAGIC, SNAPSHOT_HEADER.pack(len(globals_data), len(rooms)), globals_data]
+    for room in rooms.values():
+        room_id, progress, counters, fluzo_set, resources, biff_defeats, biff_disabled = room.to_row()
+        parts.append(SNAPSHOT_ROOM.pack(room_id, progress, fluzo_set, biff_disabled))
+        parts.append(counters)
+        parts.append(resources)
+        parts.append(biff_defeats)
+    return b''.join(parts)
+
+
+def decode_snapshot(data):
+    """Decodifica una instantánea generada por encode_snapshot"""
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError("Instantánea no válida")
+    offset = len(SNAPSHOT_MAGIC)
+    globals_size, room_count = SNAPSHOT_HEADER.unpack_from(data, offset)
+    offset += SNAPSHOT_HEADER.size
+    global_counters = json.loads(data[offset:offset + globals_size])
+    offset += globals_size
+
+    # Tamaño en bytes de los arrays de una sala (mismo orden que RoomState.to_row)
+    template = RoomState(0).to_row()
+    sizes = (len(template[2]), len(template[4]), len(template[5]))
+
+    rooms = {}
+    for _ in range(room_count):
+        room_id, progress, fluzo_set, biff_disabled = SNAPSHOT_ROOM.unpack_from(data, offset)
+        offset += SNAPSHOT_ROOM.size
+        arrays = []
+        for size in sizes:
+            arrays.append(data[offset:offset + size])
+            offset += size
+        rooms[room_id] = RoomState.from_row(
+            (room_id, progress, arrays[0], fluzo_set, arrays[1], arrays[2], biff_disabled))
+    return rooms, global_counters
+
+
+class JournalStorage(MemoryStorage):
+    """Almacenamiento basado en un diario de mutaciones de solo escritura al final.
+
+    Cada mutación de GameData se añade como un registro binario tipado al segmento actual
+    (journal-NNNNNNNN.bin). Cuando el segmento supera segment_bytes, o ha pasado
+    snapshot_interval segundos desde la última instantánea, se toma una instantánea compacta
+    del estado completo (snapshot-NNNNNNNN.bin) y se empieza un segmento nuevo. Al arrancar se
+    carga la última instantánea válida y solo se reproducen los segmentos posteriores. Se
+    conservan la instantánea anterior y sus segmentos (por si la última no se puede leer) y
+    retained_segments segmentos más antiguos; el resto se borra, por lo que el espacio en disco
+    está acotado.
+
+    Las escrituras en disco las hace un hilo en segundo plano cada flush_interval segundos (un
+    hilo del sistema operativo también bajo gevent, ver app.threads).
+    """
+
+    def __init__(self, directory, segment_bytes=1024 * 1024, retained_segments=3,
+                 snapshot_interval=300, flush_interval=0.005):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retained_segments = retained_segments
+        self.snapshot_interval = snapshot_interval
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._state_provider = None
+        # Primer segmento a reproducir (el de la última instantánea) y si hay que tomar una
+        # instantánea nueva al terminar la reproducción
+        self._replay_from = 0
+        self._snapshot_after_replay = False
+        self._lock = threads.allocate_lock()
+        self._write_lock = threads.allocate_lock()
+        # Operaciones pendientes de escribir, en orden: ("append", seq, bytearray) o
+        # ("snapshot", seq, bytes)
+        self._pending = []
+        self._segment_seq = 0
+        self._segment_size = 0
+        self._last_snapshot = time.monotonic()
+        self._journal_file = None
+        self._journal_file_seq = None
+        self._wakeup = threads.Wakeup()
+        self._closed = False
+
+        self._writer = threads.BackgroundThread(target=self._run_writer, name="journal-writer")
+        self._writer.start()
+
+    def _path(self, kind, seq):
+        return os.path.join(self.directory, f"{kind}-{seq:08d}.bin")
+
+    def _list_files(self):
+        """Devuelve {"journal": [seq, ...], "snapshot": [seq, ...]} ordenados"""
+        files = {"journal": [], "snapshot": []}
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                files[match.group(1)].append(int(match.group(2)))
+        for seqs in files.values():
+            seqs.sort()
+        return files
+
+    def load(self):
+        """Carga la última instantánea válida"""
+        files = self._list_files()
+        rooms, global_counters = {}, None
+        for seq in reversed(files["snapshot"]):
+            try:
+                with open(self._path("snapshot", seq), 'rb') as f:
+                    rooms, global_counters = decode_snapshot(f.read())
+                self._replay_from = seq
+                break
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning(f"Instantánea {seq} no válida, se usa la anterior: {str(e)}")
+        else:
+            # Los segmentos anteriores a las instantáneas conservadas pueden estar borrados:
+            # reproducir solo el diario restante daría totales incorrectos
+            if files["snapshot"]:
+                raise RuntimeError(f"Ninguna instantánea de {self.directory} es válida; no se puede "
+                                   f"reconstruir el estado a partir del diario")
+
+        # Las nuevas mutaciones van a un segmento nuevo, posterior a todos los existentes
+        existing = files["journal"] + files["snapshot"]
+        self._segment_seq = (max(existing) + 1) if existing else 0
+        self._segment_size = 0
+        return rooms, global_counters
+
+    def replay(self, apply_record):
+        """Reproduce los segmentos posteriores a la instantánea cargada"""
+        replayed = False
+        for seq in self._list_files()["journal"]:
+            if seq < self._replay_from:
+                continue
+            with open(self._path("journal", seq), 'rb') as f:
+                data = f.read()
+            for kind, fields in iter_records(data):
+                apply_record(kind, fields)
+                replayed = True
+
+        # Tomar una instantánea tras la reproducción (en bind) para que el próximo arranque
+        # no tenga que volver a reproducir los mismos registros
+        self._snapshot_after_replay = replayed
+
+    def bind(self, state_provider):
+        """Recibe la función que devuelve el estado actual para tomar instantáneas"""
+        self._state_provider = state_provider
+        if self._snapshot_after_replay:
+            self._snapshot_after_replay = False
+            with self._lock:
+                self._rotate()
+            self._wakeup.set()
+
+    def record(self, kind, *fields):
+        """Añade un registro al segmento actual (en memoria; lo escribe el hilo en segundo plano)"""
+        self._append(encode_record(kind, *fields))
+
+    def mark_globals_dirty(self, global_counters):
+        """Registra los contadores globales completos"""
+        self._append(encode_record(RECORD_GLOBALS, global_counters))
+
+    def record_state(self, rooms, global_counters=None):
+        """Añade el estado de las salas y los contadores globales de una sola vez: si toca rotar,
+        la instantánea se toma después del grupo completo y ningún registro suyo queda detrás"""
+        data = b''.join(encode_room_state(room) for room in rooms)
+        if global_counters is not None:
+            data += encode_record(RECORD_GLOBALS, global_counters)
+        if data:
+            self._append(data)
+
+    def clear(self):
+        """Empieza un segmento nuevo a partir de una instantánea del estado (vacío tras un reset)"""
+        with self._lock:
+            self._rotate()
+        self._wakeup.set()
+
+    def _append(self, data):
+        with self._lock:
+            pending = self._pending
+            if not pending or pending[-1][0] != "append" or pending[-1][1] != self._segment_seq:
+                pending.append(("append", self._segment_seq, bytearray()))
+            pending[-1][2].extend(data)
+            self._segment_size += len(data)
+
+            # Rotar dentro del lock para que la instantánea y el diario queden alineados
+            if (self._segment_size >= self.segment_bytes or
+                    time.monotonic() - self._last_snapshot >= self.snapshot_interval):
+                self._rotate()
+        self._wakeup.set()
+
+    def _rotate(self):
+        """Toma una instantánea del estado actual y empieza un segmento nuevo (requiere el lock)"""
+        if self._state_provider is None:
+            return
+        rooms, global_counters = self._state_provider()
+        self._segment_seq += 1
+        self._segment_size = 0
+        self._last_snapshot = time.monotonic()
+        self._pending.append(("snapshot", self._segment_seq, encode_snapshot(rooms, global_counters)))
+
+    def flush(self):
+        """Escribe en disco los registros e instantáneas pendientes"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+
+            for operation, seq, data in pending:
+                if operation == "append":
+                    if self._journal_file_seq != seq:
+                        if self._journal_file is not None:
+                            self._journal_file.close()
+                        self._journal_file = open(self._path("journal", seq), 'ab')
+                        self._journal_file_seq = seq
+                    self._journal_file.write(data)
+                else:
+                    if self._journal_file is not None:
+                        self._journal_file.flush()
+                        os.fsync(self._journal_file.fileno())
+                    # Escritura atómica: el fichero temporal solo se renombra una vez completo
+                    path = self._path("snapshot", seq)
+                    with open(path + '.tmp', 'wb') as f:
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(path + '.tmp', path)
+                    self._prune(seq)
+
+            if self._journal_file is not None:
+                self._journal_file.flush()
+
+    def _prune(self, snapshot_seq):
+        """Borra las instantáneas anteriores a la previa a snapshot_seq y los segmentos que ya
+        no hacen falta para reproducir desde la previa, salvo los retained_segments últimos"""
+        files = self._list_files()
+        previous = [seq for seq in files["snapshot"] if seq < snapshot_seq]
+        keep_from = previous[-1] if previous else snapshot_seq
+        for seq in previous[:-1]:
+            os.remove(self._path("snapshot", seq))
+        old_segments = [seq for seq in files["journal"] if seq < keep_from]
+        for seq in old_segments[:max(0, len(old_segments) - self.retained_segments)]:
+            if seq != self._journal_file_seq:
+                os.remove(self._path("journal", seq))
+
+    def close(self):
+        """Detiene el hilo de escritura, escribe lo pendiente y cierra el segmento actual"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._writer.join(timeout=5)
+        self.flush()
+        if self._journal_file is not None:
+            os.fsync(self._journal_file.fileno())
+            self._journal_file.close()
+            self._journal_file = None
+
+    def _run_writer(self):
+        """Bucle del hilo de escritura: espera registros y los agrupa durante flush_interval"""
+        while not self._closed:
+            self._wakeup.wait()
+            if self._closed:
+                break
+            threads.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception(f"Error al escribir el diario de mutaciones: {str(e)}")
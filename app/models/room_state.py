@@ -0,0 +1,184 @@
+from array import array
+
+# Eras y columnas de contadores, en el orden usado para indexar los arrays compactos
+ERAS = ("pasado", "presente", "futuro")
+COLUMNS = ("perdicion", "reserva", "fluzo")
+
+ERA_INDEX = {era: i for i, era in enumerate(ERAS)}
+COLUMN_INDEX = {column: i for i, column in enumerate(COLUMNS)}
+FLUZO = COLUMN_INDEX["fluzo"]
+
+# Rango de los contadores y recursos (arrays de enteros de 32 bits)
+COUNTER_MIN = -2 ** 31
+COUNTER_MAX = 2 ** 31 - 1
+
+
+def fits_counter(*values):
+    """Indica si los valores caben en los contadores de una sala"""
+    return all(COUNTER_MIN <= value <= COUNTER_MAX for value in values)
+
+
+class RoomState:
+    """Estado compacto de una sala (grupo).
+
+    El progreso de los anuncios se guarda como bitmask (un bit por botón, numerados según el grafo
+    de GameData) y los contadores en arrays de enteros de tamaño fijo, indexados por (era, columna).
+    Los métodos *_dict generan las mismas estructuras JSON que usaban los diccionarios anidados.
+    """
+
+    __slots__ = ("room_id", "progress", "counters", "fluzo_set", "resources",
+                 "biff_defeats", "biff_disabled")
+
+    # Disposición de los botones: offset del primer botón de cada era y número de botones
+    # (la configura GameData al compilar el grafo de botones)
+    era_offsets = (0, 0, 0)
+    era_sizes = (0, 0, 0)
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.progress = 0
+        # counters[era * 3 + columna]: perdición, reserva y fluzo de cada era
+        self.counters = array('i', bytes(4 * len(ERAS) * len(COLUMNS)))
+        # Bitmask de eras en las que ya se ha fijado un valor de fluzo
+        self.fluzo_set = 0
+        # resources: pasado, presente, futuro y total
+        self.resources = array('i', bytes(4 * (len(ERAS) + 1)))
+        self.biff_defeats = array('i', bytes(4 * len(ERAS)))
+        # Bitmask de eras en las que Biff ha sido añadido a la zona de victoria
+        self.biff_disabled = 0
+
+    @classmethod
+    def configure_layout(cls, era_offsets, era_sizes):
+        """Establece la disposición de los botones de cada era dentro del bitmask de progreso"""
+        cls.era_offsets = tuple(era_offsets)
+        cls.era_sizes = tuple(era_sizes)
+
+    # ---- Progreso de anuncios ----
+
+    def is_active(self, node):
+        """Indica si un botón (id de nodo) está activo"""
+        return bool(self.progress >> node & 1)
+
+    def set_active(self, node, value):
+        """Activa o desactiva un botón (id de nodo)"""
+        if value:
+            self.progress |= 1 << node
+        else:
+            self.progress &= ~(1 << node)
+
+    def era_progress(self, era):
+        """Lista de booleanos con el progreso de una era"""
+        era_idx = ERA_INDEX[era]
+        bits = self.progress >> self.era_offsets[era_idx]
+        return [bool(bits >> i & 1) for i in range(self.era_sizes[era_idx])]
+
+    def clear_era_progress(self, era):
+        """Desmarca todos los anuncios de una era"""
+        era_idx = ERA_INDEX[era]
+        era_mask = ((1 << self.era_sizes[era_idx]) - 1) << self.era_offsets[era_idx]
+        self.progress &= ~era_mask
+
+    def progress_dict(self):
+        """Progreso con el formato {era: [bool, ...]}"""
+        return {era: self.era_progress(era) for era in ERAS}
+
+    # ---- Contadores por columna ----
+
+    def get_counter(self, era, column):
+        """Valor de un contador de columna"""
+        return self.counters[ERA_INDEX[era] * 3 + COLUMN_INDEX[column]]
+
+    def set_counter(self, era, column, value):
+        """Establece el valor de un contador de columna"""
+        era_idx = ERA_INDEX[era]
+        column_idx = COLUMN_INDEX[column]
+        self.counters[era_idx * 3 + column_idx] = value
+        if column_idx == FLUZO:
+            self.fluzo_set |= 1 << era_idx
+
+    def has_fluzo(self, era):
+        """Indica si ya se ha fijado un valor de fluzo en la era"""
+        return bool(self.fluzo_set >> ERA_INDEX[era] & 1)
+
+    def column_totals(self, era):
+        """Contadores de una era con el formato {"perdicion", "reserva"[, "fluzo"]}"""
+        base = ERA_INDEX[era] * 3
+        totals = {
+            "perdicion": self.counters[base],
+            "reserva": self.counters[base + 1]
+        }
+        # El campo fluzo solo aparece una vez que se ha fijado un valor en la era
+        if self.fluzo_set >> ERA_INDEX[era] & 1:
+            totals["fluzo"] = self.counters[base + FLUZO]
+        return totals
+
+    def column_totals_dict(self):
+        """Contadores de todas las eras con el formato {era: {...}}"""
+        return {era: self.column_totals(era) for era in ERAS}
+
+    # ---- Recursos y Biff ----
+
+    def resources_dict(self):
+        """Recursos con el formato {"pasado", "presente", "futuro", "total"}"""
+        resources = self.resources
+        return {
+            "pasado": resources[0],
+            "presente": resources[1],
+            "futuro": resources[2],
+            "total": resources[3]
+        }
+
+    def is_biff_disabled(self, era):
+        """Indica si Biff ha sido añadido a la zona de victoria en la era"""
+        return bool(self.biff_disabled >> ERA_INDEX[era] & 1)
+
+    def set_biff_disabled(self, era, value):
+        """Marca o desmarca a Biff como añadido a la zona de victoria en la era"""
+        if value:
+            self.biff_disabled |= 1 << ERA_INDEX[era]
+        else:
+            self.biff_disabled &= ~(1 << ERA_INDEX[era])
+
+    def biff_defeats_dict(self):
+        """Derrotas de Biff con el formato {era: int}"""
+        return {era: self.biff_defeats[i] for i, era in enumerate(ERAS)}
+
+    def biff_disabled_dict(self):
+        """Estado de desactivación de Biff con el formato {era: bool}"""
+        return {era: bool(self.biff_disabled >> i & 1) for i, era in enumerate(ERAS)}
+
+    # ---- Copias ----
+
+    def copy(self):
+        """Copia independiente de la sala"""
+        return RoomState.from_row(self.to_row())
+
+    def assign(self, other):
+        """Sustituye en el sitio el estado de la sala por el de other"""
+        self.progress = other.progress
+        self.counters[:] = other.counters
+        self.fluzo_set = other.fluzo_set
+        self.resources[:] = other.resources
+        self.biff_defeats[:] = other.biff_defeats
+        self.biff_disabled = other.biff_disabled
+
+    # ---- Persistencia ----
+
+    def to_row(self):
+        """Serializa la sala como fila (room_id, progress, counters, fluzo_set, resources,
+        biff_defeats, biff_disabled); los arrays se guardan como bytes"""
+        return (self.room_id, self.progress, self.counters.tobytes(), self.fluzo_set,
+                self.resources.tobytes(), self.biff_defeats.tobytes(), self.biff_disabled)
+
+    @classmethod
+    def from_row(cls, row):
+        """Reconstruye una sala a partir de una fila generada por to_row"""
+        room_id, progress, counters, fluzo_set, resources, biff_defeats, biff_disabled = row
+        room = cls(room_id)
+        room.progress = progress
+        room.counters = array('i', counters)
+        room.fluzo_set = fluzo_set
+        room.resources = array('i', resources)
+        room.biff_defeats = array('i', biff_defeats)
+        room.biff_disabled = biff_disabled
+        return room
@@ -0,0 +1,252 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .room_state import RoomState
+from .storage import MemoryStorage
+
+ROOM_COLUMNS = "room_id, progress, counters, fluzo_set, resources, biff_defeats, biff_disabled"
+
+# Espera de SQLite por el lock de otro proceso en cada intento (segundos). Esa espera es un bucle en
+# C que no cede el hub de gevent, así que es corta y entre intentos se duerme con time.sleep, que
+# bajo gevent (monkey patching) deja atender al resto de greenlets del worker
+ATTEMPT_TIMEOUT = 0.002
+RETRY_SLEEP_MAX = 0.05
+
+
+class SharedSQLiteStorage(MemoryStorage):
+    """Estado compartido entre varios workers en una base de datos SQLite común (modo WAL).
+
+    Cada worker mantiene su copia en memoria de GameData y la sincroniza al empezar cada
+    petición: la tabla meta guarda un número de secuencia global que se incrementa en cada
+    escritura, y cada fila (sala o documento) guarda la secuencia en la que cambió por última
+    vez, de modo que solo se recargan las filas modificadas por otros workers. Un reset
+    incrementa epoch y obliga a recargarlo todo.
+
+    Las peticiones que modifican el estado se ejecutan dentro de una transacción
+    BEGIN IMMEDIATE, que actúa como lock entre procesos: la lectura de los contadores, su
+    modificación y la escritura son atómicas respecto al resto de workers. La transacción solo
+    cubre trabajo en memoria (los eventos de Socket.IO se envían después desde el dispatcher), y
+    mientras otro worker la tiene el lock se espera reintentando sin bloquear el hub; pasados
+    busy_timeout segundos se abandona con sqlite3.OperationalError.
+    """
+
+    def __init__(self, path, busy_timeout=10):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, timeout=ATTEMPT_TIMEOUT, isolation_level=None,
+                                           check_same_thread=False)
+        self._retrying(self._connection.execute, "PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._retrying(self._connection.executescript, """
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS rooms (
+                room_id INTEGER PRIMARY KEY,
+                progress INTEGER NOT NULL,
+                counters BLOB NOT NULL,
+                fluzo_set INTEGER NOT NULL,
+                resources BLOB NOT NULL,
+                biff_defeats BLOB NOT NULL,
+                biff_disabled INTEGER NOT NULL,
+                seq INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS documents (
+                name TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                seq INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                seq INTEGER NOT NULL,
+                epoch INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO meta (id, seq, epoch) VALUES (1, 0, 0);
+            COMMIT;
+        """)
+
+        # Un solo greenlet/hilo por proceso espera el lock de SQLite: la espera de SQLite es
+        # bloqueante y pararía al resto de greenlets del worker
+        self._process_lock = threading.RLock()
+        self._in_write = False
+        self._seq = None
+        self._epoch = None
+        self._dirty_rooms = {}
+        self._new_rooms = {}
+        self._dirty_documents = {}
+        self._clear_pending = False
+        # Documentos leídos en load() que se entregan en la primera sincronización
+        self._pending_documents = {}
+
+    def _retrying(self, function, *args):
+        """Llama a function(*args) reintentando mientras otro proceso tenga el lock de la base de datos"""
+        deadline = time.monotonic() + self.busy_timeout
+        retry_sleep = 0.001
+        while True:
+            try:
+                return function(*args)
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or time.monotonic() >= deadline:
+                    raise
+            time.sleep(retry_sleep)
+            retry_sleep = min(retry_sleep * 2, RETRY_SLEEP_MAX)
+
+    def _meta(self):
+        return self._connection.execute("SELECT seq, epoch FROM meta WHERE id = 1").fetchone()
+
+    def _read_changes(self, since):
+        """Lee las salas y documentos modificados después de la secuencia since"""
+        rooms = {}
+        for row in self._connection.execute(
+                f"SELECT {ROOM_COLUMNS} FROM rooms WHERE seq > ?", (since,)):
+            room = RoomState.from_row(row)
+            rooms[room.room_id] = room
+        documents = {}
+        for name, data in self._connection.execute(
+                "SELECT name, data FROM documents WHERE seq > ?", (since,)):
+            documents[name] = json.loads(data)
+        return rooms, documents
+
+    def load(self):
+        """Carga en bloque todas las salas y los contadores globales"""
+        with self._process_lock:
+            self._connection.execute("BEGIN")
+            try:
+                self._seq, self._epoch = self._meta()
+                rooms, documents = self._read_changes(-1)
+            finally:
+                self._connection.execute("COMMIT")
+        self._pending_documents = documents
+        return rooms, documents.get("globals")
+
+    def begin(self, write=False):
+        """Sincroniza con los cambios de otros workers; con write=True además toma el lock de
+        escritura hasta commit() o rollback(). Devuelve (recarga_completa, salas, documentos)."""
+        if write:
+            self._process_lock.acquire()
+            try:
+                self._retrying(self._connection.execute, "BEGIN IMMEDIATE")
+            except Exception:
+                self._process_lock.release()
+                raise
+            self._in_write = True
+            return self._refresh()
+
+        with self._process_lock:
+            self._connection.execute("BEGIN")
+            try:
+                return self._refresh()
+            finally:
+                self._connection.execute("COMMIT")
+
+    def _refresh(self):
+        seq, epoch = self._meta()
+        documents, self._pending_documents = self._pending_documents, {}
+        if seq == self._seq and epoch == self._epoch:
+            return False, {}, documents
+
+        full = epoch != self._epoch or self._seq is None
+        rooms, changed_documents = self._read_changes(-1 if full else self._seq)
+        documents.update(changed_documents)
+        self._seq, self._epoch = seq, epoch
+        return full, rooms, documents
+
+    def mark_room_dirty(self, room):
+        """Registra una sala modificada. Fuera de una transacción de escritura (p. ej. una sala
+        creada al consultarla) solo se inserta si ningún otro worker la ha creado ya."""
+        if self._in_write:
+            self._dirty_rooms[room.room_id] = room
+        else:
+            self._new_rooms[room.room_id] = room
+
+    def mark_globals_dirty(self, global_counters):
+        self.save_document("globals", global_counters)
+
+    def save_document(self, name, data):
+        self._dirty_documents[name] = data
+
+    def clear(self):
+        """Elimina todas las salas y los contadores globales de todos los workers"""
+        self._dirty_rooms = {}
+        self._new_rooms = {}
+        self._dirty_documents.pop("globals", None)
+        self._clear_pending = True
+
+    def commit(self):
+        """Escribe los cambios de la petición y libera el lock de escritura"""
+        if not self._in_write:
+            if not (self._new_rooms or self._dirty_documents or self._clear_pending):
+                return
+            # Cambios hechos fuera de una petición de escritura: transacción corta propia (sin
+            # sincronizar; los cambios de otros workers se recogen en la siguiente petición)
+            self._process_lock.acquire()
+            try:
+                self._retrying(self._connection.execute, "BEGIN IMMEDIATE")
+            except Exception:
+                self._process_lock.release()
+                raise
+            self._in_write = True
+        self._write_changes()
+
+    def _write_changes(self):
+        try:
+            seq, epoch = self._meta()
+            up_to_date = seq == self._seq and epoch == self._epoch
+            seq += 1
+            if self._clear_pending:
+                self._clear_pending = False
+                epoch += 1
+                self._connection.execute("DELETE FROM rooms")
+                self._connection.execute("DELETE FROM documents WHERE name = 'globals'")
+            if self._dirty_rooms:
+                self._connection.executemany(
+                    f"INSERT OR REPLACE INTO rooms ({ROOM_COLUMNS}, seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [room.to_row() + (seq,) for room in self._dirty_rooms.values()])
+            if self._new_rooms:
+                self._connection.executemany(
+                    f"INSERT OR IGNORE INTO rooms ({ROOM_COLUMNS}, seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [room.to_row() + (seq,) for room in self._new_rooms.values()])
+            for name, data in self._dirty_documents.items():
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO documents (name, data, seq) VALUES (?, ?, ?)",
+                    (name, json.dumps(data), seq))
+            self._connection.execute("UPDATE meta SET seq = ?, epoch = ? WHERE id = 1", (seq, epoch))
+            self._connection.execute("COMMIT")
+            # Si no se habían perdido cambios de otros workers, la copia local está al día
+            if up_to_date:
+                self._seq, self._epoch = seq, epoch
+        except Exception:
+            self._connection.execute("ROLLBACK")
+            self._seq = None
+            raise
+        finally:
+            self._dirty_rooms = {}
+            self._new_rooms = {}
+            self._dirty_documents = {}
+            self._release()
+
+    def rollback(self):
+        """Descarta los cambios de la petición; la copia local se recarga en la siguiente"""
+        if not self._in_write:
+            return
+        try:
+            self._connection.execute("ROLLBACK")
+        finally:
+            self._dirty_rooms = {}
+            self._new_rooms = {}
+            self._dirty_documents = {}
+            self._clear_pending = False
+            self._seq = None
+            self._release()
+
+    def _release(self):
+        if self._in_write:
+            self._in_write = False
+            self._process_lock.release()
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import sqlite3
+
+from .room_state import RoomState
+from .. import threads
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStorage:
+    """Almacenamiento por defecto: el estado solo vive en memoria y no se persiste.
+
+    Define también la interfaz común del resto de almacenamientos, que solo sobrescriben
+    los métodos que necesitan.
+    """
+
+    def load(self):
+        """Devuelve (salas, contadores globales) guardados; en memoria no hay nada que cargar"""
+        return {}, None
+
+    def replay(self, apply_record):
+        """Aplica con apply_record(tipo, campos) las mutaciones registradas después de lo cargado"""
+
+    def bind(self, state_provider):
+        """Recibe una función que devuelve (salas, contadores globales) del estado actual"""
+
+    def mark_room_dirty(self, room):
+        """Registra que una sala ha cambiado"""
+
+    def record(self, kind, *fields):
+        """Registra una mutación tipada (ver app.models.journal)"""
+
+    def mark_globals_dirty(self, global_counters):
+        """Registra que los contadores globales han cambiado"""
+
+    def record_state(self, rooms, global_counters=None):
+        """Registra como un solo grupo el estado completo de varias salas y de los contadores
+        globales (None si no han cambiado); ver GameData.atomic"""
+        for room in rooms:
+            self.mark_room_dirty(room)
+        if global_counters is not None:
+            self.mark_globals_dirty(global_counters)
+
+    def save_document(self, name, data):
+        """Guarda un documento JSON compartido (p. ej. los grupos de Auth)"""
+
+    def begin(self, write=False):
+        """Empieza una petición; los almacenamientos compartidos devuelven los cambios de otros
+        procesos como (recarga_completa, salas, documentos)"""
+        return None
+
+    def commit(self):
+        """Confirma los cambios de la petición"""
+
+    def rollback(self):
+        """Descarta los cambios de la petición"""
+
+    def clear(self):
+        """Elimina todo el estado guardado"""
+
+    def flush(self):
+        """Escribe los cambios pendientes"""
+
+    def close(self):
+        """Escribe los cambios pendientes y libera los recursos"""
+
+
+class SQLiteStorage(MemoryStorage):
+    """Almacenamiento persistente en SQLite (modo WAL) con escritura diferida.
+
+    Las mutaciones solo marcan la sala como pendiente; un hilo en segundo plano agrupa los
+    cambios y los escribe en una única transacción cada flush_interval segundos, de modo que
+    la latencia de las peticiones no depende del disco. Si una sala cambia varias veces entre
+    dos escrituras solo se escribe su último estado. El hilo es del sistema operativo también
+    bajo gevent (ver app.threads), para que la escritura no bloquee el hub.
+    """
+
+    def __init__(self, path, flush_interval=0.005):
+        self.path = path
+        self.flush_interval = flush_interval
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS rooms (
+                room_id INTEGER PRIMARY KEY,
+                progress INTEGER NOT NULL,
+                counters BLOB NOT NULL,
+                fluzo_set INTEGER NOT NULL,
+                resources BLOB NOT NULL,
+                biff_defeats BLOB NOT NULL,
+                biff_disabled INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS global_counters (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                data TEXT NOT NULL
+            );
+        """)
+        self._connection.commit()
+
+        # Cambios pendientes: salas por id y contadores globales (None si no han cambiado)
+        self._lock = threads.allocate_lock()
+        self._write_lock = threads.allocate_lock()
+        self._dirty_rooms = {}
+        self._dirty_globals = None
+        self._clear_pending = False
+        self._wakeup = threads.Wakeup()
+        self._closed = False
+
+        self._writer = threads.BackgroundThread(target=self._run_writer, name="sqlite-write-behind")
+        self._writer.start()
+
+    def load(self):
+        """Carga en bloque todas las salas y los contadores globales"""
+        rooms = {}
+        for row in self._connection.execute(
+                "SELECT room_id, progress, counters, fluzo_set, resources, biff_defeats, biff_disabled FROM rooms"):
+            room = RoomState.from_row(row)
+            rooms[room.room_id] = room
+
+        global_counters = None
+        row = self._connection.execute("SELECT data FROM global_counters WHERE id = 1").fetchone()
+        if row is not None:
+            global_counters = json.loads(row[0])
+        return rooms, global_counters
+
+    def mark_room_dirty(self, room):
+        """Registra que una sala ha cambiado (O(1), sin acceso a disco)"""
+        with self._lock:
+            self._dirty_rooms[room.room_id] = room
+        self._wakeup.set()
+
+    def mark_globals_dirty(self, global_counters):
+        """Registra que los contadores globales han cambiado"""
+        with self._lock:
+            self._dirty_globals = global_counters
+        self._wakeup.set()
+
+    def clear(self):
+        """Descarta los cambios pendientes y elimina todo el estado guardado en la próxima escritura"""
+        with self._lock:
+            self._dirty_rooms = {}
+            self._dirty_globals = None
+            self._clear_pending = True
+        self._wakeup.set()
+
+    def flush(self):
+        """Escribe en una sola transacción todos los cambios pendientes"""
+        with self._write_lock:
+            with self._lock:
+                dirty_rooms, self._dirty_rooms = self._dirty_rooms, {}
+                dirty_globals, self._dirty_globals = self._dirty_globals, None
+                clear_pending, self._clear_pending = self._clear_pending, False
+
+            # Las mutaciones no toman este lock (y los locks de sala son de gevent, que este hilo no
+            # puede tomar), así que una fila puede recoger una mutación a medias. La escritura es
+            # eventualmente coherente: la mutación vuelve a marcar la sala al terminar y la
+            # siguiente escritura guarda su estado completo
+            rows = [room.to_row() for room in dirty_rooms.values()]
+            globals_data = json.dumps(dirty_globals) if dirty_globals is not None else None
+
+            if not (rows or globals_data or clear_pending):
+                return
+
+            with self._connection:
+                if clear_pending:
+                    self._connection.execute("DELETE FROM rooms")
+                    self._connection.execute("DELETE FROM global_counters")
+                if rows:
+                    self._connection.executemany(
+                        "INSERT OR REPLACE INTO rooms (room_id, progress, counters, fluzo_set, resources, "
+                        "biff_defeats, biff_disabled) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                if globals_data is not None:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO global_counters (id, data) VALUES (1, ?)", (globals_data,))
+
+    def close(self):
+        """Detiene el hilo de escritura, escribe los cambios pendientes y cierra la conexión"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._writer.join(timeout=5)
+        self.flush()
+        self._connection.close()
+
+    def _run_writer(self):
+        """Bucle del hilo de escritura: espera cambios y los agrupa durante flush_interval"""
+        while not self._closed:
+            self._wakeup.wait()
+            if self._closed:
+                break
+            # Dejar que se acumulen más mutaciones antes de escribir
+            threads.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception(f"Error al guardar el estado en SQLite: {str(e)}")
+
+
+def create_storage(config):
+    """Crea el almacenamiento configurado (STORAGE_BACKEND: memory, sqlite, journal o shared)"""
+    backend = config.get('STORAGE_BACKEND', 'memory')
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(config['SQLITE_PATH'],
+                             flush_interval=config.get('STORAGE_FLUSH_INTERVAL_MS', 5) / 1000.0)
+    if backend == 'journal':
+        from .journal import JournalStorage
+        return JournalStorage(config['JOURNAL_DIR'],
+                              segment_bytes=config.get('JOURNAL_SEGMENT_BYTES', 1024 * 1024),
+                              retained_segments=config.get('JOURNAL_RETAINED_SEGMENTS', 3),
+                              snapshot_interval=config.get('JOURNAL_SNAPSHOT_INTERVAL', 300),
+                              flush_interval=config.get('STORAGE_FLUSH_INTERVAL_MS', 5) / 1000.0)
+    if backend == 'shared':
+        from .shared_storage import SharedSQLiteStorage
+        return SharedSQLiteStorage(config['SQLITE_PATH'])
+    raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
@@ -0,0 +1,161 @@
+"""Registro de presencia de los clientes de Socket.IO del worker.
+
+Cada conexión (sid) guarda su mesa (código, grupo y era de la sesión), si es un administrador y
+las salas de Socket.IO a las que se ha unido. Se mantienen además los índices inversos sala ->
+sids y (grupo, era) -> sids de las mesas, de modo que contar los oyentes de una sala o las mesas
+conectadas de un grupo y era es O(1).
+
+Lo alimentan los handlers connect/join/leave/disconnect de room_controller. Sirve para el aviso
+en vivo de mesas conectadas al panel de administración (evento presence_update en admin_room),
+para las métricas y para que el dispatcher no serialice eventos de salas sin oyentes. Con varios
+workers cada proceso solo ve sus propias conexiones (ver BroadcastDispatcher.has_listeners).
+"""
+import threading
+
+ERAS = ("pasado", "presente", "futuro")
+
+
+def room_id_from_name(room):
+    """Número de grupo de una sala 'room_<n>' (None para el resto de salas)"""
+    if isinstance(room, str) and room.startswith('room_') and room[5:].isdigit():
+        return int(room[5:])
+    return None
+
+
+class ClientPresence:
+    """Una conexión de Socket.IO"""
+    __slots__ = ("sid", "mesa_code", "is_admin", "room_id", "era", "rooms")
+
+    def __init__(self, sid, mesa_code=None, is_admin=False, room_id=None, era=None):
+        self.sid = sid
+        self.mesa_code = mesa_code
+        self.is_admin = is_admin
+        # Grupo y era de la mesa; para un administrador, los de la página que está viendo
+        self.room_id = room_id
+        self.era = era
+        self.rooms = set()
+
+
+class Presence:
+    """Conexiones de Socket.IO por sid, sala y era"""
+
+    _lock = threading.Lock()
+    _clients = {}
+    # Sala de Socket.IO -> sids unidos
+    _room_members = {}
+    # (grupo, era) -> sids de las mesas (no administradores) unidas a la sala del grupo
+    _era_members = {}
+
+    @classmethod
+    def connected(cls, sid, mesa_code=None, is_admin=False, room_id=None, era=None):
+        """Registra una conexión nueva (todavía sin salas)"""
+        with cls._lock:
+            cls._remove(sid)
+            cls._clients[sid] = ClientPresence(sid, mesa_code, is_admin, room_id, era)
+
+    @classmethod
+    def joined(cls, sid, room, era=None):
+        """Registra que sid se ha unido a una sala; era es la que indica el cliente (solo se usa
+        para los administradores, las mesas tienen la de su sesión)"""
+        with cls._lock:
+            client = cls._clients.get(sid)
+            if client is None:
+                client = cls._clients[sid] = ClientPresence(sid)
+            if room in client.rooms:
+                return
+            client.rooms.add(room)
+            cls._room_members.setdefault(room, set()).add(sid)
+
+            room_id = room_id_from_name(room)
+            if room_id is None:
+                return
+            if client.is_admin:
+                client.room_id, client.era = room_id, era if era in ERAS else None
+            elif client.room_id == room_id and client.era in ERAS:
+                cls._era_members.setdefault((room_id, client.era), set()).add(sid)
+
+    @classmethod
+    def left(cls, sid, room):
+        with cls._lock:
+            client = cls._clients.get(sid)
+            if client is not None and room in client.rooms:
+                cls._leave(client, room)
+
+    @classmethod
+    def disconnected(cls, sid):
+        """Elimina la conexión de todas sus salas"""
+        with cls._lock:
+            cls._remove(sid)
+
+    @classmethod
+    def reap(cls, is_connected):
+        """Elimina las conexiones que el servidor de Socket.IO ya no tiene (is_connected(sid) es
+        False), por si se perdió algún disconnect; devuelve cuántas se han eliminado"""
+        with cls._lock:
+            stale = [sid for sid in cls._clients if not is_connected(sid)]
+            for sid in stale:
+                cls._remove(sid)
+        return len(stale)
+
+    @classmethod
+    def _remove(cls, sid):
+        # Llamar con el lock adquirido
+        client = cls._clients.pop(sid, None)
+        if client is not None:
+            for room in list(client.rooms):
+                cls._leave(client, room)
+
+    @classmethod
+    def _leave(cls, client, room):
+        # Llamar con el lock adquirido
+        client.rooms.discard(room)
+        members = cls._room_members.get(room)
+        if members is not None:
+            members.discard(client.sid)
+            if not members:
+                del cls._room_members[room]
+
+        room_id = room_id_from_name(room)
+        if room_id is not None and not client.is_admin:
+            key = (room_id, client.era)
+            members = cls._era_members.get(key)
+            if members is not None:
+                members.discard(client.sid)
+                if not members:
+                    del cls._era_members[key]
+
+    @classmethod
+    def listeners(cls, room):
+        """Conexiones unidas a una sala de Socket.IO"""
+        members = cls._room_members.get(room)
+        return len(members) if members else 0
+
+    @classmethod
+    def tables(cls, room_id, era):
+        """Mesas conectadas de un grupo y era"""
+        members = cls._era_members.get((room_id, era))
+        return len(members) if members else 0
+
+    @classmethod
+    def client_count(cls):
+        return len(cls._clients)
+
+    @classmethod
+    def room_counts(cls):
+        """Oyentes por sala de Socket.IO"""
+        with cls._lock:
+            return {room: len(members) for room, members in cls._room_members.items()}
+
+    @classmethod
+    def snapshot(cls):
+        """Resumen para el panel de administración: mesas conectadas por grupo y era"""
+        with cls._lock:
+            tables = {}
+            for (room_id, era), members in cls._era_members.items():
+                tables.setdefault(str(room_id), {})[era] = sorted(
+                    cls._clients[sid].mesa_code or '' for sid in members)
+            return {
+                "clients": len(cls._clients),
+                "admins": sum(1 for client in cls._clients.values() if client.is_admin),
+                "tables": tables,
+            }
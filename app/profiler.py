@@ -0,0 +1,147 @@
+"""Profiler por muestreo del worker, bajo demanda (POST /admin/profile empieza una medición y
+GET /admin/profile devuelve su resultado cuando termina).
+
+Un hilo del sistema operativo toma cada interval segundos la pila de todos los demás hilos con
+sys._current_frames(). Bajo gevent el hilo se crea con las funciones originales (sin monkey
+patching): un greenlet no podría interrumpir a los demás, mientras que un hilo real ve la pila del
+greenlet que está en ejecución en ese momento. El coste es el de recorrer una pila por hilo y
+muestra, fuera de los handlers.
+
+Cada muestra se atribuye a la ruta de Flask (endpoint de la petición de Flask.wsgi_app, incluidos
+los hooks before/after_request) o al evento de Socket.IO (el argumento message de
+SocketIO._handle_event) que se está atendiendo. Las muestras
+sin ruta ni evento (hub de gevent esperando, hilos en reposo, tareas de fondo) se cuentan como
+inactivas y solo se incluyen en las pilas si se pide.
+
+El resultado son pilas colapsadas ("raíz;función;función N", una por línea, listas para
+flamegraph.pl o speedscope) y las funciones con más tiempo propio. La medición sigue en su hilo
+sin retener ninguna petición; el resultado queda en el proceso que la hizo (con varios workers
+hay que consultar el mismo, identificado por su pid).
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+from flask import Flask
+
+from app.threads import original_thread_functions
+
+# Segundos máximos de una medición
+MAX_SECONDS = 30
+# Intervalo mínimo entre muestras (segundos)
+MIN_INTERVAL = 0.001
+
+
+def frame_label(code):
+    """Nombre de una función en las pilas: módulo relativo a la raíz del proyecto y función"""
+    filename = code.co_filename
+    for path in sorted(sys.path, key=len, reverse=True):
+        if path and filename.startswith(path + os.sep):
+            filename = filename[len(path) + 1:]
+            break
+    return f"{filename}:{code.co_qualname if hasattr(code, 'co_qualname') else code.co_name}"
+
+
+class SamplingProfiler:
+    """Una medición: muestrea durante seconds segundos y acumula las pilas por ruta o evento"""
+
+    _lock = threading.Lock()
+    # Última medición del worker (en curso o terminada)
+    _last = None
+
+    def __init__(self, socketio, seconds, interval=0.005):
+        self.seconds = min(seconds, MAX_SECONDS)
+        self.interval = max(MIN_INTERVAL, interval)
+        self.wsgi_app_code = Flask.wsgi_app.__code__
+        self.handle_event_code = socketio._handle_event.__code__
+        self.stacks = collections.Counter()
+        self.handlers = collections.Counter()
+        self.idle_stacks = collections.Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.sampling_time = 0.0
+        self.finished = False
+
+    @classmethod
+    def start(cls, socketio, seconds, interval=0.005):
+        """Empieza a medir durante seconds segundos en un hilo propio y vuelve sin esperar (una
+        sola medición a la vez: None si ya hay otra en curso)"""
+        with cls._lock:
+            if cls._last is not None and not cls._last.finished:
+                return None
+            profiler = cls._last = cls(socketio, seconds, interval)
+        start_new_thread, get_ident, sleep = original_thread_functions()
+        start_new_thread(profiler._sample_loop, (profiler.seconds, get_ident, sleep))
+        return profiler
+
+    @classmethod
+    def last(cls):
+        """La última medición empezada en este worker (None si no hay ninguna)"""
+        return cls._last
+
+    def _sample_loop(self, seconds, get_ident, sleep):
+        try:
+            own_thread = get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_thread:
+                        self._sample(frame)
+                self.sampling_time += time.perf_counter() - start
+                sleep(self.interval)
+        finally:
+            self.finished = True
+
+    def _sample(self, frame):
+        codes = []
+        handler = None
+        while frame is not None:
+            code = frame.f_code
+            codes.append(code)
+            if handler is None:
+                if code is self.wsgi_app_code:
+                    # Sin endpoint mientras se crea el contexto y se resuelve la URL
+                    context = frame.f_locals.get('ctx')
+                    handler = f"route {(context is not None and context.request.endpoint) or '(resolviendo)'}"
+                elif code is self.handle_event_code:
+                    handler = f"socketio {frame.f_locals.get('message')}"
+            frame = frame.f_back
+        codes.reverse()
+        if handler is None:
+            self.idle_samples += 1
+            self.idle_stacks[('(inactivo)', *codes)] += 1
+        else:
+            self.samples += 1
+            self.handlers[handler] += 1
+            self.stacks[(handler, *codes)] += 1
+
+    def collapsed(self, include_idle=False):
+        """Pilas colapsadas: raíz;función;... número de muestras"""
+        stacks = self.stacks + self.idle_stacks if include_idle else self.stacks
+        labels = {}
+        lines = []
+        for (root, *codes), count in stacks.most_common():
+            names = [labels.get(code) or labels.setdefault(code, frame_label(code)) for code in codes]
+            lines.append(';'.join([root] + names) + f' {count}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def top(self, limit=20):
+        """Funciones con más muestras en lo alto de la pila (tiempo propio) entre las atribuidas"""
+        if not self.samples:
+            return []
+        self_counts = collections.Counter()
+        total_counts = collections.Counter()
+        for (_, *codes), count in self.stacks.items():
+            self_counts[codes[-1]] += count
+            for code in set(codes):
+                total_counts[code] += count
+        return [{
+            "function": frame_label(code),
+            "line": code.co_firstlineno,
+            "self": count,
+            "self_pct": round(100.0 * count / self.samples, 1),
+            "total_pct": round(100.0 * total_counts[code] / self.samples, 1),
+        } for code, count in self_counts.most_common(limit)]
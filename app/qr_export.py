@@ -0,0 +1,218 @@
+"""Exportación masiva de los códigos QR de todas las mesas.
+
+Las tarjetas (o las páginas del PDF) se generan en un pool de procesos y la respuesta se envía
+por partes a medida que se completan, en el orden de los códigos: el ZIP contiene un PNG por
+mesa y el PDF tiene N tarjetas por página A4. Con QR_EXPORT_WORKERS=0 todo se genera en el
+propio proceso (mismo formato, sin paralelismo).
+"""
+import io
+import math
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from app.qr_renderer import QRRenderer
+
+# Página A4 en puntos (PDF) y resolución de la imagen de cada página
+PAGE_SIZE_PT = (595.28, 841.89)
+PAGE_DPI = 150
+PAGE_SIZE_PX = (round(PAGE_SIZE_PT[0] / 72 * PAGE_DPI), round(PAGE_SIZE_PT[1] / 72 * PAGE_DPI))
+PAGE_MARGIN_PX = 60
+
+
+def render_card(task):
+    """Tarea del pool: PNG de la tarjeta de una mesa"""
+    site_url, mesa_code, group, era = task
+    return QRRenderer.render_png(site_url, mesa_code, group, era)
+
+
+def render_page(task):
+    """Tarea del pool: página del PDF con varias tarjetas. Devuelve (ancho, alto, píxeles en
+    escala de grises comprimidos con zlib)"""
+    site_url, cards, columns, rows = task
+    page = Image.new('L', PAGE_SIZE_PX, color=255)
+    cell_width = (PAGE_SIZE_PX[0] - 2 * PAGE_MARGIN_PX) // columns
+    cell_height = (PAGE_SIZE_PX[1] - 2 * PAGE_MARGIN_PX) // rows
+    for position, (mesa_code, group, era) in enumerate(cards):
+        card = QRRenderer.render_image(site_url, mesa_code, group, era).convert('L')
+        # Reducir la tarjeta si no cabe en su celda (nunca ampliarla)
+        scale = min(1.0, cell_width / card.width, cell_height / card.height)
+        if scale < 1.0:
+            card = card.resize((int(card.width * scale), int(card.height * scale)), Image.LANCZOS)
+        column, row = position % columns, position // columns
+        x = PAGE_MARGIN_PX + column * cell_width + (cell_width - card.width) // 2
+        y = PAGE_MARGIN_PX + row * cell_height + (cell_height - card.height) // 2
+        page.paste(card, (x, y))
+    return page.width, page.height, zlib.compress(page.tobytes(), 6)
+
+
+def page_grid(per_page):
+    """Columnas y filas de tarjetas en una página"""
+    columns = 1 if per_page == 1 else 2 if per_page <= 8 else 3
+    return columns, math.ceil(per_page / columns)
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Destino no posicionable para zipfile: acumula lo escrito hasta que se recoge"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _PDFWriter:
+    """Escritor mínimo de PDF por partes: cada página es una imagen en escala de grises.
+
+    Los objetos se numeran así: 1 catálogo, 2 árbol de páginas y tres objetos por página
+    (imagen, contenido, página). La tabla xref se escribe al final con los offsets acumulados.
+    """
+
+    def __init__(self):
+        self._offset = 0
+        self._offsets = {}
+        self._pages = []
+
+    def _object(self, number, body, stream=None):
+        self._offsets[number] = self._offset
+        data = f"{number} 0 obj\n".encode() + body
+        if stream is not None:
+            data += b"\nstream\n" + stream + b"\nendstream"
+        data += b"\nendobj\n"
+        return self._emit(data)
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def header(self):
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def page(self, width, height, pixels):
+        number = 3 + 3 * len(self._pages)
+        image, content, page = number, number + 1, number + 2
+        self._pages.append(page)
+        drawing = f"q {PAGE_SIZE_PT[0]} 0 0 {PAGE_SIZE_PT[1]} 0 0 cm /Im0 Do Q".encode()
+        return b''.join([
+            self._object(image, (
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode "
+                f"/Length {len(pixels)} >>").encode(), pixels),
+            self._object(content, f"<< /Length {len(drawing)} >>".encode(), drawing),
+            self._object(page, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_SIZE_PT[0]} {PAGE_SIZE_PT[1]}] "
+                f"/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>").encode()),
+        ])
+
+    def trailer(self):
+        kids = ' '.join(f"{page} 0 R" for page in self._pages)
+        data = self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        data += self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>".encode())
+        xref_offset = self._offset
+        count = max(self._offsets) + 1
+        xref = [f"xref\n0 {count}\n", "0000000000 65535 f \n"]
+        xref += [f"{self._offsets[number]:010d} 00000 n \n" for number in range(1, count)]
+        xref.append(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        return data + self._emit(''.join(xref).encode())
+
+
+class QRExport:
+    """Pool de procesos compartido para la exportación masiva de QR"""
+
+    _workers = os.cpu_count() or 1
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, workers):
+        """Número de procesos del pool (0: generar en el propio proceso)"""
+        if workers != cls._workers:
+            cls.shutdown()
+        cls._workers = workers
+
+    @classmethod
+    def executor(cls):
+        """Pool de procesos, creado la primera vez que se usa (después del fork de gunicorn)"""
+        with cls._lock:
+            if cls._executor is None and cls._workers > 0:
+                # spawn: los procesos no heredan el estado de gevent ni los sockets del worker
+                cls._executor = ProcessPoolExecutor(max_workers=cls._workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            return cls._executor
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(cancel_futures=True)
+                cls._executor = None
+
+    @classmethod
+    def _map(cls, function, tasks):
+        """Resultados de function(tarea) en orden, a medida que están disponibles"""
+        executor = cls.executor()
+        if executor is None:
+            return map(function, tasks)
+        futures = [executor.submit(function, task) for task in tasks]
+
+        def results():
+            try:
+                for future in futures:
+                    yield future.result()
+            finally:
+                # Si el cliente corta la descarga, no seguir generando
+                for future in futures:
+                    future.cancel()
+        return results()
+
+    @classmethod
+    def stream_zip(cls, site_url, mesa_codes):
+        """Genera por partes un ZIP con el PNG de cada mesa (mesa_codes: {código: info})"""
+        cards = [(mesa_code, info["group"], info["era"]) for mesa_code, info in mesa_codes.items()]
+        # Las tarjetas ya cacheadas no pasan por el pool
+        cached = {card: QRRenderer.cached_png(site_url, *card) for card in cards}
+        missing = [card for card in cards if cached[card] is None]
+        rendered = cls._map(render_card, [(site_url, *card) for card in missing])
+
+        buffer = _StreamBuffer()
+        date_time = time.localtime()[:6]
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for card in cards:
+                png = cached[card]
+                if png is None:
+                    png = next(rendered)
+                    QRRenderer.store_png(site_url, *card, png)
+                archive.writestr(zipfile.ZipInfo(f"qr_{card[0]}.png", date_time), png)
+                yield buffer.drain()
+        yield buffer.drain()
+
+    @classmethod
+    def stream_pdf(cls, site_url, mesa_codes, per_page=6):
+        """Genera por partes un PDF A4 con per_page tarjetas por página"""
+        cards = [(mesa_code, info["group"], info["era"]) for mesa_code, info in mesa_codes.items()]
+        columns, rows = page_grid(per_page)
+        tasks = [(site_url, cards[start:start + per_page], columns, rows)
+                 for start in range(0, len(cards), per_page)]
+
+        writer = _PDFWriter()
+        yield writer.header()
+        for width, height, pixels in cls._map(render_page, tasks):
+            yield writer.page(width, height, pixels)
+        yield writer.trailer()
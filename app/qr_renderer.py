@@ -0,0 +1,209 @@
+"""Generación de los códigos QR de acceso de las mesas.
+
+Las imágenes (QR con el nombre de la mesa, el grupo y la era debajo) se generan en PNG o en SVG
+y se guardan ya codificadas en una caché LRU con clave (site_url, mesa_code, group, era,
+formato), de modo que volver a descargar un QR o imprimir la hoja de todas las mesas solo
+consulta memoria. La fuente del PNG se carga una sola vez.
+
+El SVG dibuja la matriz del QR como un único path (un rectángulo por cada tramo horizontal de
+módulos oscuros) y el texto como elementos text: pesa unas pocas KB y se genera sin componer
+ninguna imagen.
+"""
+import io
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+
+from app.models.auth import Auth
+
+# Medidas de las tarjetas: píxeles por módulo, módulos de margen y alto del texto bajo el QR
+BOX_SIZE = 10
+BORDER = 4
+CAPTION_HEIGHT = 60
+
+
+class QRRenderer:
+    """Genera y cachea los códigos QR de las mesas"""
+
+    _cache = OrderedDict()
+    _cache_size = 256
+    _lock = threading.Lock()
+    _font = None
+    # Generación de los códigos de mesa de Auth con la que se validó la caché
+    _codes_generation = None
+
+    @classmethod
+    def configure(cls, cache_size):
+        """Establece el número máximo de imágenes en caché"""
+        with cls._lock:
+            cls._cache_size = cache_size
+            while len(cls._cache) > cls._cache_size:
+                cls._cache.popitem(last=False)
+
+    @classmethod
+    def font(cls):
+        """Fuente para el texto bajo el QR (se busca una sola vez)"""
+        if cls._font is None:
+            try:
+                # En sistemas Linux
+                cls._font = ImageFont.truetype("DejaVuSans.ttf", 18)
+            except IOError:
+                try:
+                    # En sistemas Windows
+                    cls._font = ImageFont.truetype("arial.ttf", 18)
+                except IOError:
+                    # Si no hay fuentes disponibles, usar fuente predeterminada
+                    cls._font = ImageFont.load_default()
+        return cls._font
+
+    @staticmethod
+    def labels(mesa_code, group, era):
+        """Textos de la mesa: (nombre de la mesa, nombre del grupo, nombre de la era)"""
+        return "Mesa " + mesa_code[4:].zfill(2).upper(), f"Grupo {group}", era.capitalize()
+
+    @staticmethod
+    def make_qr(site_url, mesa_code):
+        """Código QR con la URL de acceso de la mesa"""
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=BOX_SIZE,
+            border=BORDER,
+        )
+        qr.add_data(f"{site_url}?code={mesa_code}")
+        qr.make(fit=True)
+        return qr
+
+    @classmethod
+    def render_image(cls, site_url, mesa_code, group, era):
+        """Compone la imagen del QR con el texto de la mesa (sin caché)"""
+        qr = cls.make_qr(site_url, mesa_code)
+        qr_img = qr.make_image(fill_color="black", back_color="white").convert('RGB')
+
+        # Imagen más grande con espacio para el texto
+        img_width, img_height = qr_img.size
+        new_img = Image.new('RGB', (img_width, img_height + CAPTION_HEIGHT), color='white')
+        new_img.paste(qr_img, (0, 0))
+
+        mesa_name, group_name, era_name = cls.labels(mesa_code, group, era)
+        draw = ImageDraw.Draw(new_img)
+        font = cls.font()
+        draw.text((10, img_height + 5), mesa_name, font=font, fill='black')
+        draw.text((10, img_height + 25), f"{group_name} - {era_name}", font=font, fill='black')
+        return new_img
+
+    @classmethod
+    def render_svg(cls, site_url, mesa_code, group, era):
+        """Genera el SVG del QR con el texto de la mesa (sin caché), con las mismas medidas que el PNG"""
+        matrix = cls.make_qr(site_url, mesa_code).get_matrix()
+        size = len(matrix)
+
+        # Un subpath por cada tramo horizontal de módulos oscuros (coordenadas en módulos)
+        path = []
+        for y, row in enumerate(matrix):
+            x = 0
+            while x < size:
+                if row[x]:
+                    start = x
+                    while x < size and row[x]:
+                        x += 1
+                    path.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+                else:
+                    x += 1
+
+        width = height = size * BOX_SIZE
+        mesa_name, group_name, era_name = cls.labels(mesa_code, group, era)
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height + CAPTION_HEIGHT}" '
+            f'width="{width}" height="{height + CAPTION_HEIGHT}">'
+            f'<rect width="100%" height="100%" fill="#fff"/>'
+            f'<path transform="scale({BOX_SIZE})" shape-rendering="crispEdges" d="{"".join(path)}"/>'
+            f'<g font-family="DejaVu Sans, Arial, sans-serif" font-size="18">'
+            f'<text x="10" y="{height + 22}">{escape(mesa_name)}</text>'
+            f'<text x="10" y="{height + 42}">{escape(f"{group_name} - {era_name}")}</text>'
+            f'</g></svg>'
+        ).encode('utf-8')
+
+    @classmethod
+    def png(cls, site_url, mesa_code, group, era):
+        """PNG del QR de una mesa"""
+        return cls._cached(site_url, mesa_code, group, era, 'png')
+
+    @classmethod
+    def svg(cls, site_url, mesa_code, group, era):
+        """SVG del QR de una mesa"""
+        return cls._cached(site_url, mesa_code, group, era, 'svg')
+
+    @classmethod
+    def cache_info(cls):
+        """Número de imágenes en caché y tamaño máximo"""
+        with cls._lock:
+            return {"entries": len(cls._cache), "max_entries": cls._cache_size}
+
+    @classmethod
+    def invalidate(cls):
+        """Vacía la caché"""
+        with cls._lock:
+            cls._cache.clear()
+
+    @classmethod
+    def render_png(cls, site_url, mesa_code, group, era):
+        """Genera y codifica en PNG el QR de una mesa (sin caché)"""
+        buffer = io.BytesIO()
+        cls.render_image(site_url, mesa_code, group, era).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    @classmethod
+    def cached_png(cls, site_url, mesa_code, group, era):
+        """PNG del QR si ya está en caché; None en caso contrario"""
+        return cls._lookup((site_url, mesa_code, group, era, 'png'))
+
+    @classmethod
+    def store_png(cls, site_url, mesa_code, group, era, png):
+        """Guarda en la caché un PNG generado fuera (p. ej. en el pool de exportación)"""
+        return cls._store((site_url, mesa_code, group, era, 'png'), png)
+
+    @classmethod
+    def _cached(cls, site_url, mesa_code, group, era, fmt):
+        key = (site_url, mesa_code, group, era, fmt)
+        entry = cls._lookup(key)
+        if entry is None:
+            render = cls.render_svg if fmt == 'svg' else cls.render_png
+            entry = cls._store(key, render(site_url, mesa_code, group, era))
+        return entry
+
+    @classmethod
+    def _lookup(cls, key):
+        with cls._lock:
+            cls._validate()
+            entry = cls._cache.get(key)
+            if entry is not None:
+                cls._cache.move_to_end(key)
+            return entry
+
+    @classmethod
+    def _store(cls, key, entry):
+        with cls._lock:
+            cls._cache[key] = entry
+            cls._cache.move_to_end(key)
+            while len(cls._cache) > cls._cache_size:
+                cls._cache.popitem(last=False)
+        return entry
+
+    @classmethod
+    def _validate(cls):
+        """Descarta las imágenes de códigos de mesa que han cambiado de grupo o era (o ya no existen)
+        desde la última vez que se añadieron grupos"""
+        generation = Auth.codes_generation()
+        if generation == cls._codes_generation:
+            return
+        cls._codes_generation = generation
+        mesa_codes = Auth.get_all_mesa_codes()
+        for key in list(cls._cache):
+            _, mesa_code, group, era, _ = key
+            mesa_info = mesa_codes.get(mesa_code)
+            if mesa_info is None or (mesa_info["group"], mesa_info["era"]) != (group, era):
+                del cls._cache[key]
@@ -0,0 +1,1459 @@
+// Estado inicial de la sala y la era, incluido por el servidor en la página (ver era_state)
+const eraState = JSON.parse(document.getElementById('era-state').textContent);
+
+// Conexión Socket.IO de la página (se abre al cargar el DOM)
+let eraSocket = null;
+// Tiempo máximo de espera de la respuesta (ack) de una acción enviada por Socket.IO
+const COMMAND_ACK_TIMEOUT = 10000;
+
+// Envía una acción de mesa (update_perdicion, update_reserva, set_fluzo_value, check_fluzo_value,
+// biff_defeat) por la conexión Socket.IO ya abierta y devuelve una promesa con la respuesta del
+// servidor, la misma que la de la ruta POST. Sin conexión se usa la ruta POST. Si el ack no llega a
+// tiempo no se reintenta por HTTP: la acción pudo aplicarse y repetirla la sumaría dos veces.
+function sendCommand(command, data) {
+    if (!eraSocket || !eraSocket.connected) {
+        return fetch(`/${command}/${eraState.room_id}/${eraState.era}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(data)
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Error de red: ' + response.status);
+            }
+            return response.json();
+        });
+    }
+    
+    return new Promise((resolve, reject) => {
+        eraSocket.timeout(COMMAND_ACK_TIMEOUT).emit(command, { room_id: eraState.room_id, era: eraState.era, ...data }, (err, response) => {
+            if (err) {
+                reject(new Error('Sin respuesta del servidor'));
+            } else {
+                resolve(response);
+            }
+        });
+    });
+}
+
+        // Variables para almacenar los totales globales
+        const globalTotals = {
+            'perdicion': 0,
+            'reserva': 0,
+            'perdicion_cycle': 1
+        };
+        
+        // Función para confirmar el desmarcado de anuncios
+        function confirmDemarking(buttonIdx, isActive) {
+            // Obtener el elemento del botón actual para verificar su estado real
+            const buttonElement = document.querySelector(`#form-button-${buttonIdx} .game-button`);
+            
+            // Verificar si el botón tiene la clase 'active', lo que indica que está marcado
+            const isCurrentlyActive = buttonElement && buttonElement.classList.contains('active');
+            
+            // Solo mostrar confirmación si realmente estamos desmarcando (está activo actualmente)
+            if (isCurrentlyActive) {
+                return confirm(`¿Estás seguro de que deseas desmarcar este anuncio? 
+Si lo haces, todos los anuncios que dependan de éste también se desmarcarán.`);
+            }
+            
+            // Si estamos marcando (no está activo actualmente), no necesitamos confirmación
+            return true;
+        }
+        
+// ========== PERDICIÓN ==========
+// Función para actualizar el valor de perdición en la interfaz
+function updatePerdicionValue(change) {
+    // Verificar si estamos en el ciclo final
+    if (globalTotals['perdicion_cycle'] > 3) {
+        showNotification("El contador de perdición ha completado todos sus ciclos.");
+        return;
+    }
+    
+    const valueElement = document.getElementById('perdicion-value');
+    if (!valueElement) {
+        console.error("Elemento perdicion-value no encontrado");
+        return;
+    }
+    
+    let currentValue = parseInt(valueElement.innerText || '0');
+    currentValue += change;
+    
+    // Permitir valores negativos pero con límite
+    if (currentValue < 0) {
+        // El valor negativo no puede ser menor que el negativo del valor global
+        if (Math.abs(currentValue) > globalTotals['perdicion']) {
+            currentValue = -globalTotals['perdicion'];
+        }
+    }
+    
+    valueElement.innerText = currentValue;
+}
+
+// Función para enviar el valor de perdición al servidor
+function sendPerdicionValue() {
+    // Verificar si estamos en el ciclo final
+    if (globalTotals['perdicion_cycle'] > 3) {
+        showNotification("El contador de perdición ha completado todos sus ciclos.");
+        return;
+    }
+
+    const valueElement = document.getElementById('perdicion-value');
+    if (!valueElement) {
+        console.error("Elemento perdicion-value no encontrado");
+        return;
+    }
+
+    const currentValue = parseInt(valueElement.innerText || '0');
+
+    if (currentValue === 0) {
+        return; // No enviar si el valor es cero
+    }
+
+    // Verificar límite para valores negativos
+    if (currentValue < 0) {
+        // Verificar que no se intente reducir más allá de cero en el global
+        if (Math.abs(currentValue) > globalTotals['perdicion']) {
+            // Informar al usuario y limitar el valor al máximo permitido
+            const maxNegative = -globalTotals['perdicion'];
+            showNotification(`No se puede reducir más allá de 0. Valor ajustado a ${maxNegative}.`);
+            
+            // Ajustar el valor al máximo permitido
+            valueElement.innerText = maxNegative.toString();
+            return;
+        }
+    }
+
+    // Resetear el contador a 0
+    valueElement.innerText = '0';
+
+    // Guardamos el ciclo actual antes de enviar
+    const currentCycle = globalTotals['perdicion_cycle'];
+    
+    // Enviar al servidor usando la nueva ruta específica para perdición
+    sendCommand('update_perdicion', {
+        amount: currentValue
+    })
+    .then(data => {
+        if (data.success) {
+            // Actualizar total local con datos del servidor
+            const totalElement = document.getElementById('perdicion-total');
+            if (totalElement && data.columnTotal !== undefined) {
+                totalElement.innerText = data.columnTotal;
+                
+                // Añadir animación de resaltado
+                totalElement.classList.add('highlight-animation');
+                
+                // Eliminar la animación después de que termine
+                setTimeout(() => {
+                    totalElement.classList.remove('highlight-animation');
+                }, 1000);
+            }
+    
+            // Actualizar total global
+            const globalElement = document.getElementById('perdicion-global');
+            if (globalElement && data.globalTotal !== undefined) {
+                globalTotals['perdicion'] = data.globalTotal;
+                globalElement.innerText = data.globalTotal;
+                
+                // Añadir animación de resaltado
+                globalElement.classList.add('highlight-animation');
+                
+                // Eliminar la animación después de que termine
+                setTimeout(() => {
+                    globalElement.classList.remove('highlight-animation');
+                }, 1000);
+            }
+            
+            // Actualizar el ciclo de perdición si cambió
+            if (data.perdicionCycle !== undefined) {
+                updatePerdicionCycle(data.perdicionCycle);
+            }
+            
+            // Mostrar notificación si existe
+            if (data.notification) {
+                showNotification(data.notification);
+            }
+        } else if (data.error) {
+            // Mostrar error si existe
+            showNotification("Error: " + data.error);
+            // Restaurar el valor en caso de error
+            valueElement.innerText = currentValue.toString();
+        }
+    })
+    .catch(error => {
+        console.error("Error al enviar perdición:", error);
+        showNotification("Error de conexión: No se pudo enviar el valor de perdición");
+        // Restaurar el valor en caso de error
+        valueElement.innerText = currentValue.toString();
+    });
+}
+
+
+// Función para activar/desactivar Fluzo basado en el ciclo de perdición
+function toggleFluzoBasedOnCycle(cycle, isInitialLoad = false) {
+    const fluzoBlock = document.querySelector('.resource-block:nth-child(3)'); // La tercera columna es Fluzo
+    const fluzoBtns = fluzoBlock.querySelectorAll('button');
+    const fluzoValue = fluzoBlock.querySelector('#fluzo-value');
+    
+    if (!fluzoBlock) return;
+    
+    if (cycle === 1) {
+        // Desactivar Fluzo en Plan 1a
+        fluzoBlock.classList.add('fluzo-disabled');
+        fluzoBtns.forEach(btn => {
+            btn.disabled = true;
+            btn.classList.add('disabled');
+        });
+        if (fluzoValue) {
+            fluzoValue.style.opacity = '0.5';
+        }
+    } else {
+        // Activar Fluzo en otros planes
+        fluzoBlock.classList.remove('fluzo-disabled');
+        fluzoBtns.forEach(btn => {
+            btn.disabled = false;
+            btn.classList.remove('disabled');
+        });
+        if (fluzoValue) {
+            fluzoValue.style.opacity = '1';
+            // Asegurarnos que la caja siempre muestre 0
+            fluzoValue.innerText = '0';
+        }
+        
+        // Si estamos pasando del ciclo 1 al ciclo 2 (no en carga inicial)
+        if (cycle === 2 && !isInitialLoad) {
+            // Valores posibles
+            const possibleValues = [70, 71, 72, 73, 74, 75, 80, 81, 82, 83, 84, 85];
+            
+            // Seleccionar un valor aleatorio
+            const randomValue = possibleValues[Math.floor(Math.random() * possibleValues.length)];
+            
+            // Llamar al servidor para establecer el valor aleatorio
+            setRandomFluzoValue(randomValue);
+        }
+    }
+}
+
+// Función modificada para establecer un valor aleatorio para Fluzo
+function setRandomFluzoValue(newValue) {
+    // No actualizar la caja, solo enviamos al servidor
+    
+    // Enviar el valor al servidor
+    sendCommand('set_fluzo_value', {
+        value: newValue,
+        silent: true  // Indicador para no mostrar notificación
+    })
+    .then(data => {
+        if (data.success) {
+            // Actualizar solo el total con el valor del servidor
+            const totalElement = document.getElementById('fluzo-total');
+            if (totalElement && data.fluzoTotal !== undefined) {
+                totalElement.innerText = data.fluzoTotal;
+                
+                // Añadir animación de resaltado
+                totalElement.classList.add('highlight-animation');
+                
+                // Eliminar la animación después de que termine
+                setTimeout(() => {
+                    totalElement.classList.remove('highlight-animation');
+                }, 1000);
+            }
+            
+            // Mantener la caja en 0
+            const valueElement = document.getElementById('fluzo-value');
+            if (valueElement) {
+                valueElement.innerText = '0';
+            }
+            
+            // Ya NO mostramos notificación sobre el valor aleatorio
+        } else if (data.error) {
+            // Mostrar error (mantenemos esto para diagnóstico)
+            showNotification("Error: " + data.error);
+        }
+    })
+    .catch(error => {
+        console.error("Error al establecer valor aleatorio de fluzo:", error);
+        showNotification("Error de conexión: No se pudo establecer el valor de fluzo");
+    });
+}
+
+// Modificar la función existente updatePerdicionCycle para detectar el cambio de ciclo
+function updatePerdicionCycle(cycle) {
+    // Guardar el ciclo anterior para detectar la transición específica de 2 a 3
+    const previousCycle = globalTotals['perdicion_cycle'];
+    
+    // Actualizar el valor global
+    globalTotals['perdicion_cycle'] = cycle;
+    
+    const cycleIndicator = document.getElementById('perdicion-cycle');
+    if (cycleIndicator) {
+        let cycleText = "";
+        switch(cycle) {
+            case 1:
+                cycleText = "Plan 1a";
+                break;
+            case 2:
+                cycleText = "Plan 1a. Primer avance";
+                break;
+            case 3:
+                cycleText = "Plan 1a. Segundo avance";
+                break;
+            default:
+                cycleText = "->R2";
+                break;
+        }
+        cycleIndicator.textContent = cycleText;
+        
+        // Si estamos en el ciclo 4 (después del tercer ciclo), deshabilitar controles de perdición
+        if (cycle > 3) {
+            disablePerdicionControls();
+        } else {
+            enablePerdicionControls();
+        }
+        
+        // Activar/desactivar Fluzo según el ciclo
+        toggleFluzoBasedOnCycle(cycle);
+        
+        // Detectar la transición específica del ciclo 2 al ciclo 3
+        if (previousCycle === 2 && cycle === 3) {
+            // Cuando cambiamos al "Plan 1a. Segundo avance", ajustar el valor de Fluzo
+            adjustFluzoBasedOnRules();
+        }
+    }
+}
+
+// Nueva función para ajustar el valor de Fluzo según las reglas especificadas
+function adjustFluzoBasedOnRules() {
+    // Obtener el valor actual de Fluzo
+    const fluzoTotalElement = document.getElementById('fluzo-total');
+    if (!fluzoTotalElement) return;
+    
+    const currentFluzoValue = parseInt(fluzoTotalElement.innerText || '0');
+    let newFluzoValue = currentFluzoValue;
+    
+    // Aplicar las reglas de ajuste:
+    if (currentFluzoValue > 86) {
+        newFluzoValue = currentFluzoValue - 10;
+    } else if (currentFluzoValue < 76) {
+        newFluzoValue = currentFluzoValue + 10;
+    } else if (currentFluzoValue >= 80 && currentFluzoValue <= 82) {
+        newFluzoValue = currentFluzoValue - 5;
+    }
+    
+    // Si el valor ha cambiado, actualizarlo en el servidor
+    if (newFluzoValue !== currentFluzoValue) {
+        // Enviar directamente el valor al servidor sin modificar la caja
+        sendCommand('set_fluzo_value', {
+            value: newFluzoValue,
+            silent: false  // Ahora mostramos notificación
+        })
+        .then(data => {
+            if (data.success) {
+                // El servidor ya enviará la actualización a través de WebSocket
+                // y mostrará la notificación cuando llegue el evento
+                //showNotification("El nivel de Fluzo condensado ha sido alterado");
+            }
+        })
+        .catch(error => {
+            console.error("Error al ajustar valor de fluzo:", error);
+        });
+    }
+}
+
+// ========== RESERVA ==========
+// Función para actualizar el valor de reserva en la interfaz
+function updateReservaValue(change) {
+    const valueElement = document.getElementById('reserva-value');
+    if (!valueElement) {
+        console.error("Elemento reserva-value no encontrado");
+        return;
+    }
+    
+    let currentValue = parseInt(valueElement.innerText || '0');
+    currentValue += change;
+    
+    // Permitir valores negativos pero con límite
+    if (currentValue < 0) {
+        // El valor negativo no puede ser menor que el negativo del valor global
+        if (Math.abs(currentValue) > globalTotals['reserva']) {
+            currentValue = -globalTotals['reserva'];
+        }
+    }
+    
+    valueElement.innerText = currentValue;
+}
+
+// Función para enviar el valor de reserva al servidor
+function sendReservaValue() {
+    const valueElement = document.getElementById('reserva-value');
+    if (!valueElement) {
+        console.error("Elemento reserva-value no encontrado");
+        return;
+    }
+
+    const currentValue = parseInt(valueElement.innerText || '0');
+
+    if (currentValue === 0) {
+        return; // No enviar si el valor es cero
+    }
+
+    // Verificar límite para valores negativos
+    if (currentValue < 0) {
+        // Verificar que no se intente reducir más allá de cero en el global
+        if (Math.abs(currentValue) > globalTotals['reserva']) {
+            // Informar al usuario y limitar el valor al máximo permitido
+            const maxNegative = -globalTotals['reserva'];
+            showNotification(`No se puede reducir más allá de 0. Valor ajustado a ${maxNegative}.`);
+            
+            // Ajustar el valor al máximo permitido
+            valueElement.innerText = maxNegative.toString();
+            return;
+        }
+    }
+
+    // Resetear el contador a 0
+    valueElement.innerText = '0';
+
+    // Enviar al servidor usando la ruta específica para reserva
+    sendCommand('update_reserva', {
+        amount: currentValue
+    })
+    .then(data => {
+        if (data.success) {
+            // Actualizar total local con datos del servidor
+            const totalElement = document.getElementById('reserva-total');
+            if (totalElement && data.columnTotal !== undefined) {
+                totalElement.innerText = data.columnTotal;
+                
+                // Añadir animación de resaltado
+                totalElement.classList.add('highlight-animation');
+                
+                // Eliminar la animación después de que termine
+                setTimeout(() => {
+                    totalElement.classList.remove('highlight-animation');
+                }, 1000);
+            }
+    
+            // Actualizar total global
+            const globalElement = document.getElementById('reserva-global');
+            if (globalElement && data.globalTotal !== undefined) {
+                globalTotals['reserva'] = data.globalTotal;
+                globalElement.innerText = data.globalTotal;
+                
+                // Añadir animación de resaltado
+                globalElement.classList.add('highlight-animation');
+                
+                // Eliminar la animación después de que termine
+                setTimeout(() => {
+                    globalElement.classList.remove('highlight-animation');
+                }, 1000);
+            }
+        } else if (data.error) {
+            // Mostrar error si existe
+            showNotification("Error: " + data.error);
+            // Restaurar el valor en caso de error
+            valueElement.innerText = currentValue.toString();
+        }
+    })
+    .catch(error => {
+        console.error("Error al enviar reserva:", error);
+        showNotification("Error de conexión: No se pudo enviar el valor de reserva");
+        // Restaurar el valor en caso de error
+        valueElement.innerText = currentValue.toString();
+    });
+}
+
+// ========== FLUZO ==========
+
+// Función para actualizar el valor de Fluzo
+function updateFluzoValue(change) {
+    // Si Consecuencias Imprevistas ya está completado, no permitir cambios
+    if (consecuenciasImprevistasCompleted) {
+        showNotification("Se ha completado Consecuencias Imprevistas. Fluzo condensado está bloqueado.");
+        return;
+    }
+
+    const valueElement = document.getElementById('fluzo-value');
+    if (!valueElement) {
+        console.error("Elemento fluzo-value no encontrado");
+        return;
+    }
+    
+    // Obtener el valor actual y aplicar el cambio
+    let currentValue = parseInt(valueElement.innerText || '0');
+    let newValue = currentValue + change;
+    
+    // Actualizar el valor en pantalla inmediatamente
+    valueElement.innerText = newValue;
+}
+
+// Definir variable global para el estado de Consecuencias Imprevistas
+let consecuenciasImprevistasCompleted = false;
+
+// Función para comprobar el valor de Fluzo - adaptada para valores negativos
+function checkFluzoValue() {
+    // Si Consecuencias Imprevistas ya está completado, no permitir cambios
+    if (consecuenciasImprevistasCompleted) {
+        showNotification("Se ha completado Consecuencias Imprevistas. Fluzo condensado está bloqueado.");
+        return;
+    }
+
+    const valueElement = document.getElementById('fluzo-value');
+    if (!valueElement) {
+        console.error("Elemento fluzo-value no encontrado");
+        return;
+    }
+
+    const currentValue = parseInt(valueElement.innerText || '0');
+    const totalElement = document.getElementById('fluzo-total');
+    const currentTotal = totalElement ? parseInt(totalElement.innerText || '0') : 0;
+    
+    // Reset del valor en la caja después de comprobar
+    const valueToCheck = currentValue;
+    valueElement.innerText = '0';
+    valueElement.classList.remove('negative'); // Quitar clase visual de negativo
+    
+    // Calcular el nuevo total (que ahora puede disminuir si valueToCheck es negativo)
+    const newTotal = currentTotal + valueToCheck;
+    
+    // Asegurarse de que no sea un valor negativo en el total
+    const finalTotal = Math.max(0, newTotal);
+    
+    // Determinar mensaje basado en el valor y el ciclo actual
+    let message = null;
+    if (globalTotals['perdicion_cycle'] === 2) {
+        // Plan 1a. Primer avance (ciclo 2)
+        if (finalTotal < 78) {
+            message = "El valor de fluzo condensado es inferior a la media";
+        } else if (finalTotal > 78) {
+            message = "El valor de fluzo condensado es superior a la media";
+        } else if (finalTotal === 78) {
+            message = "¡Estas en la media! No alteres más tu valor de fluzo condensado, trata de ayudar a otros grupos colocando pistas en la Reserva temporal";
+        }
+    } else if (globalTotals['perdicion_cycle'] === 3) {
+        // Plan 1a. Segundo avance (ciclo 3)
+        if (finalTotal < 81) {
+            message = "El valor de fluzo condensado es inferior a la media";
+        } else if (finalTotal > 81) {
+            message = "El valor de fluzo condensado es superior a la media";
+        } else if (finalTotal === 81) {
+            message = "¡Estas en la media! No alteres más tu valor de fluzo condensado, trata de ayudar a otros grupos colocando pistas en la Reserva temporal";
+        }
+    }
+    
+    // Enviar al servidor con el mensaje correspondiente
+    sendFluzoCheckResult(finalTotal, valueToCheck, message);
+}
+
+
+// Función para enviar el resultado de la comprobación al servidor
+function sendFluzoCheckResult(newTotal, checkedValue, customMessage = null) {
+    sendCommand('check_fluzo_value', {
+        total_value: newTotal,
+        checked_value: checkedValue,
+        custom_message: customMessage
+    })
+    .then(data => {
+        if (data.success) {
+            // Actualizar el total con el valor del servidor
+            const totalElement = document.getElementById('fluzo-total');
+            if (totalElement && data.fluzoTotal !== undefined) {
+                totalElement.innerText = data.fluzoTotal;
+                
+                // Añadir animación de resaltado
+                totalElement.classList.add('highlight-animation');
+                
+                // Eliminar la animación después de que termine
+                setTimeout(() => {
+                    totalElement.classList.remove('highlight-animation');
+                }, 1000);
+            }
+            
+            // Si hay un mensaje especial, mostrarlo
+            if (data.message) {
+                showNotification(data.message);
+            }
+            
+            // Verificar si se ha completado Consecuencias Imprevistas
+            if (data.consecuenciasCompleted) {
+                consecuenciasImprevistasCompleted = true;
+                disableFluzoControls();
+            }
+        } else if (data.error) {
+            // Mostrar error
+            showNotification("Error: " + data.error);
+        }
+    })
+    .catch(error => {
+        console.error("Error al comprobar fluzo:", error);
+        showNotification("Error de conexión: No se pudo comprobar el valor de fluzo");
+    });
+}
+
+// Función para deshabilitar los controles de Fluzo
+function disableFluzoControls() {
+    const fluzoBlock = document.querySelector('.resource-block:nth-child(3)'); // La tercera columna es Fluzo
+    
+    if (!fluzoBlock) return;
+    
+    // Aplicar clase de deshabilitado
+    fluzoBlock.classList.add('fluzo-disabled');
+    
+    // Deshabilitar todos los botones
+    const fluzoBtns = fluzoBlock.querySelectorAll('button');
+    fluzoBtns.forEach(btn => {
+        btn.disabled = true;
+        btn.classList.add('disabled');
+    });
+    
+    // Ajustar opacidad del valor
+    const fluzoValue = fluzoBlock.querySelector('#fluzo-value');
+    if (fluzoValue) {
+        fluzoValue.style.opacity = '0.5';
+    }
+    
+    // Agregar mensaje de informativo en el bloque
+    const infoMsg = document.createElement('div');
+    infoMsg.className = 'consecuencias-completed';
+    infoMsg.style.color = '#ff9999';
+    infoMsg.style.fontSize = '12px';
+    infoMsg.style.textAlign = 'center';
+    infoMsg.style.marginTop = '5px';
+    infoMsg.textContent = "Consecuencias Imprevistas completado";
+    
+    // Agregar el mensaje solo si no existe ya
+    if (!fluzoBlock.querySelector('.consecuencias-completed')) {
+        fluzoBlock.appendChild(infoMsg);
+    }
+}
+
+
+
+
+// Función mejorada para mostrar una notificación
+function showNotification(message) {
+    // Crear el elemento de notificación si no existe
+    let notification = document.getElementById('game-notification');
+    if (!notification) {
+        notification = document.createElement('div');
+        notification.id = 'game-notification';
+        notification.className = 'game-notification';
+        
+        // Contenido de la notificación
+        notification.innerHTML = `
+            <div class="notification-content">
+                <p></p>
+                <button class="notification-btn" onclick="closeNotification()">Aceptar</button>
+            </div>
+        `;
+        
+        // Agregar al cuerpo del documento
+        document.body.appendChild(notification);
+    }
+    
+    // Actualizar el mensaje
+    notification.querySelector('p').innerHTML = message;
+    
+    // Hacer que aparezca con una animación
+    notification.classList.add('show');
+}
+
+// Función para cerrar la notificación
+function closeNotification() {
+    const notification = document.getElementById('game-notification');
+    if (notification) {
+        notification.classList.remove('show');
+    }
+}
+        
+// Función para deshabilitar los controles de Perdición
+function disablePerdicionControls() {
+    const perdicionPlus = document.querySelector('[onclick="updatePerdicionValue(1)"]');
+    const perdicionMinus = document.querySelector('[onclick="updatePerdicionValue(-1)"]');
+    const perdicionSend = document.querySelector('[onclick="sendPerdicionValue()"]');
+    
+    if (perdicionPlus) {
+        perdicionPlus.disabled = true;
+        perdicionPlus.classList.add('disabled');
+    }
+    if (perdicionMinus) {
+        perdicionMinus.disabled = true;
+        perdicionMinus.classList.add('disabled');
+    }
+    if (perdicionSend) {
+        perdicionSend.disabled = true;
+        perdicionSend.classList.add('disabled');
+    }
+}
+
+// Función para habilitar los controles de Perdición
+function enablePerdicionControls() {
+    const perdicionPlus = document.querySelector('[onclick="updatePerdicionValue(1)"]');
+    const perdicionMinus = document.querySelector('[onclick="updatePerdicionValue(-1)"]');
+    const perdicionSend = document.querySelector('[onclick="sendPerdicionValue()"]');
+    
+    if (perdicionPlus) {
+        perdicionPlus.disabled = false;
+        perdicionPlus.classList.remove('disabled');
+    }
+    if (perdicionMinus) {
+        perdicionMinus.disabled = false;
+        perdicionMinus.classList.remove('disabled');
+    }
+    if (perdicionSend) {
+        perdicionSend.disabled = false;
+        perdicionSend.classList.remove('disabled');
+    }
+}
+
+// Función actualizada para manejar la desactivación del botón de Biff
+function updateBiffButton(defeats, disableButton = false) {
+    const biffButton = document.getElementById('biff-button');
+    if (!biffButton) return;
+    
+    let text = "";
+    if (defeats === 0) {
+        text = "Sin derrotas";
+    } else if (defeats === 1) {
+        text = "Derrotado 1 vez";
+    } else {
+        text = `Derrotado ${defeats} veces`;
+    }
+    
+    biffButton.textContent = text;
+    
+    // Aplicar animación de resaltado
+    biffButton.classList.add('highlight-animation');
+    
+    // Eliminar la animación después de que termine
+    setTimeout(() => {
+        biffButton.classList.remove('highlight-animation');
+    }, 1000);
+    
+    // Desactivar el botón si es necesario
+    if (disableButton) {
+        biffButton.disabled = true;
+        biffButton.classList.add('disabled');
+        biffButton.style.opacity = '0.5';
+        biffButton.style.cursor = 'not-allowed';
+        biffButton.title = 'Biff Tannen ha sido añadido a la zona de victoria';
+    }
+}
+
+// Función actualizada para derrotar a Biff
+function defeatBiff() {
+    sendCommand('biff_defeat', {})
+    .then(data => {
+        if (data.success) {
+            updateBiffButton(data.defeats, data.disable_button);
+            console.log("Biff ha sido derrotado", data.defeats, "veces");
+            
+            // Mostrar el mensaje de Biff si existe
+            if (data.message) {
+                showNotification(data.message);
+            }
+        } else {
+            console.error("Error al actualizar las derrotas de Biff:", data.error);
+            showNotification("Error: " + (data.error || "No se pudo actualizar las derrotas de Biff"));
+        }
+    })
+    .catch(error => {
+        console.error("Error en la solicitud:", error);
+        showNotification("Error de conexión al actualizar las derrotas de Biff");
+    });
+}
+
+// Función mejorada para resetear los anuncios
+function resetAnnouncements() {
+    if (!confirm("¿Estás seguro de que deseas resetear TODOS los anuncios de esta era?")) {
+        return;
+    }
+    
+    fetch(`/reset_announcements/${eraState.room_id}/${eraState.era}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            // Recargar la página inmediatamente para mostrar cambios
+            window.location.reload();
+        } else {
+            alert("Error: " + data.error);
+        }
+    })
+    .catch(error => {
+        console.error("Error:", error);
+        alert("Ha ocurrido un error al resetear los anuncios.");
+    });
+}
+
+// Función mejorada para resetear las derrotas de Biff
+function resetBiff() {
+    if (!confirm("¿Estás seguro de que deseas resetear el contador de derrotas de Biff?")) {
+        return;
+    }
+    
+    fetch(`/reset_biff/${eraState.room_id}/${eraState.era}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            // Recargar la página inmediatamente para mostrar cambios
+            window.location.reload();
+        } else {
+            alert("Error: " + data.error);
+        }
+    })
+    .catch(error => {
+        console.error("Error:", error);
+        alert("Ha ocurrido un error al resetear el contador de Biff.");
+    });
+}
+
+// Función mejorada para resetear un contador de columna específico
+function resetColumn(column) {
+    if (!confirm(`¿Estás seguro de que deseas resetear el contador de ${column}?`)) {
+        return;
+    }
+    
+    fetch(`/reset_column/${eraState.room_id}/${column}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            // Recargar la página inmediatamente para mostrar cambios
+            window.location.reload();
+        } else {
+            alert("Error: " + data.error);
+        }
+    })
+    .catch(error => {
+        console.error("Error:", error);
+        alert(`Ha ocurrido un error al resetear el contador de ${column}.`);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Inicializar Socket.IO
+    const socket = io(eraState.socketio_options);
+    eraSocket = socket;
+    
+    // Variables para almacenar el estado actual
+    const currentRoom = eraState.room_id;
+    const currentEra = eraState.era;
+    
+    // Unirse a la sala correspondiente
+    socket.emit('join', { room: `room_${currentRoom}`, era: currentEra });
+    
+    // El servidor agrupa los eventos de cada intervalo en un solo mensaje 'batch'
+    socket.on('batch', function(events) {
+        events.forEach(function([event, data]) {
+            socket.listeners(event).forEach(function(listener) {
+                listener(data);
+            });
+        });
+    });
+    
+    // Verificar el estado inicial de Fluzo basado en el ciclo de perdición
+    const initialPerdicionCycle = eraState.perdicion_cycle;
+    toggleFluzoBasedOnCycle(initialPerdicionCycle, true); // true indica que es carga inicial
+
+    // Verificar si el botón de Biff ya está desactivado
+    const biffButton = document.getElementById('biff-button');
+    if (biffButton && biffButton.classList.contains('disabled')) {
+        biffButton.disabled = true;
+        biffButton.style.opacity = '0.5';
+        biffButton.style.cursor = 'not-allowed';
+        biffButton.title = 'Biff Tannen ha sido añadido a la zona de victoria';
+    }
+
+    
+    // ========== EVENTOS PARA PERDICIÓN ==========
+    
+    // Evento de actualización de perdición
+    socket.on('perdicion_update', function(data) {
+        // Verificar que la actualización sea para nuestra sala y era
+        if (data.room_id === currentRoom && data.era === currentEra) {
+            // Actualizar el total local
+            const totalElement = document.getElementById('perdicion-total');
+            if (totalElement) {
+                totalElement.innerText = data.columnTotal;
+                
+                // Añadir animación de resaltado
+                totalElement.classList.add('highlight-animation');
+                
+                // Eliminar la animación después de que termine
+                setTimeout(() => {
+                    totalElement.classList.remove('highlight-animation');
+                }, 1000);
+            }
+            
+            // Actualizar el ciclo si está presente
+            if (data.perdicionCycle) {
+                updatePerdicionCycle(data.perdicionCycle);
+            }
+            
+            // Mostrar notificación si existe
+            if (data.notification) {
+                showNotification(data.notification);
+            }
+        }
+    });
+    
+    // Evento de actualización global de perdición
+    socket.on('global_perdicion_update', function(data) {
+        // Actualizar el total global
+        const globalElement = document.getElementById('perdicion-global');
+        if (globalElement) {
+            globalTotals['perdicion'] = data.globalTotal;
+            globalElement.innerText = data.globalTotal;
+            
+            // Añadir animación de resaltado
+            globalElement.classList.add('highlight-animation');
+            
+            // Eliminar la animación después de que termine
+            setTimeout(() => {
+                globalElement.classList.remove('highlight-animation');
+            }, 1000);
+        }
+        
+        // Actualizar el ciclo si está presente
+        if (data.perdicionCycle) {
+            updatePerdicionCycle(data.perdicionCycle);
+        }
+        
+        // Mostrar notificación si existe
+        if (data.notification) {
+            showNotification(data.notification);
+        }
+    });
+    
+    // Evento de completado de ciclo de perdición (afecta a todos los clientes)
+    socket.on('perdicion_cycle_completed', function(data) {
+        console.log("¡Se ha completado un ciclo de perdición!", data);
+        
+        // Reiniciar el contador de "perdición" en la interfaz actual
+        const perdicionTotalElement = document.getElementById('perdicion-total');
+        if (perdicionTotalElement) {
+            perdicionTotalElement.innerText = '0';
+            perdicionTotalElement.classList.add('highlight-animation');
+            
+            // Eliminar la animación después de que termine
+            setTimeout(() => {
+                perdicionTotalElement.classList.remove('highlight-animation');
+            }, 1000);
+        }
+        
+        // Actualizar el ciclo de perdición
+        updatePerdicionCycle(data.perdicionCycle);
+        
+        // Actualizar el contador global a 0
+        const globalElement = document.getElementById('perdicion-global');
+        if (globalElement) {
+            globalTotals['perdicion'] = 0;
+            globalElement.innerText = '0';
+            
+            // Añadir animación de resaltado
+            globalElement.classList.add('highlight-animation');
+            
+            // Eliminar la animación después de que termine
+            setTimeout(() => {
+                globalElement.classList.remove('highlight-animation');
+            }, 1000);
+        }
+        
+        // Mostrar notificación solo en la era y sala donde se originó el evento
+        if (currentRoom === data.originRoom && currentEra === data.originEra && data.notification) {
+            showNotification(data.notification);
+        }
+        
+        // Si estamos pasando al ciclo 3, mostrar la notificación de Fluzo modificado
+        if (data.perdicionCycle === 3) {
+            showNotification("El nivel de Fluzo condensado ha sido alterado");
+        }
+    });
+    
+    // ========== EVENTOS PARA RESERVA ==========
+    
+    // Evento de actualización de reserva
+    socket.on('reserva_update', function(data) {
+        // Verificar que la actualización sea para nuestra sala y era
+        if (data.room_id === currentRoom && data.era === currentEra) {
+            // Actualizar el total local
+            const totalElement = document.getElementById('reserva-total');
+            if (totalElement) {
+                totalElement.innerText = data.columnTotal;
+                
+                // Añadir animación de resaltado
+                totalElement.classList.add('highlight-animation');
+                
+                // Eliminar la animación después de que termine
+                setTimeout(() => {
+                    totalElement.classList.remove('highlight-animation');
+                }, 1000);
+            }
+        }
+    });
+    
+    // Evento de actualización global de reserva
+    socket.on('global_reserva_update', function(data) {
+        // Actualizar el total global
+        const globalElement = document.getElementById('reserva-global');
+        if (globalElement) {
+            globalTotals['reserva'] = data.globalTotal;
+            globalElement.innerText = data.globalTotal;
+            
+            // Añadir animación de resaltado
+            globalElement.classList.add('highlight-animation');
+            
+            // Eliminar la animación después de que termine
+            setTimeout(() => {
+                globalElement.classList.remove('highlight-animation');
+            }, 1000);
+        }
+    });
+    
+    // ========== EVENTOS PARA FLUZO ==========
+    
+    // Evento de actualización de fluzo
+socket.on('fluzo_update', function(data) {
+    // Verificar que la actualización sea para nuestra sala y era
+    if (data.room_id === currentRoom && data.era === currentEra) {
+        console.log("Recibido evento de actualización de fluzo", data);
+        
+        // Actualizar el valor en pantalla (la caja)
+        const valueElement = document.getElementById('fluzo-value');
+        if (valueElement && data.fluzoValue !== undefined) {
+            valueElement.innerText = data.fluzoValue;
+        }
+        
+        // Actualizar el total acumulado (solo visible para admin)
+        const totalElement = document.getElementById('fluzo-total');
+        if (totalElement && data.fluzoTotal !== undefined) {
+            // Si el elemento existe, actualizar su valor interno aunque no sea visible
+            totalElement.innerText = data.fluzoTotal;
+            
+            // Agregar la animación solo si el elemento es visible (para admins)
+            if (window.getComputedStyle(totalElement).display !== 'none') {
+                totalElement.classList.add('highlight-animation');
+                
+                // Eliminar la animación después de que termine
+                setTimeout(() => {
+                    totalElement.classList.remove('highlight-animation');
+                }, 1000);
+            }
+        }
+        
+        // Verificar el estado de Consecuencias Imprevistas
+        if (data.consecuenciasCompleted) {
+            consecuenciasImprevistasCompleted = true;
+            disableFluzoControls();
+        }
+        
+        // Si hay un mensaje y NO estamos en modo silencioso, mostrarlo
+        if (data.message && !data.silent) {
+            showNotification(data.message);
+        }
+    }
+});
+    
+    // ========== EVENTOS PARA CONSECUENCIAS IMPREVISTAS ==========
+    
+    // Evento cuando se completa Consecuencias Imprevistas (se enviará a todos los clientes)
+    socket.on('consecuencias_imprevistas_completed', function(data) {
+        console.log("Recibido evento de Consecuencias Imprevistas completado", data);
+        
+        // Actualizar el estado global
+        consecuenciasImprevistasCompleted = true;
+        
+        // Deshabilitar controles de Fluzo
+        disableFluzoControls();
+        
+        // Mostrar notificación
+        if (data.message) {
+            showNotification(data.message);
+        }
+    });
+
+    // ========== OTROS EVENTOS ==========
+    
+    // Escuchar eventos de reinicio del servidor
+    socket.on('server_reset', function(data) {
+        alert(data.message);
+        window.location.reload();
+    });
+    
+    // Escuchar eventos de actualización de botones
+    // Estado de los anuncios de la sala: versión (bitmask de progreso) y bitmask de botones disponibles.
+    // Cada button_update trae solo los bits que cambian respecto a la versión base
+    let buttonState = eraState.button_state;
+    const buttonOffset = eraState.button_offset;
+    const buttonCount = eraState.button_count;
+    
+    // Actualizar los botones de la era actual según el estado de la sala
+    function renderButtons() {
+        for (let idx = 0; idx < buttonCount; idx++) {
+            const buttonForm = document.getElementById(`form-button-${idx}`);
+            if (!buttonForm) {
+                continue;
+            }
+            const buttonElement = buttonForm.querySelector('button');
+            const isActive = (buttonState.version >> (buttonOffset + idx)) & 1;
+            const isAvailable = (buttonState.available >> (buttonOffset + idx)) & 1;
+            
+            // Primero eliminamos todas las clases de estado
+            buttonElement.classList.remove('available', 'disabled');
+            
+            if (isActive) {
+                buttonElement.classList.add('active');
+                buttonElement.disabled = false;
+                if (!buttonElement.querySelector('.status-badge')) {
+                    const badge = document.createElement('span');
+                    badge.className = 'status-badge';
+                    badge.textContent = 'Completado';
+                    buttonElement.appendChild(badge);
+                }
+            } else {
+                buttonElement.classList.remove('active');
+                const badge = buttonElement.querySelector('.status-badge');
+                if (badge) {
+                    badge.remove();
+                }
+                
+                // Si no está activo, determinar si está disponible o deshabilitado
+                if (isAvailable) {
+                    buttonElement.classList.add('available');
+                    buttonElement.disabled = false;
+                } else {
+                    buttonElement.classList.add('disabled');
+                    buttonElement.disabled = true;
+                }
+            }
+        }
+    }
+    
+    // Pedir el estado completo de los botones cuando se ha perdido alguna actualización
+    function requestButtonSnapshot() {
+        socket.emit('button_sync', { room_id: currentRoom }, function(snapshot) {
+            if (snapshot && snapshot.success) {
+                buttonState = { room_id: snapshot.room_id, version: snapshot.version, available: snapshot.available };
+                renderButtons();
+            }
+        });
+    }
+    
+    socket.on('button_update', function(data) {
+        // Verificar que la actualización sea para nuestra sala
+        if (data.room_id === currentRoom) {
+            // Si la versión base no coincide con la local falta alguna actualización
+            if (data.base !== buttonState.version) {
+                console.log("Salto de versión en los botones, pidiendo el estado completo", data);
+                requestButtonSnapshot();
+                return;
+            }
+            
+            buttonState.version ^= data.changed;
+            buttonState.available ^= data.flips;
+            renderButtons();
+        }
+    });
+    
+    // Tras una reconexión, volver a unirse a la sala y recuperar los cambios perdidos
+    socket.io.on('reconnect', function() {
+        socket.emit('join', { room: `room_${currentRoom}`, era: currentEra });
+        requestButtonSnapshot();
+        refreshState();
+    });
+    
+    // Escuchar eventos de actualización de Biff
+        socket.on('biff_update', function(data) {
+        // Verificar que la actualización sea para nuestra sala y era
+        if (data.room_id === currentRoom && data.era === currentEra) {
+            updateBiffButton(data.defeats, data.disable_button);
+        
+            // Mostrar el mensaje de Biff si existe
+            if (data.message) {
+                showNotification(data.message);
+            }
+        }
+    });
+    
+    // ========== CARGA INICIAL DE DATOS ==========
+    
+    // Los totales de columna y los contadores globales llegan en eraState con la página; tras una
+    // reconexión se vuelven a pedir con /state
+    function applyColumnTotals(columnTotals) {
+        // Actualizar perdición
+        const perdicionTotalElement = document.getElementById('perdicion-total');
+        if (perdicionTotalElement && columnTotals.perdicion !== undefined) {
+            perdicionTotalElement.innerText = columnTotals.perdicion;
+        }
+        
+        // Actualizar reserva
+        const reservaTotalElement = document.getElementById('reserva-total');
+        if (reservaTotalElement && columnTotals.reserva !== undefined) {
+            reservaTotalElement.innerText = columnTotals.reserva;
+        }
+        
+        // Actualizar fluzo si existe 
+        // El elemento puede ser visible o no, pero siempre debe mantener el valor correcto internamente
+        const fluzoTotalElement = document.getElementById('fluzo-total');
+        if (fluzoTotalElement && columnTotals.fluzo !== undefined) {
+            fluzoTotalElement.innerText = columnTotals.fluzo;
+        }
+    }
+    
+    // Verificar si Consecuencias Imprevistas ya está completado
+    function applyConsecuenciasImprevistasStatus(counters) {
+        if (counters.consecuencias_imprevistas) {
+            consecuenciasImprevistasCompleted = true;
+            disableFluzoControls();
+        }
+    }
+    
+    function refreshState() {
+        fetch(`/state/${currentRoom}/${currentEra}`, {
+            method: 'GET',
+            headers: {
+                'Content-Type': 'application/json',
+            }
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Error de red: ' + response.status);
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (data.success) {
+                applyColumnTotals(data.column_totals);
+                applyConsecuenciasImprevistasStatus(data.global_counters);
+            }
+        })
+        .catch(error => {
+            console.error("Error al obtener el estado de la sala:", error);
+        });
+    }
+    
+    // Verificar el estado de Consecuencias Imprevistas al cargar la página
+    applyConsecuenciasImprevistasStatus(eraState.global_counters);
+    
+    // Verificar si estamos en el ciclo 4 (después del tercer ciclo) al cargar
+    const perdicionCycle = eraState.perdicion_cycle;
+    if (perdicionCycle > 3) {
+        disablePerdicionControls();
+    }
+
+    // ========== EVENTOS PARA LAS CONDICIONES DE VICTORIA ==========
+    
+// Escuchar el evento de condiciones de victoria cumplidas
+socket.on('victory_conditions_met', function(data) {
+    console.log("¡Se han cumplido las condiciones de victoria!", data);
+    
+    // Mostrar notificación especial
+    if (data.message) {
+        // Determinar qué resolución mostrar basado en el mensaje
+        let imageHtml = '';
+        let messageText = '';
+        
+        if (data.message === "->R1") {
+            imageHtml = document.getElementById('resolution-image-r1').innerHTML;
+            messageText = "->R1";
+        } else if (data.message === "->R2") {
+            imageHtml = document.getElementById('resolution-image-r2').innerHTML;
+            messageText = "->R2";
+        }
+        
+        // Crear un estilo especial para la notificación de victoria
+        const victoryNotification = document.createElement('div');
+        victoryNotification.id = 'victory-notification';
+        victoryNotification.className = 'game-notification show';
+        
+        // Contenido de la notificación con la imagen
+        victoryNotification.innerHTML = `
+            <div class="notification-content">
+                ${imageHtml}
+                <p>${messageText}</p>
+                <button class="notification-btn" onclick="closeVictoryNotification()">¡Entendido!</button>
+            </div>
+        `;
+        
+        // Agregar al cuerpo del documento, reemplazando cualquier notificación de victoria existente
+        const existingVictory = document.getElementById('victory-notification');
+        if (existingVictory) {
+            existingVictory.remove();
+        }
+        document.body.appendChild(victoryNotification);
+    }
+});
+    
+ 
+    
+    // Función para cerrar la notificación de victoria
+    function closeVictoryNotification() {
+        const notification = document.getElementById('victory-notification');
+        if (notification) {
+            // Remover después de la animación
+            if (notification.parentNode) {
+                notification.parentNode.removeChild(notification);
+            }
+        }
+    }
+
+
+    // ========== MODAL DE PREPARACIÓN CON NAVEGACIÓN DE IMÁGENES ==========
+    
+    // Elementos del DOM
+    const prepModal = document.getElementById('prep-modal');
+    const prepButton = document.getElementById('prep-button');
+    const closeModal = document.querySelector('.close-modal');
+    const prevButton = document.getElementById('prev-image');
+    const nextButton = document.getElementById('next-image');
+    const imageCounter = document.getElementById('image-counter');
+    
+    // Variables para la navegación
+    let currentImageIndex = 0;
+    let prepImages = [];
+    
+    // Función para inicializar las imágenes y contadores
+    function initializeImageNavigation() {
+        // Seleccionar todas las imágenes disponibles
+        prepImages = document.querySelectorAll('.prep-image');
+        const totalImages = prepImages.length;
+        
+        // Actualizar el contador inicial
+        if (imageCounter) {
+            imageCounter.textContent = `1 / ${totalImages}`;
+        }
+        
+        // Deshabilitar el botón anterior inicialmente (estamos en la primera imagen)
+        if (prevButton) {
+            prevButton.disabled = true;
+        }
+        
+        // Deshabilitar el botón siguiente si solo hay una imagen
+        if (nextButton) {
+            nextButton.disabled = totalImages <= 1;
+        }
+    }
+    
+    // Función para actualizar la imagen visible
+    function updateImage() {
+        const totalImages = prepImages.length;
+        
+        // Ocultar todas las imágenes
+        prepImages.forEach(img => img.classList.remove('active'));
+        
+        // Mostrar la imagen actual
+        if (prepImages[currentImageIndex]) {
+            prepImages[currentImageIndex].classList.add('active');
+        }
+        
+        // Actualizar el contador
+        if (imageCounter) {
+            imageCounter.textContent = `${currentImageIndex + 1} / ${totalImages}`;
+        }
+        
+        // Habilitar/deshabilitar botones según la posición
+        if (prevButton) {
+            prevButton.disabled = currentImageIndex === 0;
+        }
+        if (nextButton) {
+            nextButton.disabled = currentImageIndex === totalImages - 1;
+        }
+    }
+    
+    // Evento para imagen anterior
+    if (prevButton) {
+        prevButton.addEventListener('click', function() {
+            if (currentImageIndex > 0) {
+                currentImageIndex--;
+                updateImage();
+            }
+        });
+    }
+    
+    // Evento para imagen siguiente
+    if (nextButton) {
+        nextButton.addEventListener('click', function() {
+            if (prepImages && currentImageIndex < prepImages.length - 1) {
+                currentImageIndex++;
+                updateImage();
+            }
+        });
+    }
+    
+    // Abrir el modal cuando se hace clic en el botón
+    if (prepButton) {
+        prepButton.addEventListener('click', function() {
+            prepModal.style.display = 'block';
+            document.body.style.overflow = 'hidden'; // Evitar scroll
+            
+            // Inicializar la navegación y mostrar la primera imagen
+            currentImageIndex = 0;
+            initializeImageNavigation();
+            updateImage();
+        });
+    }
+    
+    // Cerrar el modal cuando se hace clic en la X
+    if (closeModal) {
+        closeModal.addEventListener('click', function() {
+            prepModal.style.display = 'none';
+            document.body.style.overflow = 'auto'; // Restaurar scroll
+        });
+    }
+    
+    // Cerrar el modal si se hace clic fuera de él
+    window.addEventListener('click', function(event) {
+        if (event.target === prepModal) {
+            prepModal.style.display = 'none';
+            document.body.style.overflow = 'auto'; // Restaurar scroll
+        }
+    });
+    
+    // Añadir evento para tecla Escape y navegación con flechas
+    window.addEventListener('keydown', function(event) {
+        if (prepModal && prepModal.style.display === 'block') {
+            if (event.key === 'Escape') {
+                prepModal.style.display = 'none';
+                document.body.style.overflow = 'auto'; // Restaurar scroll
+            } else if (event.key === 'ArrowLeft' && currentImageIndex > 0) {
+                currentImageIndex--;
+                updateImage();
+            } else if (event.key === 'ArrowRight' && prepImages && currentImageIndex < prepImages.length - 1) {
+                currentImageIndex++;
+                updateImage();
+            }
+        }
+    });
+});
+
+// Añadir la nueva función closeVictoryNotification al bloque <script> si no está incluida en el código JavaScript anterior
+function closeVictoryNotification() {
+    const notification = document.getElementById('victory-notification');
+    if (notification) {
+        notification.classList.remove('show');
+        // Remover después de la animación
+        setTimeout(() => {
+            if (notification.parentNode) {
+                notification.parentNode.removeChild(notification);
+            }
+        }, 300);
+    }
+}
+
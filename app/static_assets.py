@@ -0,0 +1,203 @@
+"""Archivos estáticos con huella de contenido, caché inmutable y versiones precomprimidas.
+
+Al arrancar se calcula el hash de cada archivo de static/, que sirve de ETag fuerte y de huella:
+url_for('static', filename=...) añade ?v=<hash> a la URL, y las peticiones con la huella vigente
+se sirven con Cache-Control: immutable (el navegador no vuelve a preguntar hasta que el archivo
+cambia y con él la URL). Sin huella, o con una antigua, la respuesta se revalida con el ETag.
+
+Los archivos de texto (CSS, JS, SVG...) tienen al lado sus versiones .gz y .br (esta última solo
+si está instalado el módulo brotli), que se eligen según Accept-Encoding. Se generan al desplegar
+(python -m app.static_assets) o al arrancar si faltan. Las respuestas se envían con send_file a
+partir del archivo en disco, de modo que el servidor puede usar sendfile sin copiar el contenido.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Extensiones que merece la pena comprimir (las imágenes y las fuentes woff2 ya lo están)
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.html', '.txt', '.map', '.ttf', '.otf', '.ico')
+# Codificaciones precomprimidas por orden de preferencia: (Content-Encoding, extensión)
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+# Duración de la caché de las URL con huella (un año)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def content_hash(path):
+    """Hash del contenido de un archivo"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as asset_file:
+        for block in iter(lambda: asset_file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compress_sibling(path, encoding):
+    """Escribe la versión comprimida de un archivo si falta o es más antigua que el original.
+    Devuelve la ruta, o None si no se puede generar o no reduce el tamaño"""
+    extension = dict(ENCODINGS)[encoding]
+    sibling = path + extension
+    stat = os.stat(path)
+    if os.path.exists(sibling) and os.stat(sibling).st_mtime_ns >= stat.st_mtime_ns:
+        return sibling
+    if encoding == 'br' and brotli is None:
+        return None
+
+    with open(path, 'rb') as asset_file:
+        data = asset_file.read()
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=11)
+    else:
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) >= len(data) * 0.9:
+        return None
+
+    temp_path = f"{sibling}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as sibling_file:
+        sibling_file.write(compressed)
+    os.replace(temp_path, sibling)
+    return sibling
+
+
+class StaticAssets:
+    """Registro de los archivos estáticos (hash, tipo y versiones comprimidas) y vista que los sirve"""
+
+    _static_folder = None
+    _assets = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def init_app(cls, app):
+        """Indexa static/ y sustituye la vista de archivos estáticos de Flask"""
+        cls.configure(app.static_folder)
+        cls.scan()
+        app.view_functions['static'] = cls.send_static
+
+        @app.url_defaults
+        def fingerprint_static(endpoint, values):
+            # Huella de contenido en todas las URL de url_for('static', ...)
+            if endpoint == 'static' and 'filename' in values and 'v' not in values:
+                asset = cls.lookup(values['filename'])
+                if asset is not None:
+                    values['v'] = asset["fingerprint"]
+
+    @classmethod
+    def configure(cls, static_folder):
+        with cls._lock:
+            cls._static_folder = static_folder
+            cls._assets = {}
+
+    @classmethod
+    def scan(cls, compress=True):
+        """Calcula el hash de todos los archivos (y genera las versiones comprimidas que falten)"""
+        for directory, _, names in os.walk(cls._static_folder):
+            for name in names:
+                if name.endswith(('.gz', '.br', '.tmp')):
+                    continue
+                path = os.path.join(directory, name)
+                filename = os.path.relpath(path, cls._static_folder).replace(os.sep, '/')
+                cls._index(filename, path, compress)
+        return cls._assets
+
+    @classmethod
+    def _index(cls, filename, path, compress=True):
+        stat = os.stat(path)
+        digest = content_hash(path)
+        encodings = {}
+        if compress and filename.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+            for encoding, _ in ENCODINGS:
+                try:
+                    sibling = compress_sibling(path, encoding)
+                except OSError:
+                    # Directorio de solo lectura: servir sin comprimir
+                    sibling = None
+                if sibling is not None:
+                    encodings[encoding] = sibling
+        asset = {
+            "path": path,
+            "fingerprint": digest[:12],
+            "etag": digest[:32],
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "mimetype": mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            "encodings": encodings,
+        }
+        with cls._lock:
+            cls._assets[filename] = asset
+        return asset
+
+    @classmethod
+    def lookup(cls, filename):
+        """Datos de un archivo estático (se indexa si es nuevo, p. ej. una variante de imagen
+        generada después de arrancar); None si no existe"""
+        asset = cls._assets.get(filename)
+        if asset is not None:
+            return asset
+        path = safe_join(cls._static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        return cls._index(filename, path)
+
+    @classmethod
+    def send_static(cls, filename):
+        """Vista de /static/<filename>"""
+        asset = cls.lookup(filename)
+        if asset is None:
+            abort(404)
+        try:
+            stat = os.stat(asset["path"])
+        except OSError:
+            abort(404)
+        if (stat.st_mtime_ns, stat.st_size) != (asset["mtime_ns"], asset["size"]):
+            # El archivo ha cambiado desde que se indexó: nueva huella y nuevo ETag
+            asset = cls._index(filename, asset["path"])
+
+        # Versión precomprimida aceptada por el cliente
+        path, encoding = asset["path"], None
+        for candidate, _ in ENCODINGS:
+            if candidate in asset["encodings"] and candidate in request.accept_encodings:
+                path, encoding = asset["encodings"][candidate], candidate
+                break
+
+        fingerprinted = request.args.get('v') == asset["fingerprint"]
+        etag = asset["etag"] if encoding is None else f'{asset["etag"]}-{encoding}'
+        response = send_file(path, mimetype=asset["mimetype"], download_name=os.path.basename(filename),
+                             etag=etag, last_modified=stat.st_mtime, conditional=True,
+                             max_age=IMMUTABLE_MAX_AGE if fingerprinted else None)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if asset["encodings"]:
+            response.vary.add('Accept-Encoding')
+        if fingerprinted:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
+
+
+def main():
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    StaticAssets.configure(static_folder)
+    assets = StaticAssets.scan()
+    if brotli is None:
+        print("Módulo brotli no instalado: solo se generan versiones .gz")
+    print(f"{'archivo':<50} {'bytes':>9} {'gzip':>9} {'br':>9}")
+    for filename, asset in sorted(assets.items()):
+        sizes = [os.path.getsize(asset["encodings"][encoding]) if encoding in asset["encodings"] else None
+                 for encoding in ('gzip', 'br')]
+        if any(sizes):
+            print(f"{filename:<50} {asset['size']:>9} " +
+                  ' '.join(f"{size:>9}" if size else f"{'-':>9}" for size in sizes))
+    print(f"{len(assets)} archivos indexados")
+
+
+if __name__ == '__main__':
+    main()
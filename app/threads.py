@@ -0,0 +1,105 @@
+"""Hilos del sistema operativo para el trabajo de fondo que bloquea (disco, stdout).
+
+Bajo gevent threading.Thread, threading.Lock/Event y time.sleep están parcheados: un "hilo" es un
+greenlet del mismo hub, así que una escritura lenta o un fsync en él detiene todas las peticiones
+del worker. Los escritores de fondo (SQLite, diario de mutaciones, logs) se arrancan por eso con
+las funciones originales de _thread y se coordinan con los greenlets mediante locks originales y
+colas de _queue, que funcionan entre hilos reales. Sin gevent son las funciones de siempre.
+
+Los greenlets solo toman estos locks durante operaciones cortas en memoria (nunca cediendo el hub
+con el lock adquirido), de modo que esperarlos no llega a bloquear el hub de forma apreciable.
+"""
+import _queue
+import _thread
+import time
+
+
+def original_thread_functions():
+    """start_new_thread, get_ident y sleep sin monkey patching de gevent"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return _thread.start_new_thread, _thread.get_ident, time.sleep
+    if not monkey.is_module_patched('threading'):
+        return _thread.start_new_thread, _thread.get_ident, time.sleep
+    return (monkey.get_original('_thread', 'start_new_thread'), monkey.get_original('_thread', 'get_ident'),
+            monkey.get_original('time', 'sleep'))
+
+
+def allocate_lock():
+    """Lock del sistema operativo (sin monkey patching), seguro entre hilos reales y greenlets"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return _thread.allocate_lock()
+    if not monkey.is_module_patched('threading'):
+        return _thread.allocate_lock()
+    return monkey.get_original('_thread', 'allocate_lock')()
+
+
+def sleep(seconds):
+    """Duerme el hilo actual sin ceder el hub de gevent (para los hilos de fondo)"""
+    original_thread_functions()[2](seconds)
+
+
+# Cola sin límite de _queue (en C): put nunca bloquea y get espera con un lock del sistema
+SimpleQueue = _queue.SimpleQueue
+Empty = _queue.Empty
+
+
+class Wakeup:
+    """Aviso a un hilo de fondo de que hay trabajo pendiente (como threading.Event).
+
+    set() y clear() se pueden llamar desde cualquier greenlet o hilo; wait() solo desde el hilo de
+    fondo, porque espera bloqueando el hilo actual.
+    """
+
+    def __init__(self):
+        self._lock = allocate_lock()
+        self._signals = SimpleQueue()
+        self._pending = False
+
+    def set(self):
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+        self._signals.put(None)
+
+    def clear(self):
+        with self._lock:
+            self._pending = False
+
+    def wait(self, timeout=None):
+        """Espera a un set(); devuelve False si pasa timeout sin aviso"""
+        try:
+            self._signals.get(timeout=timeout)
+            return True
+        except Empty:
+            return False
+
+
+class BackgroundThread:
+    """Hilo del sistema operativo que ejecuta target(*args) (también bajo gevent)"""
+
+    def __init__(self, target, args=(), name=None):
+        self.target = target
+        self.args = args
+        self.name = name
+        self._done = allocate_lock()
+
+    def start(self):
+        self._done.acquire()
+        start_new_thread = original_thread_functions()[0]
+        start_new_thread(self._run, ())
+
+    def _run(self):
+        try:
+            self.target(*self.args)
+        finally:
+            self._done.release()
+
+    def join(self, timeout=None):
+        """Espera a que termine target (bloquea el hilo actual; pensado para el cierre)"""
+        if self._done.acquire(timeout=-1 if timeout is None else timeout):
+            self._done.release()
@@ -0,0 +1,2 @@
+# Benchmarks de rendimiento de la aplicación.
+# Se ejecutan desde la raíz del proyecto, por ejemplo: python -m benchmarks.bench_availability
@@ -0,0 +1,78 @@
+"""Compara la tabla de disponibilidad precalculada con la evaluación de dependencias por petición.
+
+Uso: python -m benchmarks.bench_availability [--iterations N]
+"""
+import argparse
+import random
+import timeit
+
+from app.models.game_data import GameData
+
+
+def evaluate_per_request(progress):
+    """Evaluación original: recorre y parsea las dependencias de cada botón en cada petición"""
+    available_buttons = {
+        "pasado": [],
+        "presente": [],
+        "futuro": []
+    }
+    for era in ["pasado", "presente", "futuro"]:
+        for i in range(len(GameData.button_info[era])):
+            is_available = True
+            for dep in GameData.button_dependencies[era][i]:
+                dep_era, dep_idx = dep.split('-')
+                dep_idx = int(dep_idx)
+                if not progress[dep_era][dep_idx]:
+                    is_available = False
+                    break
+            available_buttons[era].append(is_available)
+    return available_buttons
+
+
+def random_progress(rng):
+    """Genera un estado de progreso aleatorio con el formato de GameData"""
+    return {era: [rng.random() < 0.5 for _ in GameData.button_info[era]] for era in GameData.eras}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+    
+    rng = random.Random(42)
+    states = [random_progress(rng) for _ in range(1024)]
+    masks = [GameData.progress_mask(progress) for progress in states]
+    
+    # Comprobar que ambos métodos dan el mismo resultado antes de medir
+    for progress, mask in zip(states, masks):
+        assert evaluate_per_request(progress) == GameData.lookup_available_buttons(mask)
+    
+    def run_per_request():
+        for progress in states:
+            evaluate_per_request(progress)
+    
+    def run_table_from_progress():
+        for progress in states:
+            GameData.lookup_available_buttons(GameData.progress_mask(progress))
+    
+    def run_table_from_mask():
+        for mask in masks:
+            GameData.lookup_available_buttons(mask)
+    
+    rounds = max(1, args.iterations // len(states))
+    results = [
+        ("evaluación por petición", run_per_request),
+        ("tabla (desde progress)", run_table_from_progress),
+        ("tabla (desde bitmask)", run_table_from_mask),
+    ]
+    baseline = None
+    print(f"{len(GameData._availability_table)} entradas en la tabla, {rounds * len(states)} consultas por método")
+    for name, func in results:
+        elapsed = min(timeit.repeat(func, number=rounds, repeat=3))
+        per_call = elapsed / (rounds * len(states)) * 1e9
+        baseline = baseline or per_call
+        print(f"{name:<26} {per_call:10.1f} ns/consulta  x{baseline / per_call:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Compara el tamaño de button_update con deltas frente al volcado completo anterior y comprueba
+que un cliente que aplica los deltas (también agrupados por el dispatcher) llega al mismo estado.
+
+Uso: python -m benchmarks.bench_button_update [--toggles N] [--interval-ms 30]
+"""
+import argparse
+import json
+import random
+
+from app import create_app, dispatcher, socketio
+from app.controllers.room_controller import button_snapshot, get_available_buttons
+from app.models.game_data import GameData
+
+
+class SimulatedClient:
+    """Aplica los button_update como lo hace era.html y pide la instantánea si falta alguno"""
+
+    def __init__(self, snapshot):
+        self.version = snapshot['version']
+        self.available = snapshot['available']
+        self.snapshots = 0
+
+    def receive(self, event, data):
+        if event == 'batch':
+            for batched_event, batched_data in data:
+                self.receive(batched_event, batched_data)
+        elif event == 'button_update':
+            if data['base'] != self.version:
+                snapshot = button_snapshot(GameData.initialize_room_data(data['room_id']))
+                self.version, self.available = snapshot['version'], snapshot['available']
+                self.snapshots += 1
+            else:
+                self.version ^= data['changed']
+                self.available ^= data['flips']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--toggles', type=int, default=2000)
+    parser.add_argument('--interval-ms', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    dispatcher.interval = args.interval_ms / 1000.0
+    client = app.test_client()
+    client.post('/', data={'admin_username': 'admin1', 'admin_password': 'clave1'})
+
+    room_id = 1
+    listener = SimulatedClient(button_snapshot(GameData.initialize_room_data(room_id)))
+    frames = []
+
+    def deliver(event, data=None, room=None):
+        if room == f"room_{room_id}":
+            frames.append(len(json.dumps([event, data])))
+            listener.receive(event, data)
+
+    socketio.emit = deliver
+
+    rng = random.Random(args.seed)
+    delta_bytes = full_bytes = 0
+    for i in range(args.toggles):
+        era = rng.choice(GameData.eras)
+        button_idx = rng.randrange(len(GameData.button_info[era]))
+        response = client.post(f"/toggle_button/{room_id}/{era}/{button_idx}",
+                               headers={'X-Requested-With': 'XMLHttpRequest'}).get_json()
+        assert response['success'], response
+
+        # Tamaño del evento con el formato anterior (progreso y disponibilidad completos)
+        room_data = GameData.initialize_room_data(room_id)
+        delta_bytes += len(json.dumps({key: response[key] for key in ('base', 'changed', 'flips')}))
+        full_bytes += len(json.dumps({'progress': room_data.progress_dict(),
+                                      'available_buttons': get_available_buttons(room_data.progress)}))
+        # Vaciar el buffer de vez en cuando para mezclar deltas agrupados y sueltos
+        if rng.random() < 0.3:
+            dispatcher.flush()
+    dispatcher.flush()
+
+    expected = button_snapshot(GameData.initialize_room_data(room_id))
+    assert (listener.version, listener.available) == (expected['version'], expected['available'])
+
+    print(f"{args.toggles} toggles: estado de botones {full_bytes / args.toggles:.0f} bytes por evento "
+          f"con el volcado completo, {delta_bytes / args.toggles:.1f} bytes con deltas")
+    print(f"{len(frames)} mensajes a la sala ({sum(frames) / len(frames):.0f} bytes de media), "
+          f"{dispatcher.events_merged} deltas combinados, {listener.snapshots} instantáneas pedidas; "
+          f"el cliente simulado coincide con el servidor")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Compara la latencia de las acciones de mesa enviadas como POST HTTP y como evento de Socket.IO
+con ack, con todas las mesas jugando a la vez contra gunicorn (worker geventwebsocket, como en
+render.yaml).
+
+Cada cliente es un móvil: entra con su código de mesa, abre la conexión Socket.IO y se une a su
+sala (recibe los eventos de las demás mesas de su grupo) y lanza acciones sin pausa. En la fase
+HTTP usa una conexión keep-alive con la cookie de sesión; en la de Socket.IO emite el evento con
+id de ack y espera la respuesta por el mismo websocket. La última fase envía las mismas acciones
+agrupadas de cuatro en cuatro en el evento batch_actions (la latencia es la del lote completo).
+
+Uso: python -m benchmarks.bench_commands [--clients 36] [--actions 100]
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import simple_websocket
+
+from benchmarks.check_scale_out import ROOT, free_port, wait_for_server
+
+# Acciones que se alternan: (evento/ruta, datos)
+ACTIONS = [
+    ('update_reserva', {'amount': 1}),
+    ('set_fluzo_value', {'value': 2, 'silent': True}),
+    ('update_reserva', {'amount': -1}),
+    ('set_fluzo_value', {'value': 0, 'silent': True}),
+]
+
+
+class Phone:
+    """Cliente de una mesa: sesión HTTP keep-alive y conexión Socket.IO (protocolo 5 sobre websocket)"""
+
+    def __init__(self, port, code):
+        self.http = http.client.HTTPConnection('127.0.0.1', port)
+        self.http.request('GET', f'/?code={code}')
+        response = self.http.getresponse()
+        response.read()
+        self.cookie = response.getheader('Set-Cookie').split(';')[0]
+        self.room_id, self.era = response.getheader('Location').rstrip('/').split('/')[-2:]
+        self.room_id = int(self.room_id)
+
+        self.ws = simple_websocket.Client(f'ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket',
+                                          headers={'Cookie': self.cookie})
+        assert self.ws.receive().startswith('0')  # open de Engine.IO
+        self.ws.send('40')
+        assert self.receive().startswith('40')  # connect de Socket.IO
+        self.ws.send('42' + json.dumps(['join', {'room': f'room_{self.room_id}'}]))
+        self.ack_id = 0
+        self.events = 0
+
+    def receive(self):
+        """Siguiente mensaje de Socket.IO, respondiendo a los ping de Engine.IO"""
+        while True:
+            message = self.ws.receive()
+            if message == '2':
+                self.ws.send('3')
+                continue
+            return message
+
+    def post(self, command, data):
+        body = json.dumps(data)
+        self.http.request('POST', f'/{command}/{self.room_id}/{self.era}', body=body,
+                          headers={'Content-Type': 'application/json', 'Cookie': self.cookie})
+        response = self.http.getresponse()
+        return json.loads(response.read())
+
+    def emit(self, command, data):
+        """Emite el evento con id de ack y espera su respuesta; los eventos difundidos que lleguen
+        entre medias se cuentan y se descartan"""
+        self.ack_id += 1
+        self.ws.send(f'42{self.ack_id}' + json.dumps([command, dict(data, room_id=self.room_id, era=self.era)]))
+        expected = f'43{self.ack_id}['
+        while True:
+            message = self.receive()
+            if message.startswith(expected):
+                return json.loads(message[len(expected) - 1:])[0]
+            self.events += 1
+
+    def drain(self):
+        """Descarta los eventos difundidos acumulados durante la fase HTTP"""
+        while self.ws.receive(timeout=0) is not None:
+            self.events += 1
+
+    def close(self):
+        self.ws.close()
+        self.http.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=36)
+    parser.add_argument('--actions', type=int, default=100)
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, SECRET_KEY='bench-commands', SQLITE_PATH=os.path.join(directory, 'state.db'))
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-k', 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker',
+             '-w', '1', '-b', f'127.0.0.1:{port}', 'wsgi:app'],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_server(f'http://127.0.0.1:{port}', process)
+            codes = [f'mesa{i % 12 + 1:02d}' for i in range(args.clients)]
+            with ThreadPoolExecutor(args.clients) as executor:
+                phones = list(executor.map(lambda code: Phone(port, code), codes))
+
+            print(f"{args.clients} móviles x {args.actions} acciones, todos a la vez")
+            for mode in ('HTTP POST', 'Socket.IO ack', 'batch_actions'):
+                start_barrier = threading.Barrier(args.clients)
+
+                def play(phone):
+                    send = phone.post if mode == 'HTTP POST' else phone.emit
+                    steps = [ACTIONS[i % len(ACTIONS)] for i in range(args.actions)]
+                    if mode == 'batch_actions':
+                        steps = [('batch_actions', {'operations': [dict(data, op=command) for command, data in ACTIONS]})
+                                 for _ in range(args.actions // len(ACTIONS))]
+                    latencies = []
+                    start_barrier.wait()
+                    for command, data in steps:
+                        start = time.perf_counter()
+                        result = send(command, data)
+                        latencies.append(time.perf_counter() - start)
+                        assert result['success'], result
+                    return latencies
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(args.clients) as executor:
+                    latencies = [latency for phone_latencies in executor.map(play, phones)
+                                 for latency in phone_latencies]
+                elapsed = time.perf_counter() - start
+                actions = len(latencies) * (len(ACTIONS) if mode == 'batch_actions' else 1)
+                for phone in phones:
+                    phone.drain()
+
+                print(f"{mode:>14}: p50 {percentile(latencies, 0.5) * 1000:6.2f} ms, "
+                      f"p95 {percentile(latencies, 0.95) * 1000:6.2f} ms, "
+                      f"p99 {percentile(latencies, 0.99) * 1000:6.2f} ms, "
+                      f"media {statistics.mean(latencies) * 1000:6.2f} ms, "
+                      f"{actions / elapsed:5.0f} acciones/s")
+
+            for phone in phones:
+                phone.close()
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
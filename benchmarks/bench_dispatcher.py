@@ -0,0 +1,81 @@
+"""Mide los mensajes de Socket.IO enviados durante una ráfaga de clics con y sin agrupación.
+
+Varios jugadores por sala pulsan repetidamente perdición y reserva; para cada intervalo de
+agrupación se cuentan los eventos emitidos por los handlers, los mensajes enviados y las
+escrituras en sockets estimadas (un cliente por era y sala).
+
+Uso: python -m benchmarks.bench_dispatcher [--rooms 12] [--players 36] [--clicks 20]
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+import json
+import random
+import time
+
+import gevent
+from gevent.pool import Pool
+
+from app import create_app, dispatcher, socketio
+from app.models.game_data import GameData
+
+
+def run_burst(app, args, interval, rng):
+    """Ejecuta la ráfaga y devuelve (eventos, fusionados, mensajes, escrituras, bytes, segundos)"""
+    dispatcher.interval = interval
+    dispatcher.events_received = dispatcher.events_merged = dispatcher.frames_sent = 0
+    clients_per_room = len(GameData.eras)
+    writes = {"count": 0, "bytes": 0}
+
+    def count_emit(event, data=None, room=None):
+        recipients = clients_per_room if room else clients_per_room * args.rooms
+        writes["count"] += recipients
+        writes["bytes"] += recipients * len(json.dumps([event, data]))
+
+    socketio.emit = count_emit
+
+    def player(room_id):
+        client = app.test_client()
+        client.post('/', data={'admin_username': 'admin1', 'admin_password': 'clave1'})
+        era = rng.choice(GameData.eras)
+        for click in range(args.clicks):
+            # Sumar y restar alternativamente para no completar ciclos de perdición
+            amount = 1 if click % 2 == 0 else -1
+            if rng.random() < 0.5:
+                client.post(f"/update_perdicion/{room_id}/{era}", json={"amount": amount})
+            else:
+                client.post(f"/update_reserva/{room_id}/{era}", json={"amount": amount})
+            gevent.sleep(rng.uniform(0, args.think_ms / 1000.0))
+
+    start = time.perf_counter()
+    Pool(args.players).map(player, [rng.randint(1, args.rooms) for _ in range(args.players)])
+    dispatcher.flush()
+    elapsed = time.perf_counter() - start
+    stats = dispatcher.stats()
+    return (stats["events_received"], stats["events_merged"], stats["frames_sent"],
+            writes["count"], writes["bytes"], elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=12)
+    parser.add_argument('--players', type=int, default=36)
+    parser.add_argument('--clicks', type=int, default=20)
+    parser.add_argument('--think-ms', type=float, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['TESTING'] = True
+
+    print(f"{'intervalo':>10} {'eventos':>8} {'fusionados':>10} {'mensajes':>9} {'escrituras':>11} {'KiB':>8} {'s':>6}")
+    for interval_ms in (0, 20, 50):
+        events, merged, frames, writes, size, elapsed = run_burst(
+            app, args, interval_ms / 1000.0, random.Random(args.seed))
+        print(f"{interval_ms:>8}ms {events:>8} {merged:>10} {frames:>9} {writes:>11} {size / 1024:>8.0f} {elapsed:>6.2f}")
+
+
+if __name__ == '__main__':
+    main()
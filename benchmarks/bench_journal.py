@@ -0,0 +1,140 @@
+"""Mide el tiempo de arranque reproduciendo el diario de mutaciones de una noche completa y
+comprueba que un rearranque tras rotar a mitad de una mutación (entre el cambio en memoria y su
+registro) o de un lote (GameData.atomic) da el mismo estado.
+
+Uso: python -m benchmarks.bench_journal [--mutations N] [--rooms N]
+"""
+import argparse
+import contextvars
+import os
+import random
+import tempfile
+import time
+
+from app.models.game_data import GameData
+from app.models.journal import JournalStorage
+from app.models.storage import MemoryStorage
+from benchmarks.bench_storage import run_mutations
+
+
+def record_evening(directory, mutations, rooms, **options):
+    """Genera el diario de una noche de juego y devuelve el estado final esperado"""
+    GameData.configure_storage(JournalStorage(directory, **options))
+    GameData.reset_all_data()
+    rng = random.Random(42)
+    # Intercalar cambios de los contadores globales, como hacen los handlers de perdición y reserva
+    for _ in range(mutations // 100):
+        run_mutations(rng, 100, rooms)
+        global_counters = GameData.initialize_global_counters()
+        global_counters["perdicion"] += 1
+        GameData.save_global_counters(global_counters)
+    expected = current_state()
+    GameData.close_storage()
+    return expected
+
+
+def measure_startup(directory, expected, **options):
+    """Arranca desde el diario y comprueba que el estado reconstruido es el esperado"""
+    start = time.perf_counter()
+    GameData.configure_storage(JournalStorage(directory, **options))
+    elapsed = time.perf_counter() - start
+    assert current_state() == expected, "el estado reconstruido no coincide"
+    GameData.close_storage()
+    return elapsed
+
+
+def current_state():
+    return ({room_id: room.to_row() for room_id, room in GameData._rooms.items()},
+            dict(GameData._global_counters))
+
+
+def check_rotation_mid_mutation(directory):
+    """Otra escritura rota el diario entre el cambio en memoria de cada mutación y su registro,
+    así que la instantánea ya incluye la mutación y su registro queda detrás"""
+    storage = JournalStorage(directory)
+    GameData.configure_storage(storage)
+    GameData.reset_all_data()
+    record = GameData._record
+    segment_bytes = storage.segment_bytes
+
+    def interleaved(kind, *fields):
+        # Solo rota la otra escritura; el registro de la mutación queda en el segmento nuevo
+        GameData._record = record
+        storage.segment_bytes = 1
+        GameData.initialize_global_counters()["perdicion"] += 1
+        GameData.save_global_counters(GameData._global_counters)
+        storage.segment_bytes = segment_bytes
+        GameData._record = interleaved
+        record(kind, *fields)
+
+    GameData._record = interleaved
+    try:
+        GameData.add_column_value(1, "pasado", "reserva", 3)
+        GameData.add_resources(1, "presente", 2)
+        GameData.add_biff_defeat(1, "futuro", disable=True)
+        GameData.toggle_button(1, "pasado", 0)
+    finally:
+        GameData._record = record
+    expected = current_state()
+    GameData.close_storage()
+    measure_startup(directory, expected)
+
+
+def check_rotation_mid_batch(directory, rollback):
+    """Lote de GameData.atomic con rotación en cada escritura y otra escritura (en otro contexto,
+    como otro greenlet) a mitad del lote, que toma la instantánea con el lote a medias"""
+    options = dict(segment_bytes=1)
+    GameData.configure_storage(JournalStorage(directory, **options))
+    GameData.reset_all_data()
+    GameData.add_column_value(1, "pasado", "reserva", 4)
+    with GameData.global_lock(), GameData.room_lock(1), GameData.atomic(1) as undo:
+        GameData.add_column_value(1, "pasado", "reserva", 1)
+        GameData.add_column_value(1, "pasado", "reserva", 1)
+        contextvars.Context().run(GameData.add_column_value, 2, "pasado", "reserva", 5)
+        GameData.add_column_value(1, "pasado", "perdicion", 3)
+        global_counters = GameData.initialize_global_counters()
+        global_counters["reserva"] += 2
+        global_counters["perdicion"] += 3
+        GameData.save_global_counters(global_counters)
+        if rollback:
+            undo()
+    expected = current_state()
+    GameData.close_storage()
+    measure_startup(directory, expected, **options)
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mutations', type=int, default=100000)
+    parser.add_argument('--rooms', type=int, default=40)
+    args = parser.parse_args()
+
+    scenarios = [
+        ("solo diario (sin instantáneas)", dict(segment_bytes=1 << 40, snapshot_interval=1 << 30)),
+        ("instantánea + cola (64 KiB)", dict(segment_bytes=64 * 1024)),
+    ]
+    print(f"{args.mutations} mutaciones sobre {args.rooms} salas")
+    for name, options in scenarios:
+        with tempfile.TemporaryDirectory() as directory:
+            expected = record_evening(directory, args.mutations, args.rooms, **options)
+            size = directory_size(directory)
+            # La primera carga reproduce el diario; la segunda parte de la instantánea que deja
+            first = measure_startup(directory, expected, **options)
+            second = measure_startup(directory, expected, **options)
+            print(f"{name:<32} {size / 1024:8.1f} KiB en disco  arranque {first * 1000:7.1f} ms"
+                  f"  (rearranque {second * 1000:.1f} ms)")
+    with tempfile.TemporaryDirectory() as directory:
+        check_rotation_mid_mutation(directory)
+    for rollback in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            check_rotation_mid_batch(directory, rollback)
+    print("Rearranque tras rotar a mitad de una mutación y de un lote (confirmado y deshecho): estado coherente")
+    GameData.configure_storage(MemoryStorage())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Coste por evento de registrar con print()/traceback.print_exc() frente al registro en cola de
+app.logs bajo gevent (monkey patching, como el worker de gunicorn): tiempo en el greenlet que
+registra (lo que bloquea al handler), retraso máximo del hub visto por otro greenlet mientras se
+registra y se vacía la cola, y velocidad del hilo escritor.
+
+stdout es una tubería con búfer de línea (como PYTHONUNBUFFERED en Render: cada línea es una
+escritura) leída por un hilo del sistema operativo, que hace de recolector de logs: rápido, o
+lento (lee 4 KB cada 10 milisegundos), en cuyo caso la tubería se llena y print() espera al lector
+bloqueando todo el hub. Con el registro en cola el retraso que queda es el del GIL mientras el
+hilo escritor da formato a los registros (sys.getswitchinterval(), 5 ms por defecto).
+
+Uso: python -m benchmarks.bench_logging [--events 20000] [--sample-rate 100]
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+import contextlib
+import logging
+import os
+import time
+import traceback
+
+import gevent
+
+from app import threads
+from app.logs import Logs
+
+# Periodo del greenlet que mide el retraso del hub (segundos)
+TICK = 0.001
+
+
+def measure(function, events):
+    """Microsegundos por llamada y retraso máximo del hub (milisegundos). El greenlet que registra
+    cede el hub cada 100 eventos, como un handler que atiende peticiones, y al terminar espera
+    a que el escritor vacíe la cola"""
+    lateness = [0.0]
+    running = [True]
+
+    def ticker():
+        while running[0]:
+            start = time.perf_counter()
+            gevent.sleep(TICK)
+            lateness[0] = max(lateness[0], time.perf_counter() - start - TICK)
+
+    tick = gevent.spawn(ticker)
+    gevent.sleep(0)
+    elapsed = 0.0
+    for i in range(events):
+        start = time.perf_counter()
+        function()
+        elapsed += time.perf_counter() - start
+        if i % 100 == 99:
+            # Esperar a que el hub atienda los temporizadores (sleep(0) solo ejecuta callbacks)
+            gevent.idle()
+    while Logs.stats()["pending"]:
+        gevent.sleep(0.005)
+    running[0] = False
+    tick.join()
+    return elapsed / events * 1e6, lateness[0] * 1e3
+
+
+@contextlib.contextmanager
+def collector(delay):
+    """Tubería con un hilo lector que lee 4 KB cada delay segundos; devuelve el extremo de escritura"""
+    read_fd, write_fd = os.pipe()
+    stream = os.fdopen(write_fd, 'w', buffering=1)
+
+    def read():
+        while os.read(read_fd, 4096):
+            if delay:
+                threads.sleep(delay)
+
+    reader = threads.BackgroundThread(target=read, name="log-collector")
+    reader.start()
+    try:
+        yield stream
+    finally:
+        stream.close()
+        reader.join()
+        os.close(read_fd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--sample-rate', type=int, default=100)
+    args = parser.parse_args()
+
+    logger = logging.getLogger('app.controllers.room_controller')
+    room = 'room_7'
+
+    def print_error():
+        try:
+            int('x')
+        except ValueError as e:
+            print(f"Error al unir a sala: {str(e)}")
+            traceback.print_exc()
+
+    def log_error():
+        try:
+            int('x')
+        except ValueError as e:
+            logger.exception(f"Error al unir a sala: {str(e)}")
+
+    cases = [
+        ("print() por unión a sala", None, lambda: print(f"Cliente unido a sala: {room}"), args.events),
+        ("print() + traceback.print_exc()", None, print_error, args.events // 10),
+        ("debug con nivel INFO (descartado)", 'INFO',
+         lambda: Logs.debug_sampled(logger, 'join', "Cliente unido a sala", room=room), args.events),
+        (f"debug muestreado 1/{args.sample_rate}", 'DEBUG',
+         lambda: Logs.debug_sampled(logger, 'join', "Cliente unido a sala", room=room), args.events),
+        ("info encolado", 'INFO', lambda: logger.info("Cliente unido a sala", extra={"room": room}), args.events),
+        ("logger.exception encolado", 'INFO', log_error, args.events // 10),
+    ]
+
+    readers = (("lector rápido", 0), ("lector lento", 0.01))
+    results = {}
+    for reader_name, delay in readers:
+        for name, level, function, events in cases:
+            with collector(delay) as stream:
+                if level is None:
+                    with contextlib.redirect_stdout(stream), contextlib.redirect_stderr(stream):
+                        results[name, reader_name] = measure(function, events)
+                else:
+                    Logs.configure(level=level, sample_rate=args.sample_rate, queue_size=events + 1, stream=stream)
+                    results[name, reader_name] = measure(function, events)
+                    Logs.close(timeout=120)
+
+    # Velocidad del escritor: vaciar en este hilo una cola ya llena
+    records = threads.SimpleQueue()
+    for _ in range(args.events):
+        records.put(logger.makeRecord(logger.name, logging.INFO, __file__, 0, "Cliente unido a sala", (), None,
+                                      extra={"room": room}))
+    records.put(None)
+    with open(os.devnull, 'w') as devnull:
+        Logs._stream = devnull
+        start = time.perf_counter()
+        Logs._run_writer(records)
+        writer_rate = args.events / (time.perf_counter() - start)
+
+    print(f"{'':<42} {'µs por evento en el handler':>29} {'retraso máximo del hub (ms)':>29}")
+    print(f"{'':<42}" + f" {'lector rápido':>14} {'lector lento':>14}" * 2)
+    for name, _, _, _ in cases:
+        row = [results[name, reader_name] for reader_name, _ in readers]
+        print(f"{name:<42} {row[0][0]:>14.2f} {row[1][0]:>14.2f} {row[0][1]:>14.2f} {row[1][1]:>14.2f}")
+    print(f"Hilo escritor: {writer_rate:,.0f} líneas JSON/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Mide lo que añaden las métricas de Prometheus a cada petición y a cada mensaje de Socket.IO,
+sin servidor: los hooks before_request/after_request de Metrics dentro de un contexto de petición
+y el recuento de un mensaje (un evento suelto y un 'batch' de varios eventos, con los bytes medidos
+en uno de cada METRICS_BYTES_SAMPLE_RATE mensajes). También mide el tiempo de generar el texto de
+/admin/metrics.
+
+Uso: python -m benchmarks.bench_metrics [--number 200000] [--repeat 5]
+"""
+import argparse
+import time
+
+from flask import Response
+
+from app import create_app
+from app.metrics import Metrics
+
+
+def per_call(function, number, repeat):
+    """Nanosegundos por llamada (mínimo de repeat repeticiones de number llamadas)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter_ns() - start) / number)
+    return min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    response = Response()
+    with app.test_request_context('/update_reserva/1/pasado', method='POST'):
+        app.preprocess_request()
+
+        def hooks():
+            Metrics._start_request()
+            Metrics._end_request(response)
+
+        empty = per_call(lambda: None, args.number, args.repeat)
+        request_ns = per_call(hooks, args.number, args.repeat) - empty
+
+    single = {"room_id": 1, "era": "pasado", "columnTotal": 12, "globalTotal": 30}
+    batch = [['reserva_update', single], ['global_reserva_update', {"total": 30}],
+             ['button_update', {"room_id": 1, "changed": 5, "version": 12}]]
+    single_ns = per_call(lambda: Metrics.count_emit('reserva_update', single), args.number // 4, args.repeat) - empty
+    batch_ns = per_call(lambda: Metrics.count_emit('batch', batch), args.number // 4, args.repeat) - empty
+
+    with app.app_context():
+        render_ns = per_call(Metrics.render, 200, args.repeat)
+
+    print(f"Hooks de una petición HTTP:       {request_ns / 1000:7.2f} µs")
+    print(f"Mensaje con un evento:            {single_ns / 1000:7.2f} µs")
+    print(f"Mensaje 'batch' con {len(batch)} eventos:    {batch_ns / 1000:7.2f} µs")
+    print(f"Texto de /admin/metrics ({len(Metrics._requests)} rutas): {render_ns / 1000:7.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Mide la hoja de impresión de códigos QR (print_all_qr) sin caché y con la caché de QRRenderer,
+y compara el SVG de cada mesa con el PNG en base64 que antes se incrustaba en la hoja.
+
+Uso: python -m benchmarks.bench_qr [--tables 100] [--repeat 5]
+"""
+import argparse
+import base64
+import time
+
+from app import create_app
+from app.models.auth import Auth
+from app.qr_renderer import QRRenderer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tables', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    while len(Auth.get_all_mesa_codes()) < args.tables:
+        Auth.add_room()
+    mesa_codes = Auth.get_all_mesa_codes()
+    tables = len(mesa_codes)
+
+    client = app.test_client()
+    client.post('/', data={'admin_username': 'admin1', 'admin_password': 'clave1'})
+
+    def print_sheet():
+        """Hoja HTML más todas las imágenes que carga el navegador: (segundos, bytes)"""
+        start = time.perf_counter()
+        response = client.get('/admin/print_all_qr')
+        assert response.status_code == 200
+        size = len(response.data)
+        for mesa_code in mesa_codes:
+            image = client.get(f'/admin/qr/{mesa_code}.svg')
+            assert image.status_code == 200
+            size += len(image.data)
+        return time.perf_counter() - start, size
+
+    # Sin caché: cada impresión vuelve a generar todas las imágenes
+    cold = []
+    for _ in range(args.repeat):
+        QRRenderer.invalidate()
+        cold.append(print_sheet()[0])
+    warm = [print_sheet() for _ in range(args.repeat)]
+    sheet_bytes = warm[0][1]
+    warm = [seconds for seconds, _ in warm]
+
+    print(f"Hoja de {tables} mesas (HTML + SVG): {min(cold) * 1000:.1f} ms sin caché, "
+          f"{min(warm) * 1000:.1f} ms con caché, {sheet_bytes / 1024:.0f} KiB")
+
+    # Coste de generar cada formato y tamaño que ocupaba la imagen incrustada en la hoja
+    site_url = 'http://localhost'
+    cards = [(mesa_code, info['group'], info['era']) for mesa_code, info in mesa_codes.items()]
+    for fmt, render in (('PNG', QRRenderer.render_png), ('SVG', QRRenderer.render_svg)):
+        start = time.process_time()
+        images = [render(site_url, *card) for card in cards]
+        cpu = time.process_time() - start
+        size = sum(len(image) for image in images)
+        if fmt == 'PNG':
+            size = sum(len(base64.b64encode(image)) for image in images)
+        print(f"{fmt}: {cpu / tables * 1000:.2f} ms de CPU por mesa, "
+              f"{size / tables / 1024:.1f} KiB por mesa{' (base64)' if fmt == 'PNG' else ''}")
+
+    # Revalidación: el navegador ya tiene el SVG y recibe 304 sin cuerpo
+    mesa_code = next(iter(mesa_codes))
+    etag = client.get(f'/admin/qr/{mesa_code}.svg').headers['ETag']
+    revalidated = client.get(f'/admin/qr/{mesa_code}.svg', headers={'If-None-Match': etag})
+    print(f"Revalidación de un SVG: {revalidated.status_code}")
+
+    # Añadir un grupo solo invalida los QR cuyos códigos cambian (ninguno de los existentes)
+    Auth.add_room()
+    print(f"Tras añadir un grupo: {print_sheet()[0] * 1000:.1f} ms "
+          f"({QRRenderer.cache_info()['entries']} imágenes en caché)")
+
+
+if __name__ == '__main__':
+    main()
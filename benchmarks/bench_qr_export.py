@@ -0,0 +1,63 @@
+"""Mide la exportación masiva de QR (ZIP y PDF) para 12, 120 y 1200 códigos de mesa, generando
+en el propio proceso y en el pool de procesos: tiempo hasta el primer byte y tiempo total.
+
+Uso: python -m benchmarks.bench_qr_export [--counts 12 120 1200] [--workers N]
+"""
+import argparse
+import os
+import time
+
+from app import create_app
+from app.models.auth import Auth
+from app.qr_export import QRExport
+from app.qr_renderer import QRRenderer
+
+
+def measure(client, url):
+    """Devuelve (segundos hasta el primer fragmento, segundos totales, bytes)"""
+    start = time.perf_counter()
+    response = client.get(url, buffered=False)
+    first_chunk = None
+    size = 0
+    for chunk in response.response:
+        if chunk and first_chunk is None:
+            first_chunk = time.perf_counter() - start
+        size += len(chunk)
+    response.close()
+    return first_chunk, time.perf_counter() - start, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[12, 120, 1200])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    client = app.test_client()
+    client.post('/', data={'admin_username': 'admin1', 'admin_password': 'clave1'})
+
+    while len(Auth.get_all_mesa_codes()) < max(args.counts):
+        Auth.add_room()
+    all_codes = Auth.get_all_mesa_codes()
+
+    print(f"{'códigos':>8} {'formato':>7} {'modo':>14} {'1er byte':>10} {'total':>9} {'MiB':>6}")
+    for mode, workers in (('en proceso', 0), (f'pool ({args.workers})', args.workers)):
+        QRExport.configure(workers)
+        if workers:
+            # Arrancar el pool antes de medir (los procesos importan la aplicación al crearse)
+            list(QRExport._map(len, ['warmup'] * workers))
+        for count in args.counts:
+            Auth._mesa_access_codes = dict(list(all_codes.items())[:count])
+            for fmt in ('zip', 'pdf'):
+                QRRenderer.invalidate()
+                first_chunk, total, size = measure(client, f'/admin/export_qr/{fmt}')
+                print(f"{count:>8} {fmt:>7} {mode:>14} {first_chunk * 1000:>8.0f}ms {total:>8.2f}s "
+                      f"{size / 1024 / 1024:>6.1f}")
+    Auth._mesa_access_codes = all_codes
+    QRExport.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Mide una tormenta de reconexiones contra los endpoints de consulta (/state, get_column_totals,
+get_global_counters): respuestas generadas cada vez, cuerpo cacheado por versión y 304 con ETag.
+Se mide el tiempo dentro de las vistas (sin el coste del cliente de pruebas) y los bytes enviados.
+
+Uso: python -m benchmarks.bench_state_etag [--clients 36] [--rounds 20]
+"""
+import argparse
+import time
+
+from app import create_app
+from app.controllers import room_controller
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=36)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    client = app.test_client()
+    client.post('/', data={'admin_username': 'admin1', 'admin_password': 'clave1'})
+
+    urls = [f'/state/{room_id}/{era}' for room_id in (1, 2, 3, 4) for era in ('pasado', 'presente', 'futuro')]
+    urls += [f'/get_column_totals/{room_id}/pasado' for room_id in (1, 2, 3, 4)] + ['/get_global_counters']
+    etags = {url: client.get(url).headers['ETag'] for url in urls}
+
+    # Tiempo acumulado dentro de las vistas
+    view_time = [0.0]
+    for endpoint in ('game.get_state', 'game.get_column_totals', 'game.get_global_counters'):
+        view = app.view_functions[endpoint]
+
+        def timed(*view_args, view=view, **view_kwargs):
+            start = time.perf_counter()
+            try:
+                return view(*view_args, **view_kwargs)
+            finally:
+                view_time[0] += time.perf_counter() - start
+        app.view_functions[endpoint] = timed
+
+    def storm(mode):
+        requests = response_bytes = 0
+        view_time[0] = 0.0
+        for _ in range(args.rounds):
+            for _ in range(args.clients):
+                for url in urls:
+                    if mode == 'sin caché':
+                        # Como antes: el cuerpo se genera y serializa en cada petición
+                        room_controller._json_responses.clear()
+                    headers = {'If-None-Match': etags[url]} if mode == '304' else {}
+                    response = client.get(url, headers=headers)
+                    requests += 1
+                    response_bytes += len(response.data) + sum(len(k) + len(v) + 4 for k, v in response.headers)
+        return requests, view_time[0], response_bytes
+
+    print(f"{args.clients} clientes x {len(urls)} URL x {args.rounds} rondas")
+    for mode in ('sin caché', 'cuerpo cacheado', '304'):
+        requests, elapsed, response_bytes = storm(mode)
+        print(f"{mode:>16}: {elapsed / requests * 1e6:6.1f} µs en la vista por petición, "
+              f"{response_bytes / requests:4.0f} bytes de respuesta (cabeceras + cuerpo)")
+
+    # Un cambio en una sala (sin tocar los contadores globales) invalida solo sus respuestas
+    client.post('/toggle_button/1/pasado/0', headers={'X-Requested-With': 'XMLHttpRequest'})
+    statuses = {url: client.get(url, headers={'If-None-Match': etags[url]}).status_code for url in urls}
+    changed = sorted(url for url, status in statuses.items() if status == 200)
+    print(f"Tras marcar un anuncio en la sala 1: {len(changed)} de {len(urls)} respuestas cambian")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Simula que todos los móviles de una partida recargan la página de su era a la vez y cuenta
+las peticiones y los bytes de archivos estáticos, con las URL con huella (caché inmutable) y
+con las URL sin huella que se usaban antes (revalidación con ETag en cada recarga).
+
+Uso: python -m benchmarks.bench_static [--phones 36]
+"""
+import argparse
+import re
+from urllib.parse import urlsplit
+
+from app import create_app
+from app.models.auth import Auth
+
+TEMPLATE = re.compile(r'<template.*?</template>', re.S)
+PICTURE = re.compile(r'<picture>.*?</picture>', re.S)
+SRCSET = re.compile(r'srcset="([^"]+)"')
+STATIC_URL = re.compile(r"""(?:src="|href="|url\(')(/static/[^"']+)""")
+
+
+class BrowserCache:
+    """Caché HTTP mínima de un navegador: respuestas immutable sin petición, el resto revalidadas"""
+
+    def __init__(self, client):
+        self.client = client
+        self.entries = {}
+        self.requests = 0
+        self.bytes = 0
+
+    def fetch(self, url):
+        cached = self.entries.get(url)
+        if cached is not None and 'immutable' in cached.get('Cache-Control', ''):
+            return
+        headers = {'Accept-Encoding': 'gzip, br'}
+        if cached is not None:
+            headers['If-None-Match'] = cached['ETag']
+        response = self.client.get(url, headers=headers)
+        self.requests += 1
+        self.bytes += len(response.data)
+        if response.status_code == 200:
+            self.entries[url] = dict(response.headers)
+
+
+def static_urls(html, fingerprinted):
+    """Archivos estáticos que descarga el navegador al cargar la página: de cada <picture>, la
+    variante más grande del formato preferido (la de un móvil de alta densidad); del resto,
+    las imágenes, hojas de estilo, scripts y fuentes referenciadas directamente. El contenido de
+    <template> no se descarga hasta que se usa"""
+    html = TEMPLATE.sub('', html)
+    urls = set()
+    for picture in PICTURE.findall(html):
+        urls.add(SRCSET.search(picture).group(1).split(', ')[-1].split(' ')[0])
+    urls.update(STATIC_URL.findall(PICTURE.sub('', html)))
+    urls = {url.replace('&amp;', '&') for url in urls}
+    if not fingerprinted:
+        urls = {urlsplit(url).path for url in urls}
+    return sorted(urls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--phones', type=int, default=36)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    codes = list(Auth.get_all_mesa_codes())
+
+    for fingerprinted in (False, True):
+        phones = []
+        for i in range(args.phones):
+            client = app.test_client()
+            html = client.get(f'/?code={codes[i % len(codes)]}', follow_redirects=True).get_data(as_text=True)
+            phones.append((BrowserCache(client), static_urls(html, fingerprinted)))
+
+        # Primera carga y recarga simultánea (p. ej. tras server_reset)
+        results = []
+        for _ in ('carga', 'recarga'):
+            for cache, _ in phones:
+                cache.requests = cache.bytes = 0
+            for cache, urls in phones:
+                for url in urls:
+                    cache.fetch(url)
+            results.append((sum(cache.requests for cache, _ in phones), sum(cache.bytes for cache, _ in phones)))
+
+        label = 'con huella' if fingerprinted else 'sin huella'
+        (first_requests, first_bytes), (reload_requests, reload_bytes) = results
+        print(f"{label}: primera carga {first_requests} peticiones / {first_bytes / 1024:.0f} KiB, "
+              f"recarga de {args.phones} móviles {reload_requests} peticiones / {reload_bytes / 1024:.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
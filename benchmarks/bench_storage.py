@@ -0,0 +1,76 @@
+"""Mide el coste por mutación del almacenamiento en SQLite con escritura diferida frente a memoria.
+
+Uso: python -m benchmarks.bench_storage [--mutations N] [--rooms N]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.models.game_data import GameData
+from app.models.storage import MemoryStorage, SQLiteStorage
+
+
+class SynchronousSQLiteStorage(SQLiteStorage):
+    """Referencia: escribe cada mutación en disco dentro de la propia petición"""
+
+    def mark_room_dirty(self, room):
+        super().mark_room_dirty(room)
+        self.flush()
+
+
+def run_mutations(rng, mutations, rooms):
+    """Aplica una mezcla de mutaciones representativa de los handlers de room_controller"""
+    eras = GameData.eras
+    start = time.perf_counter()
+    for _ in range(mutations):
+        room_id = rng.randint(1, rooms)
+        era = rng.choice(eras)
+        kind = rng.random()
+        if kind < 0.4:
+            GameData.toggle_button(room_id, era, rng.randrange(len(GameData.button_info[era])))
+        elif kind < 0.8:
+            GameData.add_column_value(room_id, era, rng.choice(("perdicion", "reserva")), 1)
+        elif kind < 0.9:
+            GameData.set_column_value(room_id, era, "fluzo", rng.randint(0, 81))
+        else:
+            GameData.add_biff_defeat(room_id, era)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mutations', type=int, default=20000)
+    parser.add_argument('--rooms', type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        backends = [
+            ("memoria", lambda: MemoryStorage()),
+            ("sqlite diferido", lambda: SQLiteStorage(os.path.join(directory, "diferido.db"))),
+            ("sqlite síncrono", lambda: SynchronousSQLiteStorage(os.path.join(directory, "sincrono.db"))),
+        ]
+        baseline = None
+        print(f"{args.mutations} mutaciones sobre {args.rooms} salas")
+        for name, factory in backends:
+            GameData.configure_storage(factory())
+            GameData.reset_all_data()
+            elapsed = run_mutations(random.Random(42), args.mutations, args.rooms)
+            per_mutation = elapsed / args.mutations * 1e6
+            baseline = baseline or per_mutation
+            print(f"{name:<18} {per_mutation:8.2f} us/mutación  (+{per_mutation - baseline:.2f} us)")
+
+            # Comprobar que el estado persistido coincide con el estado en memoria
+            expected = {room_id: room.to_row() for room_id, room in GameData._rooms.items()}
+            GameData.close_storage()
+            if not isinstance(GameData._storage, MemoryStorage):
+                GameData.configure_storage(factory())
+                loaded = {room_id: room.to_row() for room_id, room in GameData._rooms.items()}
+                assert loaded == expected, f"{name}: el estado cargado no coincide"
+                GameData.close_storage()
+        GameData.configure_storage(MemoryStorage())
+
+
+if __name__ == '__main__':
+    main()
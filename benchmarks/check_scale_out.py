@@ -0,0 +1,155 @@
+"""Arranca gunicorn con varios workers sobre un mismo estado compartido y comprueba que las
+actualizaciones concurrentes no se pierden y que los eventos llegan a través del broker.
+
+Uso: python -m benchmarks.check_scale_out [--workers 4] [--clients 8] [--requests 50]
+"""
+import argparse
+import collections
+import http.cookiejar
+import json
+import os
+import pickle
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from app.broker import ROLE_SUBSCRIBER, recv_frame
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def open_session(base_url, code=None):
+    """Crea un cliente HTTP con cookies; con code entra como esa mesa"""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    if code:
+        opener.open(f"{base_url}/?code={code}").read()
+    return opener
+
+
+def post_json(opener, url, data):
+    request = urllib.request.Request(url, data=json.dumps(data).encode(), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    return json.loads(opener.open(request).read())
+
+
+def wait_for_server(base_url, process, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn ha terminado al arrancar")
+        try:
+            urllib.request.urlopen(base_url + '/').read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn no responde")
+
+
+def subscribe(broker_port, events, stop):
+    """Cuenta los eventos publicados en el broker por todos los workers"""
+    sock = socket.create_connection(('127.0.0.1', broker_port))
+    sock.sendall(ROLE_SUBSCRIBER)
+    sock.settimeout(0.5)
+    while not stop.is_set():
+        try:
+            message = pickle.loads(recv_frame(sock))
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+        if message.get('method') == 'emit':
+            events[message['event']] += 1
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    http_port, broker_port = free_port(), free_port()
+    base_url = f"http://127.0.0.1:{http_port}"
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ,
+                   WEB_CONCURRENCY=str(args.workers),
+                   STORAGE_BACKEND='shared',
+                   SQLITE_PATH=os.path.join(directory, 'shared.db'),
+                   SOCKETIO_MESSAGE_QUEUE=f'tcp://127.0.0.1:{broker_port}',
+                   # Sin agrupación, para contar en el broker cada evento emitido
+                   SOCKETIO_COALESCE_MS='0',
+                   SECRET_KEY='check-scale-out')
+        log_path = os.path.join(directory, 'access.log')
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{http_port}', '--access-logfile', log_path,
+             '--access-logformat', '%(p)s %(r)s', 'wsgi:app'],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        events = collections.Counter()
+        stop = threading.Event()
+        try:
+            wait_for_server(base_url, process)
+            listener = threading.Thread(target=subscribe, args=(broker_port, events, stop), daemon=True)
+            listener.start()
+            time.sleep(0.5)
+
+            # Actualizaciones concurrentes del mismo contador desde varios clientes
+            def client(_):
+                opener = open_session(base_url, 'mesa01')
+                for _ in range(args.requests):
+                    result = post_json(opener, f"{base_url}/update_reserva/1/pasado", {"amount": 1})
+                    assert result["success"], result
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.clients) as executor:
+                list(executor.map(client, range(args.clients)))
+            elapsed = time.perf_counter() - start
+            expected = args.clients * args.requests
+
+            # Todos los workers deben ver el mismo estado
+            opener = open_session(base_url, 'mesa01')
+            for _ in range(args.workers * 4):
+                totals = json.loads(opener.open(f"{base_url}/get_column_totals/1/pasado").read())
+                assert totals["columnTotals"]["reserva"] == expected, totals
+                assert totals["globalTotals"]["reserva"] == expected, totals
+
+            # Un grupo creado en un worker debe ser válido en todos
+            admin = open_session(base_url)
+            admin.open(base_url + '/', data=b'admin_username=admin1&admin_password=clave1').read()
+            admin.open(base_url + '/admin/add_room', data=b'').read()
+            for _ in range(args.workers * 4):
+                response = open_session(base_url).open(f"{base_url}/?code=mesa13")
+                assert response.geturl().endswith('/era/5/pasado'), response.geturl()
+
+            time.sleep(0.5)
+            assert events['reserva_update'] == expected, events
+        finally:
+            stop.set()
+            process.terminate()
+            process.wait(timeout=10)
+
+        with open(log_path) as f:
+            pids = collections.Counter(match.group(1) for match in re.finditer(
+                r'^<(\d+)> POST /update_reserva', f.read(), re.MULTILINE))
+
+    print(f"{expected} actualizaciones concurrentes en {elapsed:.2f} s "
+          f"({expected / elapsed:.0f} peticiones/s), repartidas entre {len(pids)} workers: "
+          f"{sorted(pids.values(), reverse=True)}")
+    print(f"Estado coherente en todos los workers; {events['reserva_update']} eventos reserva_update "
+          f"difundidos a través del broker")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""Prueba de carga de extremo a extremo: simula N grupos x 3 eras jugando a la vez contra un
+servidor local (gunicorn con gunicorn.conf.py y el worker de render.yaml, o run.py) y mide cuánto
+tarda cada acción, cuánto tarda en llegar su difusión a las demás mesas y cuánta CPU gasta el
+servidor por acción.
+
+Cada mesa entra con /?code=mesaNN como un móvil, abre su conexión Socket.IO, se une a room_{id}
+y repite una mezcla de acciones con pausas aleatorias: marcar y desmarcar anuncios disponibles,
+sumar perdición (cruzando los ciclos; cuando se completan todos, el administrador los reinicia
+con /admin/reset_perdicion_cycle), comprobar el fluzo, derrotar a Biff y sumar reserva. Con
+--transport socket las acciones que tienen evento de Socket.IO se envían con ack.
+
+La difusión se mide con la reserva, que solo crece: para cada suma, el tiempo desde que la mesa
+envía la petición hasta que cada una de las otras mesas de la sala recibe un reserva_update con
+un total igual o mayor (los eventos de estado se agrupan, así que un total intermedio puede no
+llegar nunca, pero sí uno posterior).
+
+Uso: python -m benchmarks.load_test [--groups 4] [--duration 30] [--think 2.0]
+         [--transport http|socket] [--server gunicorn|run] [--url http://127.0.0.1:5000 --pid PID]
+"""
+import argparse
+import bisect
+import collections
+import http.client
+import itertools
+import json
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import simple_websocket
+
+from benchmarks.check_scale_out import ROOT, free_port, open_session, wait_for_server
+
+# Mezcla de acciones de cada mesa: (acción, peso)
+ACTION_MIX = [
+    ('toggle_button', 35),
+    ('update_reserva', 20),
+    ('update_perdicion', 20),
+    ('check_fluzo_value', 15),
+    ('biff_defeat', 10),
+]
+# Acciones con evento de Socket.IO equivalente (ver SOCKET_COMMANDS en room_controller)
+SOCKET_ACTIONS = ('update_reserva', 'update_perdicion', 'check_fluzo_value', 'biff_defeat')
+# Puerto fijo de run.py (socketio.run sin port)
+RUN_PY_PORT = 5000
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def process_tree_cpu(pid):
+    """Segundos de CPU (usuario + sistema) de un proceso y todos sus descendientes (Linux, /proc)"""
+    ticks = os.sysconf('SC_CLK_TCK')
+    stats = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat_file:
+                # El nombre del proceso va entre paréntesis y puede contener espacios
+                fields = stat_file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        stats[int(entry)] = (int(fields[1]), (int(fields[11]) + int(fields[12])) / ticks)
+
+    tree, pending = set(), [pid]
+    while pending:
+        current = pending.pop()
+        tree.add(current)
+        pending.extend(child for child, (parent, _) in stats.items() if parent == current and child not in tree)
+    return sum(stats[p][1] for p in tree if p in stats)
+
+
+class Admin:
+    """Sesión de administrador: crea los grupos que faltan y reinicia los ciclos de perdición"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = open_session(base_url)
+        self.opener.open(base_url + '/', data=b'admin_username=admin1&admin_password=clave1').read()
+        self.lock = threading.Lock()
+        self.cycle_resets = 0
+
+    def ensure_groups(self, groups):
+        html = self.opener.open(self.base_url + '/admin/admin_panel').read().decode()
+        existing = len(set(re.findall(r'mesa(\d+)', html))) // 3
+        for _ in range(groups - existing):
+            self.opener.open(self.base_url + '/admin/add_room', data=b'').read()
+
+    def reset_perdicion_cycle(self):
+        with self.lock:
+            self.opener.open(self.base_url + '/admin/reset_perdicion_cycle', data=b'').read()
+            self.cycle_resets += 1
+
+    def dispatcher_stats(self):
+        return json.loads(self.opener.open(self.base_url + '/admin/dispatcher_stats').read())["stats"]
+
+
+class Table:
+    """Móvil de una mesa: sesión HTTP keep-alive, conexión Socket.IO y estado de sus botones"""
+
+    def __init__(self, host, port, code):
+        self.http = http.client.HTTPConnection(host, port)
+        self.http.request('GET', f'/?code={code}')
+        response = self.http.getresponse()
+        response.read()
+        self.cookie = response.getheader('Set-Cookie').split(';')[0]
+        room_id, self.era = response.getheader('Location').rstrip('/').split('/')[-2:]
+        self.room_id = int(room_id)
+
+        state = self.request('GET', f'/state/{self.room_id}/{self.era}')
+        self.button_version = state['button_state']['version']
+        self.button_available = state['button_state']['available']
+        self.button_offset = state['button_offset']
+        self.button_count = state['button_count']
+        self.buttons_stale = False
+
+        # Llegadas de reserva_update por era: [(instante, total)]
+        self.reserva_arrivals = collections.defaultdict(list)
+        self.frames = 0
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.acks = {}
+        self.ack_ids = itertools.count(1)
+
+        self.ws = simple_websocket.Client(f'ws://{host}:{port}/socket.io/?EIO=4&transport=websocket',
+                                          headers={'Cookie': self.cookie})
+        assert self.ws.receive().startswith('0')  # open de Engine.IO
+        self.ws.send('40')
+        while not self.ws.receive().startswith('40'):  # connect de Socket.IO
+            pass
+        self.receiver = threading.Thread(target=self._receive_loop, daemon=True)
+        self.receiver.start()
+        self.send_event('join', {'room': f'room_{self.room_id}'})
+
+    def request(self, method, path, data=None, headers=None):
+        headers = dict(headers or {}, Cookie=self.cookie)
+        body = None
+        if data is not None:
+            body = json.dumps(data)
+            headers['Content-Type'] = 'application/json'
+        self.http.request(method, path, body=body, headers=headers)
+        response = self.http.getresponse()
+        payload = response.read()
+        if response.status != 200:
+            return {"success": False, "error": f"HTTP {response.status}"}
+        return json.loads(payload)
+
+    def send_event(self, event, data, ack=False, timeout=30):
+        """Emite un evento de Socket.IO; con ack espera y devuelve la respuesta"""
+        ack_id = ''
+        if ack:
+            ack_id = next(self.ack_ids)
+            waiter = self.acks[ack_id] = [threading.Event(), None]
+        with self.send_lock:
+            self.ws.send(f'42{ack_id}' + json.dumps([event, data]))
+        if not ack:
+            return None
+        if not waiter[0].wait(timeout):
+            self.acks.pop(ack_id, None)
+            return {"success": False, "error": "sin ack"}
+        return self.acks.pop(ack_id)[1]
+
+    def _receive_loop(self):
+        while True:
+            try:
+                message = self.ws.receive()
+            except simple_websocket.ConnectionClosed:
+                return
+            now = time.perf_counter()
+            if message == '2':
+                with self.send_lock:
+                    self.ws.send('3')
+            elif message.startswith('43'):
+                ack_id, payload = re.match(r'43(\d+)(.*)', message, re.S).groups()
+                waiter = self.acks.get(int(ack_id))
+                if waiter is not None:
+                    waiter[1] = json.loads(payload)[0]
+                    waiter[0].set()
+            elif message.startswith('42'):
+                self.frames += 1
+                event, *args = json.loads(message[2:])
+                data = args[0] if args else None
+                for name, payload in (data if event == 'batch' else [[event, data]]):
+                    self._on_event(now, name, payload)
+
+    def _on_event(self, now, event, data):
+        if not isinstance(data, dict) or data.get('room_id', self.room_id) != self.room_id:
+            return
+        if event == 'reserva_update':
+            self.reserva_arrivals[data['era']].append((now, data['columnTotal']))
+        elif event == 'button_update':
+            # Igual que era.js: aplicar el delta si parte de la versión local, si no pedir el estado
+            with self.lock:
+                if data['base'] == self.button_version:
+                    self.button_version ^= data['changed']
+                    self.button_available ^= data['flips']
+                else:
+                    self.buttons_stale = True
+
+    def pick_button(self):
+        """Índice de un anuncio a marcar (disponible) o, a veces, a desmarcar; None si no hay"""
+        if self.buttons_stale:
+            snapshot = self.send_event('button_sync', {'room_id': self.room_id}, ack=True)
+            with self.lock:
+                if snapshot.get('success'):
+                    self.button_version, self.button_available = snapshot['version'], snapshot['available']
+                    self.buttons_stale = False
+        with self.lock:
+            version, available = self.button_version, self.button_available
+        bits = [(idx, self.button_offset + idx) for idx in range(self.button_count)]
+        active = [idx for idx, bit in bits if version >> bit & 1]
+        candidates = [idx for idx, bit in bits if available >> bit & 1 and not version >> bit & 1]
+        if active and (not candidates or random.random() < 0.15):
+            return random.choice(active)
+        return random.choice(candidates) if candidates else None
+
+    def close(self):
+        self.ws.close()
+        self.http.close()
+
+
+def play(table, admin, args, deadline, log):
+    """Bucle de una mesa hasta el final de la prueba; anota (acción, inicio, duración, éxito, datos)"""
+    actions, weights = zip(*ACTION_MIX)
+    rng = random.Random()
+    time.sleep(rng.uniform(0, args.think))
+    while time.perf_counter() < deadline:
+        action = rng.choices(actions, weights)[0]
+        data, path = None, f'/{action}/{table.room_id}/{table.era}'
+        if action == 'toggle_button':
+            button_idx = table.pick_button()
+            if button_idx is None:
+                action, path = 'update_reserva', f'/update_reserva/{table.room_id}/{table.era}'
+            else:
+                path = f'/toggle_button/{table.room_id}/{table.era}/{button_idx}'
+        if action == 'update_reserva':
+            data = {'amount': 1}
+        elif action == 'update_perdicion':
+            data = {'amount': rng.choice([1, 1, 2, 3])}
+        elif action == 'check_fluzo_value':
+            value = rng.randint(70, 90)
+            data = {'total_value': value, 'checked_value': value}
+        elif action == 'biff_defeat':
+            data = {}
+
+        start = time.perf_counter()
+        if args.transport == 'socket' and action in SOCKET_ACTIONS:
+            result = table.send_event(action, dict(data, room_id=table.room_id, era=table.era), ack=True)
+        elif action == 'toggle_button':
+            result = table.request('POST', path, headers={'X-Requested-With': 'XMLHttpRequest'})
+        else:
+            result = table.request('POST', path, data)
+        elapsed = time.perf_counter() - start
+
+        success = bool(result.get('success'))
+        if action == 'update_perdicion' and not success and 'ciclos' in result.get('error', ''):
+            # Los tres ciclos se han completado: el administrador empieza de nuevo
+            admin.reset_perdicion_cycle()
+            success = True
+        log.append((action, start, elapsed, success, table, result))
+        if args.think > 0:
+            time.sleep(rng.expovariate(1 / args.think))
+
+
+def fanout_delays(tables, log):
+    """Retardo de difusión de cada suma de reserva a cada una de las otras mesas de la sala.
+    Devuelve (retardos, entregas que no han llegado)"""
+    by_room = collections.defaultdict(list)
+    for table in tables:
+        by_room[table.room_id].append(table)
+    delays, missing = [], 0
+    for action, start, _, success, actor, result in log:
+        if action != 'update_reserva' or not success:
+            continue
+        for table in by_room[actor.room_id]:
+            if table is actor:
+                continue
+            arrivals = table.reserva_arrivals[actor.era]
+            totals = [total for _, total in arrivals]
+            # Los totales de reserva solo crecen: primera llegada con un total igual o mayor
+            index = bisect.bisect_left(totals, result['columnTotal'])
+            if index == len(arrivals):
+                missing += 1
+            else:
+                delays.append(max(0.0, arrivals[index][0] - start))
+    return delays, missing
+
+
+def start_server(args, directory):
+    """Arranca el servidor indicado; devuelve (proceso, host, puerto)"""
+    env = dict(os.environ, SECRET_KEY='load-test', SQLITE_PATH=os.path.join(directory, 'state.db'))
+    if args.server == 'run':
+        command, port = [sys.executable, 'run.py'], RUN_PY_PORT
+    else:
+        # gunicorn.conf.py con el worker de websockets del startCommand de render.yaml
+        port = free_port()
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                   '-k', 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker',
+                   '-b', f'127.0.0.1:{port}', 'wsgi:app']
+    # En su propio grupo de procesos para terminar también los workers y el proceso del recargador de run.py
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    return process, '127.0.0.1', port
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--groups', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30, help="segundos de juego")
+    parser.add_argument('--think', type=float, default=2.0, help="pausa media entre acciones de una mesa (s)")
+    parser.add_argument('--transport', choices=('http', 'socket'), default='http')
+    parser.add_argument('--server', choices=('gunicorn', 'run'), default='gunicorn')
+    parser.add_argument('--url', help="servidor ya arrancado (no se arranca ninguno)")
+    parser.add_argument('--pid', type=int, help="pid del servidor ya arrancado, para medir su CPU")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = None
+        if args.url:
+            parts = urllib.parse.urlsplit(args.url)
+            host, port, server_pid = parts.hostname, parts.port or 80, args.pid
+        else:
+            process, host, port = start_server(args, directory)
+            server_pid = process.pid
+        base_url = f'http://{host}:{port}'
+        try:
+            if process is not None:
+                wait_for_server(base_url, process)
+            admin = Admin(base_url)
+            admin.ensure_groups(args.groups)
+            codes = [f'mesa{number:02d}' for number in range(1, args.groups * 3 + 1)]
+            with ThreadPoolExecutor(32) as executor:
+                tables = list(executor.map(lambda code: Table(host, port, code), codes))
+
+            log = []
+            cpu_start = process_tree_cpu(server_pid) if server_pid else None
+            start = time.perf_counter()
+            deadline = start + args.duration
+            threads = [threading.Thread(target=play, args=(table, admin, args, deadline, log)) for table in tables]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            cpu = process_tree_cpu(server_pid) - cpu_start if server_pid else None
+            # Margen para que lleguen las últimas difusiones
+            time.sleep(0.5)
+            stats = admin.dispatcher_stats()
+            for table in tables:
+                table.close()
+        finally:
+            if process is not None:
+                os.killpg(process.pid, signal.SIGTERM)
+                process.wait(timeout=10)
+
+    server = args.url or ('gunicorn (gunicorn.conf.py, worker geventwebsocket)' if args.server == 'gunicorn' else 'run.py')
+    print(f"Servidor: {server}; {args.groups} grupos x 3 eras = {len(tables)} mesas, "
+          f"{elapsed:.0f} s, pausa media {args.think} s, transporte {args.transport}")
+    print(f"{'acción':<18} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errores':>8}")
+    by_action = collections.defaultdict(list)
+    for action, _, duration, success, _, _ in log:
+        by_action[action].append((duration, success))
+    for action in [name for name, _ in ACTION_MIX] + ['total']:
+        entries = [entry for entries in by_action.values() for entry in entries] if action == 'total' else by_action[action]
+        durations = [duration for duration, _ in entries]
+        print(f"{action:<18} {len(entries):>6} {percentile(durations, 0.5) * 1000:>8.1f} "
+              f"{percentile(durations, 0.95) * 1000:>8.1f} {percentile(durations, 0.99) * 1000:>8.1f} "
+              f"{sum(1 for _, success in entries if not success):>8}")
+
+    delays, missing = fanout_delays(tables, log)
+    print(f"Difusión de reserva_update a las otras mesas de la sala ({len(delays)} entregas): "
+          f"p50 {percentile(delays, 0.5) * 1000:.1f} ms, p95 {percentile(delays, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(delays, 0.99) * 1000:.1f} ms, máx {max(delays, default=0) * 1000:.1f} ms, "
+          f"{missing} sin llegar")
+    if cpu is not None:
+        print(f"CPU del servidor: {cpu / max(1, len(log)) * 1000:.2f} ms por acción "
+              f"({cpu / elapsed:.0%} de un núcleo, {len(log) / elapsed:.1f} acciones/s)")
+    frames = sum(table.frames for table in tables)
+    print(f"Mensajes Socket.IO recibidos: {frames / len(tables) / elapsed:.1f} por mesa y segundo; "
+          f"ciclos de perdición reiniciados: {admin.cycle_resets}")
+    print(f"Dispatcher: {stats['events_received']} eventos, {stats['events_merged']} fusionados, "
+          f"{stats['frames_sent']} mensajes enviados")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Micro-benchmarks de las funciones de GameData y room_controller que se ejecutan en cada acción,
+sin servidor, con 4, 40 y 400 salas.
+
+Para cada función y número de salas se mide el tiempo por llamada (mínimo y mediana de varias
+repeticiones) y las asignaciones de memoria por llamada: bloques que quedan vivos (neto, con el
+recolector de ciclos parado) y pico de memoria durante una llamada según tracemalloc.
+
+Los resultados se guardan en JSON (--output) junto con el commit, y --compare compara con un
+JSON anterior para ver regresiones entre commits:
+
+    python -m benchmarks.micro --output antes.json
+    (cambios)
+    python -m benchmarks.micro --compare antes.json
+
+Uso: python -m benchmarks.micro [--rooms 4 40 400] [--repeat 5] [--min-time 0.05] [--output F]
+         [--compare F] [--threshold 0.10] [--only NOMBRE]
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from app.controllers import room_controller
+from app.models.game_data import GameData
+from app.models.storage import MemoryStorage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_rooms(rooms, rng):
+    """Estado de partida con el número de salas indicado: anuncios marcados y contadores al azar"""
+    GameData.configure_storage(MemoryStorage())
+    GameData.reset_all_data()
+    for room_id in range(1, rooms + 1):
+        GameData.initialize_room_data(room_id)
+        for era in GameData.eras:
+            # Marcar anuncios disponibles (las dependencias se respetan)
+            for _ in range(rng.randint(0, 8)):
+                GameData.toggle_button(room_id, era, rng.randrange(len(GameData.button_info[era])))
+            GameData.set_column_value(room_id, era, "fluzo", rng.randint(60, 95))
+            GameData.set_column_value(room_id, era, "perdicion", rng.randint(0, 20))
+            GameData.set_column_value(room_id, era, "reserva", rng.randint(0, 20))
+    global_counters = GameData.initialize_global_counters()
+    global_counters["perdicion"] = rng.randint(0, 59)
+    GameData.save_global_counters(global_counters)
+
+
+def widest_deactivation():
+    """(progreso, nodo) cuya desactivación arrastra más botones: todos marcados y el nodo con más
+    dependientes"""
+    full = (1 << sum(len(GameData.button_info[era]) for era in GameData.eras)) - 1
+    node = max(range(full.bit_length()), key=lambda n: bin(full ^ GameData.deactivate_button(full, n)).count('1'))
+    return full, node
+
+
+def cases(rooms):
+    """Funciones a medir: [(nombre, llamada sin argumentos)] sobre un estado de rooms salas"""
+    room_id = rooms // 2 + 1
+    progress = GameData.initialize_room_data(room_id).progress
+    full, node = widest_deactivation()
+    return [
+        ('GameData.initialize_room_data', lambda: GameData.initialize_room_data(room_id)),
+        ('GameData.initialize_room_column_totals', lambda: GameData.initialize_room_column_totals(room_id)),
+        ('GameData.initialize_global_counters', GameData.initialize_global_counters),
+        ('GameData.reset_perdicion_all_rooms', GameData.reset_perdicion_all_rooms),
+        ('check_victory_conditions', room_controller.check_victory_conditions),
+        ('get_available_buttons', lambda: room_controller.get_available_buttons(progress)),
+        ('deactivate_dependent_buttons', lambda: room_controller.deactivate_dependent_buttons(full, node)),
+        ('adjust_all_fluzo_values_internal', room_controller.adjust_all_fluzo_values_internal),
+    ]
+
+
+def time_call(function, repeat, min_time):
+    """Nanosegundos por llamada (mínimo y mediana de repeat repeticiones) y llamadas por repetición"""
+    function()
+    number = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter_ns() - start) / number)
+    return min(samples), statistics.median(samples), number
+
+
+def allocations(function, calls=200):
+    """Bloques de memoria que quedan vivos por llamada y pico de memoria de una llamada (bytes)"""
+    gc.collect()
+    gc.disable()
+    try:
+        before = sys.getallocatedblocks()
+        for _ in range(calls):
+            function()
+        blocks = (sys.getallocatedblocks() - before) / calls
+
+        tracemalloc.start()
+        try:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        gc.enable()
+    return blocks, peak - current
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, nargs='+', default=[4, 40, 400])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05, help="segundos mínimos por repetición")
+    parser.add_argument('--output', help="archivo JSON donde guardar los resultados")
+    parser.add_argument('--compare', help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument('--threshold', type=float, default=0.10, help="empeoramiento que se marca como regresión")
+    parser.add_argument('--only', help="medir solo las funciones cuyo nombre contenga este texto")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'función':<40} {'salas':>5} {'min ns':>11} {'mediana ns':>11} {'bloques':>8} {'pico B':>8}")
+    for rooms in args.rooms:
+        rng = random.Random(rooms)
+        build_rooms(rooms, rng)
+        for name, function in cases(rooms):
+            if args.only and args.only not in name:
+                continue
+            best, median, number = time_call(function, args.repeat, args.min_time)
+            blocks, peak = allocations(function)
+            results.append({"function": name, "rooms": rooms, "ns_min": round(best, 1), "ns_median": round(median, 1),
+                            "calls_per_repeat": number, "alloc_blocks": round(blocks, 2), "alloc_peak_bytes": peak})
+            print(f"{name:<40} {rooms:>5} {best:>11.0f} {median:>11.0f} {blocks:>8.2f} {peak:>8}")
+
+    report = {
+        "commit": current_commit(),
+        "date": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=1)
+        print(f"Resultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as compare_file:
+            baseline = json.load(compare_file)
+        previous = {(entry["function"], entry["rooms"]): entry for entry in baseline["results"]}
+        regressions = 0
+        print(f"\nComparación con {baseline.get('commit') or args.compare} (tiempo mínimo):")
+        for entry in results:
+            old = previous.get((entry["function"], entry["rooms"]))
+            if old is None:
+                continue
+            change = entry["ns_min"] / old["ns_min"] - 1
+            flag = ''
+            if change > args.threshold:
+                flag = '  << regresión'
+                regressions += 1
+            print(f"{entry['function']:<40} {entry['rooms']:>5} {old['ns_min']:>11.0f} -> {entry['ns_min']:>9.0f} "
+                  f"{change:>+7.1%}  bloques {old['alloc_blocks']:.2f} -> {entry['alloc_blocks']:.2f}{flag}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
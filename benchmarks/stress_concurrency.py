@@ -0,0 +1,124 @@
+"""Prueba de estrés de concurrencia: miles de greenlets modifican a la vez los contadores de
+varias salas y se comprueba que el estado global sigue siendo coherente.
+
+Para forzar intercalados que en producción dependen de la latencia (almacenamiento, emits,
+workers con hilos), se añade un punto de cesión (gevent.sleep(0)) en cada emit y antes de cada
+mutación de GameData. Sin los locks por sala y global se pierden actualizaciones y la
+perdición global deja de coincidir con la suma de las salas.
+
+Uso: python -m benchmarks.stress_concurrency [--rooms 12] [--greenlets 2000] [--seed 1]
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+import collections
+import random
+import time
+
+import gevent
+from gevent.pool import Pool
+
+from app import create_app, dispatcher
+from app.models.game_data import GameData
+
+YIELDING_METHODS = ("initialize_global_counters", "initialize_room_data", "add_column_value",
+                    "set_column_value", "save_global_counters", "reset_perdicion_all_rooms")
+
+
+def add_yield_points(events):
+    """Cede el control antes de cada mutación y en cada emit, contando los eventos emitidos"""
+    for name in YIELDING_METHODS:
+        original = getattr(GameData, name)
+
+        def yielding(*args, _original=original, **kwargs):
+            gevent.sleep(0)
+            return _original(*args, **kwargs)
+
+        setattr(GameData, name, yielding)
+
+    original_emit = dispatcher.emit
+
+    def emit(event, *args, **kwargs):
+        events[event] += 1
+        gevent.sleep(0)
+        return original_emit(event, *args, **kwargs)
+
+    dispatcher.emit = emit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=12)
+    parser.add_argument('--greenlets', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    events = collections.Counter()
+    add_yield_points(events)
+
+    rng = random.Random(args.seed)
+    requests = []
+    for _ in range(args.greenlets):
+        room_id = rng.randint(1, args.rooms)
+        era = rng.choice(GameData.eras)
+        kind = rng.random()
+        if kind < 0.6:
+            requests.append(('reserva', f"/update_reserva/{room_id}/{era}", rng.randint(1, 3)))
+        elif kind < 0.92:
+            requests.append(('reserva', f"/update_column_resource/{room_id}/{era}/reserva", rng.randint(1, 3)))
+        elif kind < 0.96:
+            requests.append(('perdicion', f"/update_perdicion/{room_id}/{era}", 1))
+        else:
+            requests.append(('perdicion', f"/update_column_resource/{room_id}/{era}/perdicion", 1))
+
+    results = collections.Counter()
+
+    def worker(request):
+        kind, url, amount = request
+        client = app.test_client()
+        client.post('/', data={'admin_username': 'admin1', 'admin_password': 'clave1'})
+        response = client.post(url, json={"amount": amount}).get_json()
+        if response["success"]:
+            results[kind] += amount
+        else:
+            results['rejected'] += 1
+
+    start = time.perf_counter()
+    Pool(args.concurrency).map(worker, requests)
+    elapsed = time.perf_counter() - start
+
+    global_counters = GameData.initialize_global_counters()
+    rooms = list(GameData.all_rooms())
+    room_reserva = sum(room.get_counter(era, "reserva") for room in rooms for era in GameData.eras)
+    room_perdicion = sum(room.get_counter(era, "perdicion") for room in rooms for era in GameData.eras)
+    cycles_completed = global_counters["perdicion_cycle"] - 1
+
+    errors = []
+    if global_counters["reserva"] != room_reserva:
+        errors.append(f"reserva global {global_counters['reserva']} != suma de las salas {room_reserva}")
+    if global_counters["reserva"] != results['reserva']:
+        errors.append(f"reserva global {global_counters['reserva']} != reserva añadida {results['reserva']}")
+    if global_counters["perdicion"] != room_perdicion:
+        errors.append(f"perdición global {global_counters['perdicion']} != suma de las salas {room_perdicion}")
+    if not 0 <= global_counters["perdicion"] < 60:
+        errors.append(f"perdición global fuera de rango: {global_counters['perdicion']}")
+    if events['perdicion_cycle_completed'] != cycles_completed:
+        errors.append(f"{events['perdicion_cycle_completed']} eventos perdicion_cycle_completed para "
+                      f"{cycles_completed} ciclos completados")
+
+    print(f"{len(requests)} peticiones concurrentes sobre {args.rooms} salas en {elapsed:.2f} s "
+          f"({results['rejected']} rechazadas tras el último ciclo)")
+    print(f"reserva {global_counters['reserva']}, perdición {global_counters['perdicion']}, "
+          f"ciclo {global_counters['perdicion_cycle']}")
+    if errors:
+        raise SystemExit("Estado incoherente:\n  " + "\n  ".join(errors))
+    print("Estado coherente")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,12 @@
 # gunicorn.conf.py
+import os
 
 # Tipo de worker
 # ¡Esta es la configuración clave!
 worker_class = 'gevent'
 
-# Número de workers (empezamos con 1, luego puedes aumentar)
-workers = 1
+# Número de workers (1 por defecto; con más de uno hace falta el modo de escalado, ver on_starting)
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
 
 # Dirección y puerto en los que Gunicorn escucha
 # Render normalmente expone en el puerto 10000 internamente
@@ -22,4 +23,36 @@ timeout = 30
 # errorlog = '-'  # '-' significa stderr
 
 # (Opcional) Recargar workers si el código cambia (útil en desarrollo, NO recomendado en producción)
-# reload = False
\ No newline at end of file
+# reload = False
+
+# Escribir el estado pendiente en el almacenamiento antes de que termine cada worker
+def worker_exit(server, worker):
+    from app.models.game_data import GameData
+    GameData.close_storage()
+
+
+# Comprobar la configuración de escalado antes de arrancar los workers
+def on_starting(server):
+    if server.cfg.workers <= 1:
+        return
+    
+    # Cada worker tiene su propia memoria: el estado, los eventos y las sesiones deben compartirse
+    errors = []
+    if os.environ.get('STORAGE_BACKEND') != 'shared':
+        errors.append("STORAGE_BACKEND=shared (estado compartido entre workers)")
+    if not os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+        errors.append("SOCKETIO_MESSAGE_QUEUE (difusión de eventos entre workers)")
+    if not os.environ.get('SECRET_KEY'):
+        errors.append("SECRET_KEY (las cookies de sesión deben ser válidas en todos los workers)")
+    if os.environ.get('SOCKETIO_WEBSOCKET_ONLY', 'true').lower() not in ('1', 'true'):
+        errors.append("SOCKETIO_WEBSOCKET_ONLY=true (sin sesiones persistentes el polling falla entre workers)")
+    if errors:
+        raise RuntimeError(f"Con {server.cfg.workers} workers hace falta configurar: " + "; ".join(errors))
+    
+    # Con una URL tcp:// el proceso maestro arranca el broker local para todos los workers
+    message_queue = os.environ['SOCKETIO_MESSAGE_QUEUE']
+    if message_queue.startswith('tcp://'):
+        from app.broker import LocalBroker, parse_url
+        host, port = parse_url(message_queue)
+        LocalBroker(host, port).start_in_thread()
+        server.log.info(f"Broker local de Socket.IO escuchando en {host}:{port}")